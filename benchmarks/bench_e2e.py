@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the search API against a local fake Solr.
+
+    python benchmarks/bench_e2e.py --workers 5 --concurrency 20 --duration 30 --latency-ms 15
+    python benchmarks/bench_e2e.py --access-log access.log --pin-cpu
+    python benchmarks/bench_e2e.py --inprocess --duration 10
+
+By default the app runs under gunicorn with uvicorn workers, as in the Dockerfile,
+against benchmarks/fake_solr.py (or --solr-url). The harness drives /items,
+PUT /item and DELETE /item at the given concurrency and reports throughput,
+p50/p95/p99 latency per route and the RSS of every gunicorn process. --pin-cpu
+restricts the app to one CPU, like the docker-compose limits.
+
+--inprocess calls the ASGI app directly in this process instead. That mode also
+reports the peak memory allocated per request, measured with tracemalloc.
+
+--access-log replays the request lines of a gunicorn access log as the query mix
+instead of the synthetic one.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LOG_REQUEST = re.compile(r'"(GET|PUT|DELETE|POST) (\S+) HTTP/[0-9.]+"')
+
+KEYWORDS = ["*", "*", "*", "flowers", "orchids", "barnacles", "hooker", "pigeons", "york", "beagle", "variation"]
+DOCUMENT_TYPES = ["letter", "bibliography", "people", "repository"]
+DECADES = [f"{y}s" for y in range(1820, 1890, 10)]
+SORTS = ["", "date", "author", "name"]
+
+Request = Tuple[str, str, Optional[bytes]]
+
+
+def synthetic_requests(count: int, mix: Dict[str, float], unique: bool, seed: int = 1882) -> List[Request]:
+    rng = random.Random(seed)
+    routes, weights = zip(*mix.items())
+    requests = []
+    for n in range(count):
+        route = rng.choices(routes, weights)[0]
+        file_id = f"BENCH-{rng.randint(1, 200)}"
+        if route == "put":
+            doc = {"fileID": file_id, "id": file_id, "facet-document-type": "letter", "title": f"Benchmark {n}"}
+            requests.append(("PUT", "/item", json.dumps(doc).encode()))
+        elif route == "delete":
+            requests.append(("DELETE", f"/item/{file_id}", None))
+        else:
+            params = {"keyword": rng.choice(KEYWORDS)}
+            if rng.random() < 0.5:
+                params["f1-document-type"] = rng.choice(DOCUMENT_TYPES)
+            if rng.random() < 0.3:
+                params["f1-date"] = rng.choice(DECADES)
+            if rng.random() < 0.3:
+                params["sort"] = rng.choice(SORTS)
+            if rng.random() < 0.2:
+                params["page"] = str(rng.randint(2, 20))
+            if unique:
+                params["keyword"] += f" n{n}"
+            requests.append(("GET", "/items?" + str(httpx.QueryParams(params)), None))
+    return requests
+
+
+def access_log_requests(path: str) -> List[Request]:
+    requests = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = LOG_REQUEST.search(line)
+            if not match:
+                continue
+            method, target = match.groups()
+            if method == "PUT" and target.startswith("/item"):
+                file_id = f"REPLAY-{len(requests)}"
+                doc = {"fileID": file_id, "id": file_id, "facet-document-type": "letter"}
+                requests.append((method, target, json.dumps(doc).encode()))
+            elif method in ("GET", "DELETE"):
+                requests.append((method, target, None))
+    if not requests:
+        sys.exit(f"No request lines found in {path}")
+    return requests
+
+
+def route_name(method: str, target: str) -> str:
+    path = target.split("?", 1)[0]
+    if method == "DELETE" and path.startswith("/item/"):
+        path = "/item/{file_id}"
+    return f"{method} {path}"
+
+
+async def drive(client: httpx.AsyncClient, requests: List[Request], concurrency: int, duration: float,
+                max_requests: Optional[int] = None) -> Tuple[List[Tuple[str, int, float]], float]:
+    records: List[Tuple[str, int, float]] = []
+    source = itertools.cycle(requests)
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def worker():
+        while time.perf_counter() < deadline and (max_requests is None or len(records) < max_requests):
+            method, target, body = next(source)
+            t0 = time.perf_counter()
+            try:
+                response = await client.request(method, target, content=body,
+                                                headers={"Content-Type": "application/json"} if body else None)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            records.append((route_name(method, target), status, time.perf_counter() - t0))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records, time.perf_counter() - started
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def report(records: List[Tuple[str, int, float]], elapsed: float) -> None:
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    for route, status, latency in records:
+        by_route[route].append(latency)
+        if status == 0 or status >= 500:
+            errors[route] += 1
+    print(f"\n{len(records):,} requests in {elapsed:.1f}s = {len(records) / elapsed:,.1f} req/s")
+    print(f"{'route':<28}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route in sorted(by_route):
+        latencies = by_route[route]
+        print(f"{route:<28}{len(latencies):>8}{len(latencies) / elapsed:>10.1f}"
+              f"{percentile(latencies, 50) * 1000:>10.2f}{percentile(latencies, 95) * 1000:>10.2f}"
+              f"{percentile(latencies, 99) * 1000:>10.2f}{errors[route]:>8}")
+
+
+def rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(parent: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == parent:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def report_rss(master: int) -> None:
+    workers = child_pids(master)
+    print(f"\nRSS: master {rss_kb(master) / 1024:.1f} MiB")
+    for pid in workers:
+        print(f"     worker {pid}: {rss_kb(pid) / 1024:.1f} MiB")
+    total = rss_kb(master) + sum(rss_kb(pid) for pid in workers)
+    print(f"     total {total / 1024:.1f} MiB across {len(workers)} workers (RSS counts shared pages per process)")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start_fake_solr(args) -> Tuple[subprocess.Popen, int]:
+    port = free_port()
+    cmd = [sys.executable, os.path.join(ROOT, "benchmarks", "fake_solr.py"), "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--docs", str(args.docs), "--text-bytes", str(args.text_bytes)]
+    if args.search_response:
+        cmd += ["--search-response", args.search_response]
+    process = subprocess.Popen(cmd)
+    wait_for_port(port)
+    return process, port
+
+
+def app_env(args, solr_host: str, solr_port: str) -> Dict[str, str]:
+    env = {**os.environ, "SOLR_HOST": solr_host, "SOLR_PORT": solr_port}
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+async def run_gunicorn(args, requests: List[Request], env: Dict[str, str]) -> None:
+    port = free_port()
+    cmd = ["gunicorn", "-b", f"127.0.0.1:{port}", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+           *args.gunicorn_arg, "frontend.main:app"]
+    preexec = (lambda: os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})) if args.pin_cpu else None
+    process = subprocess.Popen(cmd, cwd=ROOT, env={**env, "API_PORT": str(port)}, preexec_fn=preexec)
+    try:
+        wait_for_port(port)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await drive(client, requests[: args.concurrency * 4], args.concurrency, min(args.warmup, args.duration))
+            records, elapsed = await drive(client, requests, args.concurrency, args.duration)
+        report(records, elapsed)
+        report_rss(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+async def run_inprocess(args, requests: List[Request], env: Dict[str, str]) -> None:
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    from frontend.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            await drive(client, requests[: args.concurrency * 4], args.concurrency, min(args.warmup, args.duration))
+            records, elapsed = await drive(client, requests, args.concurrency, args.duration)
+            report(records, elapsed)
+
+            # Peak allocation per request, one request at a time so peaks do not overlap.
+            allocations = defaultdict(list)
+            tracemalloc.start()
+            for method, target, body in requests[: args.alloc_samples]:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                await client.request(method, target, content=body)
+                _, peak = tracemalloc.get_traced_memory()
+                allocations[route_name(method, target)].append(peak - before)
+            tracemalloc.stop()
+    print("\nPeak allocation per request (tracemalloc):")
+    for route, sizes in sorted(allocations.items()):
+        print(f"  {route:<26} mean {statistics.mean(sizes) / 1024:8.1f} KiB   p95 {percentile(sizes, 95) / 1024:8.1f} KiB")
+    print(f"\nRSS of this process: {rss_kb(os.getpid()) / 1024:.1f} MiB")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("items", "put", "delete"):
+            raise argparse.ArgumentTypeError(f"Unknown route '{name}' in --mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=5, help="gunicorn workers (NUM_WORKERS)")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of unmeasured load first")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("items=90,put=8,delete=2"),
+                        help="route weights for the synthetic mix, e.g. items=90,put=8,delete=2")
+    parser.add_argument("--unique", action="store_true", help="make every synthetic search distinct (defeats caches)")
+    parser.add_argument("--access-log", help="replay request lines from a gunicorn access log")
+    parser.add_argument("--solr-url", help="use this Solr (e.g. http://localhost:8983) instead of starting a fake one")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="fake Solr latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="fake Solr latency jitter")
+    parser.add_argument("--docs", type=int, default=20, help="documents per fake result page")
+    parser.add_argument("--text-bytes", type=int, default=4000, help="transcription size per fake document")
+    parser.add_argument("--search-response", help="captured Solr response for the fake Solr to replay")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. RESULT_CACHE_ENTRIES=0")
+    parser.add_argument("--gunicorn-arg", action="append", default=[], help="extra gunicorn argument")
+    parser.add_argument("--pin-cpu", action="store_true", help="run gunicorn on a single CPU")
+    parser.add_argument("--inprocess", action="store_true", help="call the ASGI app in-process (adds allocation stats)")
+    parser.add_argument("--alloc-samples", type=int, default=200, help="requests sampled for allocation stats")
+    args = parser.parse_args()
+
+    requests = access_log_requests(args.access_log) if args.access_log \
+        else synthetic_requests(20000, args.mix, args.unique)
+
+    solr = None
+    if args.solr_url:
+        url = httpx.URL(args.solr_url)
+        env = app_env(args, url.host, str(url.port or 8983))
+    else:
+        solr, solr_port = start_fake_solr(args)
+        env = app_env(args, "127.0.0.1", str(solr_port))
+    try:
+        runner = run_inprocess if args.inprocess else run_gunicorn
+        asyncio.run(runner(args, requests, env))
+    finally:
+        if solr:
+            solr.terminate()
+            solr.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
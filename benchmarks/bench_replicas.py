@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Exercise Solr replica routing and failover against several local fake Solrs.
+
+    python benchmarks/bench_replicas.py --replicas 3 --latency-ms 5,10,40 --duration 15
+
+Starts one fake Solr per replica (each with its own latency), points the app at
+them with SOLR_URLS and drives /items in-process with uncached searches. The run
+has three phases of equal length. First all replicas are up. Then the first
+replica is killed. Then it is restarted on the same port. For each phase the script
+reports throughput, latency, failed requests and how the searches were spread
+over the replicas. No request should fail, the slow replica should get the least
+traffic, and the restarted replica should be re-admitted.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_e2e import ROOT, drive, free_port, percentile, wait_for_port  # noqa: E402
+
+
+def start_fake_solr(port: int, latency_ms: float) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "fake_solr.py"),
+                                "--port", str(port), "--latency-ms", str(latency_ms), "--jitter-ms", "2"])
+    wait_for_port(port)
+    return process
+
+
+def node_requests(router) -> Dict[str, int]:
+    return {node.url: node.requests for node in router.read_nodes}
+
+
+async def run(args, urls: List[str], processes: List[subprocess.Popen], ports: List[int], latencies: List[float]):
+    sys.path.insert(0, ROOT)
+    from frontend.main import app
+    from frontend.lib.routing import router
+
+    rng = random.Random(1859)
+    requests = [("GET", f"/items?keyword=bench{rng.randint(0, 10**9)}", None) for _ in range(50000)]
+    phase = args.duration / 3
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            for name in ("all replicas up", f"{urls[0]} killed", f"{urls[0]} restarted"):
+                if name.endswith("killed"):
+                    processes[0].kill()
+                    processes[0].wait()
+                elif name.endswith("restarted"):
+                    processes[0] = start_fake_solr(ports[0], latencies[0])
+                before = node_requests(router)
+                records, elapsed = await drive(client, requests, args.concurrency, phase)
+                after = node_requests(router)
+
+                latencies_ms = [seconds * 1000 for _, _, seconds in records]
+                failed = sum(1 for _, status, _ in records if status != 200)
+                print(f"\n{name}: {len(records) / elapsed:,.0f} req/s, p50 {percentile(latencies_ms, 50):.1f} ms, "
+                      f"p99 {percentile(latencies_ms, 99):.1f} ms, {failed} failed")
+                total = sum(after[url] - before[url] for url in urls) or 1
+                for node in router.read_nodes:
+                    share = (after[node.url] - before[node.url]) / total
+                    print(f"  {node.url:<28} {share:6.1%} of Solr calls   state {node.state:<9} "
+                          f"ejections {node.ejections}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--latency-ms", default="5,10,40", help="comma-separated latency per replica")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds for all three phases")
+    args = parser.parse_args()
+
+    latencies = [float(x) for x in args.latency_ms.split(",")]
+    latencies = (latencies * args.replicas)[: args.replicas]
+    ports = [free_port() for _ in range(args.replicas)]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    processes = [start_fake_solr(port, latency) for port, latency in zip(ports, latencies)]
+
+    os.environ.update({
+        "SOLR_URLS": ",".join(urls),
+        "RESULT_CACHE_ENTRIES": "0",
+        "SOLR_HEALTH_INTERVAL": os.getenv("SOLR_HEALTH_INTERVAL", "0.5"),
+        "SOLR_EJECT_SECONDS": os.getenv("SOLR_EJECT_SECONDS", "1"),
+    })
+    os.environ.pop("SOLR_HOST", None)
+    os.environ.pop("SOLR_PORT", None)
+    try:
+        asyncio.run(run(args, urls, processes, ports, latencies))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of turning a Solr search body into the /items response.
+
+    python benchmarks/bench_response.py [--docs 20 --text-bytes 4000] [--search-response captured.json]
+
+Compares, for the same body:
+  parse + re-encode   json.loads, update_solr_response, then FastAPI's default
+                      jsonable_encoder + JSONResponse (the path before passthrough)
+  orjson fallback     the same with orjson, used when a body cannot be patched
+  passthrough         Solr's bytes with only the responseHeader rewritten
+
+each with no changes to the body and with the sort and cursor rewrites applied.
+Reports response bytes per second and CPU time per response (process time, so
+it is not skewed by other load on the machine).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SOLR_HOST", "localhost")
+os.environ.setdefault("SOLR_PORT", "8983")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from fake_solr import synthetic_search_response  # noqa: E402
+from frontend.lib import responses, utils  # noqa: E402
+from frontend.lib.translation import encode_cursor  # noqa: E402
+
+CASES = {
+    "unchanged": {},
+    "sort + cursor": {"original_sort": "date", "cursorMark": "*"},
+}
+
+
+def parse_and_reencode(body: bytes, kwargs: dict) -> bytes:
+    result = utils.update_solr_response(json.loads(body), kwargs)
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def orjson_fallback(body: bytes, kwargs: dict) -> bytes:
+    return responses.FastJSONResponse(utils.update_solr_response(responses.loads(body), kwargs)).body
+
+
+def passthrough(body: bytes, kwargs: dict) -> bytes:
+    return responses.passthrough_response(
+        body,
+        original_sort=kwargs.get("original_sort"),
+        next_cursor=encode_cursor if "cursorMark" in kwargs else None,
+    ).body
+
+
+def measure(fn, body: bytes, kwargs: dict, seconds: float):
+    count, out_bytes = 0, 0
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    while time.perf_counter() - start_wall < seconds:
+        out_bytes += len(fn(body, kwargs))
+        count += 1
+    cpu = time.process_time() - start_cpu
+    return out_bytes / cpu, cpu / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="documents in the synthetic result page")
+    parser.add_argument("--text-bytes", type=int, default=4000, help="transcription size per document")
+    parser.add_argument("--search-response", help="captured Solr search response to use instead")
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+    args = parser.parse_args()
+
+    if args.search_response:
+        with open(args.search_response, "rb") as f:
+            body = f.read()
+    else:
+        response = synthetic_search_response(args.docs, args.text_bytes)
+        response["nextCursorMark"] = "AoE/RENQLUxFVFQtMTk="
+        body = json.dumps(response, indent=2).encode("utf-8")
+
+    paths = [("parse + re-encode", parse_and_reencode)]
+    if responses.orjson:
+        paths.append(("orjson fallback", orjson_fallback))
+    else:
+        print("orjson is not installed; skipping the orjson fallback")
+    paths.append(("passthrough", passthrough))
+
+    print(f"Solr body: {len(body):,} bytes\n")
+    for case, kwargs in CASES.items():
+        expected = utils.update_solr_response(json.loads(body), kwargs)
+        label = f"[{case}]"
+        baseline = None
+        for name, fn in paths:
+            if json.loads(fn(body, kwargs)) != expected:
+                sys.exit(f"{name} ({case}) does not match update_solr_response")
+            throughput, cpu = measure(fn, body, kwargs, args.seconds)
+            baseline = baseline or cpu
+            print(f"{label:<16} {name:<18} {throughput / 1e6:9.1f} MB/s   {cpu * 1e6:9.1f} µs CPU/response"
+                  f"   {baseline / cpu:6.1f}x")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Measure how long the app takes to start and how much memory its workers use.
+
+    python benchmarks/bench_startup.py --workers 5
+    python benchmarks/bench_startup.py --pin-cpu --top 25
+
+First, an import-time profile of 'import frontend.main' (python -X importtime) shows
+which packages and which of our own modules startup time goes to. Then gunicorn is
+started as in the Dockerfile (picking up gunicorn.conf.py), against
+benchmarks/fake_solr.py, once with PRELOAD=false and once with PRELOAD=true. For each,
+the script reports the time to the first /items response and until every worker has
+finished its startup. It then reports RSS, PSS and private memory per process, after
+each worker has served some searches. PSS divides shared pages between the processes
+that share them, so the PSS total is what the workers really cost together.
+"""
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_e2e import ROOT, child_pids, free_port, start_fake_solr, wait_for_port  # noqa: E402
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+STARTUP_COMPLETE = "Application startup complete"
+
+
+def import_profile(env: Dict[str, str], top: int) -> None:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import frontend.main"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    packages: Dict[str, int] = defaultdict(int)
+    own: List[Tuple[int, int, str]] = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = int(match[1]), int(match[2]), match[4]
+        packages[name.split(".")[0]] += self_us
+        if name.startswith("frontend"):
+            own.append((self_us, cumulative_us, name))
+    total = sum(packages.values())
+    print(f"import frontend.main: {total / 1000:.0f} ms\n\nBy package (self time):")
+    for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:<28} {us / 1000:8.1f} ms  {us / total:6.1%}")
+    print("\nOur modules (self / cumulative):")
+    for self_us, cumulative_us, name in sorted(own, reverse=True)[:top]:
+        print(f"  {name:<40} {self_us / 1000:8.1f} ms {cumulative_us / 1000:8.1f} ms")
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    values = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in values:
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def report_memory(master: int) -> None:
+    print(f"  {'process':<16} {'RSS':>9} {'PSS':>9} {'private':>9}")
+    totals = defaultdict(int)
+    for label, pid in [("master", master)] + [(f"worker {pid}", pid) for pid in child_pids(master)]:
+        memory = memory_kb(pid)
+        private = memory["Private_Clean"] + memory["Private_Dirty"]
+        print(f"  {label:<16} {memory['Rss'] / 1024:7.1f}Mi {memory['Pss'] / 1024:7.1f}Mi {private / 1024:7.1f}Mi")
+        totals["Rss"] += memory["Rss"]
+        totals["Pss"] += memory["Pss"]
+    print(f"  {'total':<16} {totals['Rss'] / 1024:7.1f}Mi {totals['Pss'] / 1024:7.1f}Mi")
+
+
+def run_gunicorn(args, env: Dict[str, str], preload: bool) -> None:
+    port = free_port()
+    cmd = ["gunicorn", "-b", f"127.0.0.1:{port}", "-w", str(args.workers), "-k", "uvicorn.workers.UvicornWorker",
+           "frontend.main:app"]
+    preexec = (lambda: os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})) if args.pin_cpu else None
+    started = time.monotonic()
+    process = subprocess.Popen(cmd, cwd=ROOT, env={**env, "PRELOAD": str(preload).lower()},
+                               stderr=subprocess.PIPE, text=True, preexec_fn=preexec)
+    ready: List[float] = []
+    all_ready = threading.Event()
+
+    def watch_log() -> None:
+        for line in process.stderr:
+            if STARTUP_COMPLETE in line:
+                ready.append(time.monotonic() - started)
+                if len(ready) == args.workers:
+                    all_ready.set()
+
+    threading.Thread(target=watch_log, daemon=True).start()
+    try:
+        first = None
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while first is None and time.monotonic() - started < 60:
+                try:
+                    if client.get("/items", params={"keyword": "startup"}).status_code == 200:
+                        first = time.monotonic() - started
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            all_ready.wait(60)
+            # Let every worker serve some searches before measuring its memory.
+            for n in range(args.workers * 40):
+                client.get("/items", params={"keyword": f"startup{n % 50}"}, headers={"Connection": "close"})
+        print(f"\nPRELOAD={str(preload).lower()}: first response after {first:.2f}s, "
+              f"all {len(ready)} workers ready after {max(ready, default=float('nan')):.2f}s")
+        report_memory(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=5, help="gunicorn workers (NUM_WORKERS)")
+    parser.add_argument("--top", type=int, default=15, help="packages and modules listed in the import profile")
+    parser.add_argument("--pin-cpu", action="store_true", help="run gunicorn on a single CPU")
+    args = parser.parse_args()
+    args.latency_ms, args.jitter_ms, args.docs, args.text_bytes, args.search_response = 5, 0, 20, 4000, None
+
+    solr, solr_port = start_fake_solr(args)
+    env = {**os.environ, "SOLR_HOST": "127.0.0.1", "SOLR_PORT": str(solr_port), "WARM_FILE": ""}
+    try:
+        import_profile(env, args.top)
+        for preload in (False, True):
+            run_gunicorn(args, env, preload)
+    finally:
+        solr.terminate()
+        solr.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measure the autocomplete index behind GET /items/suggest/{name}.
+
+    python benchmarks/bench_suggest.py [--terms 20000] [--lookups 20000]
+
+Builds a PrefixIndex from synthetic "Surname, Forenames" names with Zipf-like
+counts. Reports load time and approximate memory, then the time per lookup for
+prefixes of one to six characters and per incremental add/remove. The budget to
+check against: five workers in the 512M container, each holding four such indexes.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SOLR_HOST", "localhost")
+os.environ.setdefault("SOLR_PORT", "8983")
+
+from frontend.lib.suggest import PrefixIndex, fold  # noqa: E402
+
+SYLLABLES = "dar win hoo ker gray hux ley wal lace ly ell lub bock fitz roy hen slow mul ler ben tham".split()
+
+
+def synthetic_names(count: int, rng: random.Random):
+    names = set()
+    while len(names) < count:
+        surname = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        forenames = " ".join(f"{rng.choice(SYLLABLES)[0].upper()}." for _ in range(rng.randint(1, 3)))
+        names.add(f"{surname}, {forenames}")
+    return [(name, max(1, int(10000 / (rank + 1)))) for rank, name in enumerate(sorted(names))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(1882)
+    pairs = synthetic_names(args.terms, rng)
+    index = PrefixIndex()
+    started = time.perf_counter()
+    index.load(pairs)
+    print(f"load {len(index):,} terms: {time.perf_counter() - started:.2f}s, ~{index.memory() / 2**20:.1f} MiB")
+
+    # The first lookup of a prefix scans its range; repeats are served from the cache.
+    for length in range(1, 7):
+        prefixes = [fold(rng.choice(pairs)[0][:length]) for _ in range(args.lookups)]
+        distinct = list(dict.fromkeys(prefixes))
+        started = time.perf_counter()
+        for prefix in distinct:
+            index.search(prefix, 10)
+        first = (time.perf_counter() - started) / len(distinct) * 1e6
+        started = time.perf_counter()
+        for prefix in prefixes:
+            index.search(prefix, 10)
+        repeat = (time.perf_counter() - started) / len(prefixes) * 1e6
+        print(f"prefix length {length}: first lookup {first:8.1f} us, repeat {repeat:5.1f} us "
+              f"({len(distinct):,} distinct prefixes)")
+
+    timings = []
+    for n in range(1000):
+        term = f"Newname{n}, X."
+        started = time.perf_counter()
+        index.add(term, 1)
+        index.add(term, -1)
+        timings.append(time.perf_counter() - started)
+    print(f"add + remove: {statistics.median(timings) * 1e6:.1f} us (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Check query translation against the golden corpus and measure its throughput.
+
+    python benchmarks/bench_translation.py [--seconds 2]
+
+translation_corpus.json holds the validator input FastAPI builds for each query
+string and the Solr parameters the translation must produce. Every case is checked
+(including the order of the Solr parameters) before anything is timed; the script
+exits non-zero on a mismatch.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SOLR_HOST", "localhost")
+os.environ.setdefault("SOLR_PORT", "8983")
+
+from frontend.custom.models.items import ItemsQueryParams  # noqa: E402
+from frontend.models.base_query_params import CoreQueryParams  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translation_corpus.json")
+MODELS = {"items": ItemsQueryParams, "core": CoreQueryParams}
+
+
+def check(corpus: dict) -> int:
+    failures = 0
+    for name, cases in corpus.items():
+        model = MODELS[name]
+        for case in cases:
+            actual = model.model_validate(case["input"]).get_solr_params()
+            expected = case["expected"]
+            if actual != expected or list(actual) != list(expected):
+                failures += 1
+                print(f"MISMATCH [{name}] {case['query']}\n  expected {expected}\n  actual   {actual}")
+    return failures
+
+
+def rate(fn, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn()
+        count += 100
+    return count / seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+    args = parser.parse_args()
+
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    failures = check(corpus)
+    total = sum(len(cases) for cases in corpus.values())
+    print(f"golden corpus: {total - failures}/{total} cases match")
+    if failures:
+        sys.exit(1)
+
+    for name, cases in corpus.items():
+        model = MODELS[name]
+        inputs = [case["input"] for case in cases]
+        validated = [model.model_validate(i) for i in inputs]
+
+        def translate():
+            for params in validated:
+                params.get_solr_params()
+
+        def validate_and_translate():
+            for i in inputs:
+                model.model_validate(i).get_solr_params()
+
+        per_pass = len(inputs)
+        print(f"[{name}] translate:            {rate(translate, args.seconds) * per_pass:12,.0f} translations/s")
+        print(f"[{name}] validate + translate: {rate(validate_and_translate, args.seconds) * per_pass:12,.0f} translations/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Check that the embedded browse index (frontend/lib/browse.py) answers browse searches
+as Solr does, and compare their speed.
+
+    SOLR_HOST=localhost SOLR_PORT=8983 python benchmarks/browse_parity.py [--queries 300]
+
+Loads the index from Solr as a worker does with BROWSE_INDEX=true. Then it sends
+random filter-only /items searches to both the index and Solr, through
+ItemsQueryParams as the route does. The searches combine document type, decade or
+date, repository and author filters with each sort, the first few pages, all facets
+or a selection, and the default, "ids" or "list" fields. numFound, the facet counts,
+the documents in order and Solr's other sections (such as highlighting) must be the
+same. Run it against a copy of the production index: the index assumes that
+config.facet_query lists the /spell handler's default facets, with facet.mincount
+1, and this is where that shows. Exits with status 1 on any mismatch.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SOLR_HOST", "localhost")
+os.environ.setdefault("SOLR_PORT", "8983")
+
+from frontend.lib import utils  # noqa: E402  (before browse, which utils imports)
+from frontend.lib.browse import BrowseIndex, MetadataIndex  # noqa: E402
+from frontend.lib.responses import loads  # noqa: E402
+from frontend.custom.models.items import ItemsQueryParams  # noqa: E402
+from frontend.defaults import BROWSE_FACETS, BROWSE_FIELDS, BROWSE_SORT_FIELDS, EXPORT_BATCH_SIZE  # noqa: E402
+
+SORTS = ["date", "author", "addressee", "correspondent", "name"]
+FACET_SELECTIONS = ["all", "all", "none", "document-type,date", "author,repository"]
+FILTERS = {
+    "f1-document-type": ("facet-document-type", 0.6),
+    "f1-repository": ("facet-repository", 0.2),
+    "f1-author": ("facet-author", 0.2),
+}
+
+
+def random_value(index: MetadataIndex, field: str, rng: random.Random) -> Optional[str]:
+    # A value of a random document, so common values come up more often.
+    column = index.columns[field]
+    for _ in range(20):
+        doc = rng.randrange(len(index.documents))
+        terms = column.ords[column.offsets[doc]:column.offsets[doc + 1]]
+        if terms:
+            return column.terms[rng.choice(terms)]
+    return None
+
+
+def random_search(index: MetadataIndex, rng: random.Random) -> Dict[str, str]:
+    query = {"keyword": "*", "sort": rng.choice(SORTS), "page": str(rng.choice([1, 1, 1, 2, 3, 10]))}
+    for name, (field, share) in FILTERS.items():
+        if rng.random() < share:
+            value = random_value(index, field, rng)
+            if value is not None:
+                query[name] = value
+    if rng.random() < 0.4:
+        level = rng.choice(["facet-decade", "facet-decade-year", "facet-decade-year-month"])
+        value = random_value(index, level, rng)
+        if value is not None:
+            query["f1-date" if level != "facet-decade" else "f1-decade"] = value
+    facets = rng.choice(FACET_SELECTIONS)
+    if facets != "all":
+        query["facets"] = facets
+    fields = rng.choice([None, None, "ids", "list"])
+    if fields:
+        query["fields"] = fields
+    return query
+
+
+def compare(ours: dict, solr: dict) -> List[str]:
+    problems = []
+    if ours["response"]["numFound"] != solr["response"]["numFound"]:
+        problems.append(f"numFound {ours['response']['numFound']} != {solr['response']['numFound']}")
+    our_facets = ours.get("facet_counts", {}).get("facet_fields", {})
+    solr_facets = solr.get("facet_counts", {}).get("facet_fields", {})
+    for field in sorted(set(our_facets) | set(solr_facets)):
+        if our_facets.get(field) != solr_facets.get(field):
+            problems.append(f"facet {field}: {our_facets.get(field)} != {solr_facets.get(field)}")
+    our_docs, solr_docs = ours["response"]["docs"], solr["response"]["docs"]
+    if [doc.get("id") for doc in our_docs] != [doc.get("id") for doc in solr_docs]:
+        problems.append(f"order {[doc.get('id') for doc in our_docs]} != {[doc.get('id') for doc in solr_docs]}")
+    else:
+        problems += [f"document {theirs.get('id')}: {mine} != {theirs}"
+                     for mine, theirs in zip(our_docs, solr_docs) if mine != theirs]
+    for name in sorted((set(ours) | set(solr)) - {"responseHeader", "response", "facet_counts"}):
+        if ours.get(name) != solr.get(name):
+            problems.append(f"{name}: {ours.get(name)} != {solr.get(name)}")
+    return problems
+
+
+async def run(args) -> int:
+    await utils.start_clients()
+    try:
+        browse = BrowseIndex("items", True, BROWSE_FIELDS, BROWSE_SORT_FIELDS, BROWSE_FACETS, EXPORT_BATCH_SIZE)
+        browse._fetch = utils.fetch_search
+        await browse.load()
+        index = browse.index
+        print(f"loaded {len(index):,} documents in {browse.load_seconds}s, ~{index.memory() / 2**20:.1f} MiB")
+        if not len(index):
+            return 1
+        rng = random.Random(args.seed)
+        timings: Dict[str, List[float]] = {"index": [], "solr": []}
+        failures = passed = 0
+        for _ in range(args.queries):
+            query = random_search(index, rng)
+            params = ItemsQueryParams.model_validate(query).get_solr_params()
+            plan = index.plan(params, BROWSE_FACETS)
+            if plan is None:
+                passed += 1
+                continue
+            started = time.perf_counter()
+            body = await browse.answer(plan)
+            if body is None:
+                passed += 1
+                continue
+            ours = loads(body)
+            timings["index"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            solr = loads(await utils.fetch_search("items", params))
+            timings["solr"].append(time.perf_counter() - started)
+            problems = compare(ours, solr)
+            if problems:
+                failures += 1
+                if failures <= args.show:
+                    print(f"\nMISMATCH {query}")
+                    for problem in problems[:5]:
+                        print(f"  {problem[:300]}")
+        compared = len(timings["index"])
+        print(f"\n{compared} searches compared, {failures} mismatched, {passed} left to Solr by the index")
+        print(f"  {browse.fetched} of them with the page's documents fetched from Solr by id")
+        for name, samples in timings.items():
+            if samples:
+                samples.sort()
+                print(f"  {name:<6} p50 {statistics.median(samples) * 1000:7.2f} ms"
+                      f"  p95 {samples[int(len(samples) * 0.95)] * 1000:7.2f} ms")
+        return 1 if failures or not compared else 0
+    finally:
+        await utils.close_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1882)
+    parser.add_argument("--show", type=int, default=10, help="mismatches printed in full")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Stand-in for Solr that replays canned responses, for benchmarks and local testing.
+
+    python benchmarks/fake_solr.py --port 8983 --latency-ms 20 --docs 20 --text-bytes 4000
+
+Search handlers (/solr/<core>/spell and /select) return a synthetic result page
+shaped like the epsilon core's, or the contents of --search-response. Update
+handlers (/update and /update/json/docs) read the request body and acknowledge it.
+Each response is delayed by --latency-ms (plus up to --jitter-ms).
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Optional
+
+
+def synthetic_search_response(docs: int, text_bytes: int) -> dict:
+    words = "letter specimen orchid barnacle voyage beagle pigeon variation species garden".split()
+    rng = random.Random(1809)
+
+    def text(size: int) -> str:
+        out, length = [], 0
+        while length < size:
+            word = rng.choice(words)
+            out.append(word)
+            length += len(word) + 1
+        return " ".join(out)
+
+    decades = [f"{y}s" for y in range(1820, 1890, 10)]
+    decade_tree = []
+    for decade in decades:
+        decade_tree += [decade, rng.randint(100, 2000)]
+    return {
+        "responseHeader": {"status": 0, "QTime": 12, "params": {"q": "*", "sort": "score desc", "wt": "json"}},
+        "response": {
+            "numFound": 15000,
+            "start": 0,
+            "docs": [
+                {
+                    "id": f"DCP-LETT-{n}",
+                    "fileID": f"DCP-LETT-{n}",
+                    "facet-document-type": "letter",
+                    "title": f"To J. D. Hooker {n}",
+                    "facet-author": ["Darwin, C. R."],
+                    "facet-addressee": ["Hooker, J. D."],
+                    "facet-decade-year-month-day": ["1860s::1868::03::09"],
+                    "content_textual-content": text(text_bytes),
+                    "content_footnotes": text(text_bytes // 4),
+                    "content_summary": text(text_bytes // 8),
+                }
+                for n in range(docs)
+            ],
+        },
+        "facet_counts": {
+            "facet_queries": {},
+            "facet_fields": {
+                "facet-document-type": ["letter", 14000, "bibliography", 700, "people", 300],
+                "facet-author": ["Darwin, C. R.", 7000, "Hooker, J. D.", 1400, "Gray, Asa", 300],
+                "facet-decade": decade_tree,
+            },
+        },
+        "spellcheck": {"suggestions": [], "collations": []},
+    }
+
+
+class FakeSolr:
+    """ASGI application serving canned Solr responses."""
+
+    def __init__(self, search_body: bytes, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.search_body = search_body
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.requests = 0
+        self.updates = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        if scope["type"] != "http":
+            return
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+
+        self.requests += 1
+        delay = self.latency + (random.random() * self.jitter if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        path = scope["path"].rstrip("/")
+        if path.endswith("/spell") or path.endswith("/select"):
+            status, body = 200, self.search_body
+        elif path.endswith("/update") or path.endswith("/update/json/docs"):
+            self.updates += 1
+            status, body = 200, b'{"responseHeader":{"status":0,"QTime":1}}'
+        elif path.endswith("/admin/ping"):
+            status, body = 200, b'{"responseHeader":{"status":0,"QTime":0},"status":"OK"}'
+        else:
+            status, body = 404, b'{"error":{"msg":"Not Found","code":404}}'
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json;charset=utf-8"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def build_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, docs: int = 20, text_bytes: int = 4000,
+              search_response: Optional[str] = None) -> FakeSolr:
+    if search_response:
+        with open(search_response, "rb") as f:
+            body = f.read()
+    else:
+        body = json.dumps(synthetic_search_response(docs, text_bytes)).encode("utf-8")
+    return FakeSolr(body, latency_ms, jitter_ms)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8983)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra delay, up to this value")
+    parser.add_argument("--docs", type=int, default=20, help="documents in the synthetic result page")
+    parser.add_argument("--text-bytes", type=int, default=4000, help="transcription size per document")
+    parser.add_argument("--search-response", help="file holding a captured Solr search response to replay")
+    args = parser.parse_args()
+
+    app = build_app(args.latency_ms, args.jitter_ms, args.docs, args.text_bytes, args.search_response)
+    print(f"fake Solr on http://{args.host}:{args.port} ({len(app.search_body):,} byte search responses)", flush=True)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
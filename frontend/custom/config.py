@@ -10,6 +10,61 @@ CORE_MAP = {
     "page": "site",
 }
 
+# Fields written by GET /items/export
+EXPORT_FIELDS = [
+    "id",
+    "fileID",
+    "title",
+    "facet-document-type",
+    "facet-author",
+    "facet-addressee",
+    "facet-correspondent",
+    "facet-repository",
+    "facet-decade-year-month-day",
+]
+
+# Named field lists for the 'fields' parameter of /items, per core. "fl" is sent to
+# Solr as the field list. "snippets" fields are not returned in full; Solr's
+# "highlighting" section holds a fragment of each, around the matched terms where
+# there are any and from the start of the field otherwise.
+FIELD_PRESETS = {
+    "epsilon": {
+        "list": {
+            "fl": [
+                "id",
+                "fileID",
+                "title",
+                "facet-document-type",
+                "facet-author",
+                "facet-addressee",
+                "facet-correspondent",
+                "facet-decade-year-month-day",
+            ],
+            "snippets": ["content_textual-content", "content_summary"],
+        },
+        "detail": {"fl": ["*", "score"]},
+        "ids": {"fl": ["id", "fileID"]},
+    },
+}
+# Fields with an autocomplete index, by the name used in GET /items/suggest/{name}.
+SUGGEST_FIELDS = {
+    "author": "facet-author",
+    "addressee": "facet-addressee",
+    "correspondent": "facet-correspondent",
+    "repository": "facet-repository",
+}
+
+# Embedded browse index (BROWSE_INDEX, see frontend/lib/browse.py): the fields it
+# stores, and the fields it keeps sort orders for. It filters and counts the facets of
+# facet_query. Filter-only /items searches asking only for BROWSE_FIELDS are answered
+# entirely from the index; for the others (the /spell handler's default fl returns
+# whole documents, and "list" highlights) it fetches just the page's documents.
+BROWSE_FIELDS = FIELD_PRESETS["epsilon"]["ids"]["fl"]
+BROWSE_SORT_FIELDS = ["sort-author", "sort-addressee", "sort-correspondent", "sort-date", "sort-name"]
+
+# Characters per highlighted snippet.
+SNIPPET_SIZE = int(os.environ.get("SNIPPET_SIZE", 200))
+
 facet_query = {
     "facet": {
         "f1-document-type": {
@@ -4,14 +4,27 @@ from typing import Optional
 
 from fastapi import APIRouter
 
-from frontend.custom.config import CORE_MAP
-from frontend.custom.models.items import router as items_router, ItemsQueryParams # ItemsQueryParams is used by main
+from frontend.custom.config import (
+    CORE_MAP, EXPORT_FIELDS, SUGGEST_FIELDS, BROWSE_FIELDS, BROWSE_SORT_FIELDS, facet_query,
+)
+from frontend.custom.models.items import router as items_router, ItemsQueryParams, FacetValuesParams, ITEMS_FACETS # used by main
+from frontend.custom.models.pages import PagesQueryParams
+from frontend.lib.translation import facet_specs
 # Import routers from the models subdirectory
 
 router = APIRouter()
 
 router.include_router(items_router)
 
+# Resources searched together by GET /search, with the model translating the query for each.
+SEARCH_MODELS = {
+    "items": ItemsQueryParams,
+    "pages": PagesQueryParams,
+}
+
+# The facets the /spell handler computes by default, as the browse index counts them.
+BROWSE_FACETS = facet_specs(facet_query)
+
 
 def get_core_name(resource_type: str) -> Optional[str]:
     resource = re.sub(r's$', '', resource_type.lower())
@@ -1,18 +1,72 @@
 #!/usr/bin/env python3
+import logging
 import re
-from typing import Union, List, Optional, Any, Dict
+from typing import Union, List, Literal, Optional, Any, Dict, ClassVar
 
 from fastapi import APIRouter
 from pydantic import Field, field_validator, model_validator, ConfigDict
 
 import frontend.lib.utils as utils
 import frontend.models.base_query_params as CoreModel
-from frontend.custom.config import DEFAULT_ROWS
+from frontend.custom.config import CORE_MAP, DEFAULT_ROWS, FIELD_PRESETS, SNIPPET_SIZE, facet_query
+from frontend.lib.translation import (
+    QueryTranslator, Translation, ALL_FACETS, DATE_FACET_ALIAS, FACET_ALIAS, FACET_FIELD, NO_FACETS, SAME_FACETS,
+    cursor_mark, date_facet, date_range_filter, extra_params, facet_alias, facet_catalog, facet_value,
+    field_preset_params, field_query, keyword_query, lookup, page_start, select_facets, skip_all,
+)
 
 router = APIRouter()
+logger = logging.getLogger("gunicorn.error")
+
+# Pattern matches keys starting with 'f', followed by digits, and then one or more hyphen-separated alphanumeric segments.
+DYNAMIC_FACET = re.compile(r"^f[0-9]+((-[a-zA-Z0-9]+)+)$")
+COLLECTION_VALUE = re.compile(r'("[^"]+")')
+
+# Mapping for text translations
+TRANSLATION_KEY = {
+    "transcribed": "content_textual-content",
+    "footnote": "content_footnotes",
+    "summary": "content_summary",
+}
+# These fields are consumed before translation or are not sent to Solr.
+SOLR_DELETE = ["text", "keyword", "sectionType", "search-date-type", "collection-join", "rows", "facets"]
+SOLR_FIELDS = ["_text_", "content_textual-content", "content_footnotes", "content_summary"]
+DATE_PARAMS = ["year", "month", "day", "year-max", "month-max", "day-max", "search-date-type"]
+EXCLUSIONARY_PARAMS = ["exclude-widedate"]
+SORT_FIELDS = {value: f"sort-{value} asc" for value in ["author", "addressee", "correspondent", "date", "name"]}
+EXPAND_FACETS = {
+    value: {f"f.facet-{value}.facet.limit": "-1", f"f.facet-{value}.facet.sort": "-1"}
+    for value in ["author", "addressee", "correspondent", "repository", "volume"]
+}
+# Facets a client can ask for by name with 'facets=author,date,...'.
+ITEMS_FACETS = facet_catalog(facet_query)
+# Solr parameters for 'fields=list|detail|ids'.
+ITEMS_FIELDS = field_preset_params(FIELD_PRESETS.get(CORE_MAP["item"], {}), SNIPPET_SIZE)
+
+# Remapped fields (exclude-widedate, search-author, day, month, dateRange, ...) and any
+# other remaining parameter become field queries through the default handler.
+ITEMS_TRANSLATOR = QueryTranslator(
+    handlers={
+        **skip_all(SOLR_DELETE + SOLR_FIELDS),
+        "keyword": keyword_query,
+        "text": keyword_query,
+        "page": page_start(DEFAULT_ROWS),
+        "sort": lookup("sort", SORT_FIELDS, "score desc"),
+        "expand": extra_params(EXPAND_FACETS),
+        "fields": extra_params(ITEMS_FIELDS),
+        "cursor": cursor_mark,
+    },
+    patterns=[
+        (DATE_FACET_ALIAS, date_facet),
+        (FACET_ALIAS, facet_alias),
+        (FACET_FIELD, facet_value),
+    ],
+    default=field_query,
+)
 
 class ItemsQueryParams(CoreModel.CoreQueryParams):
     model_config = ConfigDict(populate_by_name=True, extra="allow")
+    translator: ClassVar[QueryTranslator] = ITEMS_TRANSLATOR
 
     expand: Optional[str] = None
     text: Optional[Union[str, List[str]]] = Field(default=None)
@@ -31,6 +85,10 @@ class ItemsQueryParams(CoreModel.CoreQueryParams):
     month_max: Optional[Union[int, str]] = Field(default=None, alias="month-max")
     day_max: Optional[Union[int, str]] = Field(default=None, alias="day-max")
     search_date_type: Optional[str] = Field(default="on", alias="search-date-type")
+    # 'all' (default), 'none', 'same' as the first page, or a comma-separated list of facet names.
+    facets: Optional[Union[str, List[str]]] = None
+    # Field preset from config.FIELD_PRESETS; by default Solr's handler decides.
+    fields: Optional[str] = None
 
     # Canonical facets
     f1_document_type: Optional[Union[str, List[str]]] = Field(default=None, alias="f1-document-type")
@@ -45,13 +103,12 @@ class ItemsQueryParams(CoreModel.CoreQueryParams):
 
     @model_validator(mode="before")
     def filter_and_extract_dynamic_facets(cls, values: Dict[str, Any]) -> Dict[str, Any]:
-        # Pattern matches keys starting with 'f', followed by digits, and then one or more hyphen-separated alphanumeric segments.
-        facet_pattern = re.compile(r"^f[0-9]+((-[a-zA-Z0-9]+)+)$")
-        defined_fields = set(cls.model_fields.keys())
-        #print(f"DUMP {values}")
+        defined_fields = cls.model_fields
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("ItemsQueryParams input: %s", values)
         for key in list(values.keys()):
             if key not in defined_fields:
-                match = facet_pattern.match(key)
+                match = DYNAMIC_FACET.match(key)
                 if match:
                     facet_value = values.pop(key)
                     facet_value = facet_value if isinstance(facet_value, list) else [facet_value]
@@ -68,12 +125,30 @@ class ItemsQueryParams(CoreModel.CoreQueryParams):
                     values.pop(key)
         return values
 
+    @field_validator("facets", mode="before")
+    def parse_facets(cls, value):
+        value = value[-1] if isinstance(value, list) and value else value
+        if not value or value in (ALL_FACETS, NO_FACETS, SAME_FACETS):
+            return value
+        names = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = [name for name in names if name not in ITEMS_FACETS]
+        if unknown:
+            raise ValueError(f"Unknown facets: {', '.join(unknown)}")
+        return names or NO_FACETS
+
+    @field_validator("fields", mode="before")
+    def validate_fields(cls, value):
+        value = value[-1] if isinstance(value, list) and value else value
+        if value and value not in ITEMS_FIELDS:
+            raise ValueError(f"Unknown field preset: {value}")
+        return value
+
     @field_validator("rows", mode="after")
     def validate_rows_items(cls, value):
         return DEFAULT_ROWS if value not in (10, 20) else value
 
     def is_facet(self, key: str, value: Any) -> bool:
-        return re.match(r"^f[0-9]+-.+?$", key) is not None
+        return FACET_ALIAS.match(key) is not None
 
     def generate_datestring(self, year, month, day):
         if year:
@@ -86,132 +161,61 @@ class ItemsQueryParams(CoreModel.CoreQueryParams):
 
     def get_solr_params(self) -> dict:
         query_params2, facet_params2 = self.separate_parameters()
-        url_params = {**query_params2, **facet_params2}
-
-        # Mapping for text translations
-        translation_key = {
-            "transcribed": "content_textual-content",
-            "footnote": "content_footnotes",
-            "summary": "content_summary",
-        }
-        # These fields will be removed later.
-        solr_delete = ["text", "keyword", "sectionType", "search-date-type", "collection-join", "rows"]
-        solr_fields = ["_text_", "content_textual-content", "content_footnotes", "content_summary"]
-        remap_fields = [
-            "exclude-widedate",
-            "search-correspondent",
-            "search-addressee",
-            "search-author",
-            "search-repository",
-            "day",
-            "month",
-            "dateRange",
-        ]
-        solr_params = {}
-
-        set_params = url_params
-        q = []
+        set_params = {**query_params2, **facet_params2}
         fq = []
-        filters = {}
-        expand_clauses = {}
 
         # Remove exclusionary boolean params that only make sense in the affirmative.
-        for p in ["exclude-widedate"]:
+        for p in EXCLUSIONARY_PARAMS:
             if set_params.get(p, "").lower() == "no":
                 set_params.pop(p, None)
 
         # Remap text field based on sectionType
-        if set_params.get("text") and set_params.get("sectionType") in translation_key:
-            key = translation_key[set_params["sectionType"]]
+        if set_params.get("text") and set_params.get("sectionType") in TRANSLATION_KEY:
+            key = TRANSLATION_KEY[set_params["sectionType"]]
             set_params[key] = set_params.pop("text")
             set_params.pop("sectionType", None)
         if set_params.get("sectionType") and not set_params.get("text"):
             set_params.pop("sectionType", None)
 
         if set_params.get('collection'):
-            collections = re.findall(r'("[^"]+")', set_params["collection"])
+            collections = COLLECTION_VALUE.findall(set_params["collection"])
             collection_join = set_params.get('collection-join','AND')
             joiner = ' ' + collection_join.upper() + ' '
             set_params['collection'] = joiner.join(collections)
         else:
             set_params.pop("collection-join", None)
 
-
         # Date processing
         date_min = self.generate_datestring(set_params.get("year"), set_params.get("month"), set_params.get("day"))
         date_max = self.generate_datestring(set_params.get("year-max"), set_params.get("month-max"), set_params.get("day-max"))
         search_date_type = set_params.get("search-date-type")
         if date_min or search_date_type == "between":
-            for k in ["year", "month", "day", "year-max", "month-max", "day-max", "search-date-type"]:
+            for k in DATE_PARAMS:
                 set_params.pop(k, None)
-            predicate_type = "Within"
-            if date_max or search_date_type == "between":
-                date_max_final = date_max if date_max else "2009-02-12"
-                date_min_final = date_min if date_min else "1609-02-12"
-                predicate_type = "Intersects"
-                date_range = f"[{date_min_final} TO {date_max_final}]"
-            else:
-                if search_date_type == "after":
-                    predicate_type = "Intersects"
-                    date_range = f"[{date_min} TO 2009-02-12]"
-                elif search_date_type == "before":
-                    predicate_type = "Intersects"
-                    date_range = f"[1609-02-12 TO {date_min}]"
-                else:
-                    date_range = date_min
-            if date_range:
-                fq.append(f'{{!field f=dateRange op={predicate_type}}}{date_range}')
+            date_filter = date_range_filter(date_min, date_max, search_date_type)
+            if date_filter:
+                fq.append(date_filter)
         else:
             set_params.pop("search-date-type", None)
 
-        for name, value in set_params.items():
-            print('Checking %s' % name)
-            if value:
-                if name in remap_fields:
-                    q.append(f'{name}:({utils.stringify(value)})')
-                elif name in ["keyword", "text"]:
-                    q.append(f'({utils.stringify(value)})')
-                elif re.match(r"^f[0-9]+-date$", name):
-                    val_list = utils.listify(value)
-                    fields = ["facet-decade", "facet-decade-year", "facet-decade-year-month", "facet-decade-year-month-day"]
-                    for date in sorted(val_list):
-                        date_clean = re.sub(r'^"(.+?)"$', r'\1', date)
-                        date_parts = date_clean.split("::")
-                        num_parts = len(date_parts)
-                        solr_name = fields[min(num_parts - 1, len(fields) - 1)]
-                        for index, field in enumerate(fields):
-                            if index >= num_parts - 1:
-                                filters[f"f.{field}.facet.contains"] = date_clean
-                            else:
-                                filters[f"f.{field}.facet.contains"] = "::".join(date_parts[: index + 1])
-                        fq.append(f'{solr_name}:"{date_clean}"')
-                elif re.match(r"^f[0-9]+-.+?$", name):
-                    solr_name = re.sub(r"^f[0-9]+-(.+?)$", r"facet-\1", name)
-                    for x in utils.listify(value):
-                        x_clean = re.sub(r'^"(.+?)"$', r'\1', x)
-                        fq.append(f'{solr_name}:"{x_clean}"')
-                elif re.match(r"^facet-.+?$", name):
-                    value_clean = re.sub(r'^"(.+?)"$', r'\1', value)
-                    fq.append(f'{name}:"{value_clean}"')
-                elif name == "page":
-                    page_val = int(value)
-                    solr_params["start"] = (page_val - 1) * DEFAULT_ROWS
-                elif name == "sort":
-                    sort_val = f"sort-{value}" if value in ["author", "addressee", "correspondent", "date", "name"] else "score"
-                    sort_order = "desc" if sort_val == "score" else "asc"
-                    solr_params["sort"] = f"{sort_val} {sort_order}"
-                elif name == "expand":
-                    if value in ["author", "addressee", "correspondent", "repository", "volume"]:
-                        expand_clauses[f"f.facet-{value}.facet.limit"] = "-1"
-                        expand_clauses[f"f.facet-{value}.facet.sort"] = "-1"
-                elif not name in solr_delete + solr_fields:
-                    q.append(f'{name}:({utils.stringify(value)})')
-
-        final_q = " ".join(q)
-        if final_q in ["['*']", "['']"]:
-            final_q = "*"
-        solr_params["q"] = final_q if final_q not in ["['*']", "['']"] else "*"
-        solr_params["fq"] = fq
-        solr_params = {**solr_params, **filters, **expand_clauses}
-        #print(solr_params)
-        return solr_params
+        solr_params = self.translator.translate(set_params, Translation(fq))
+        return select_facets(solr_params, self.facets, ITEMS_FACETS)
+
+
+# Paging parameters of GET /items/facets/{name}; the rest are the /items filters.
+FACET_VALUES_PARAMS = ["offset", "limit", "prefix", "order"]
+FACET_VALUES_MAX = 500
+FACET_VALUES_TRANSLATOR = QueryTranslator(
+    handlers={**ITEMS_TRANSLATOR.handlers, **skip_all(FACET_VALUES_PARAMS)},
+    patterns=ITEMS_TRANSLATOR.patterns,
+    default=field_query,
+)
+
+class FacetValuesParams(ItemsQueryParams):
+    translator: ClassVar[QueryTranslator] = FACET_VALUES_TRANSLATOR
+
+    offset: int = Field(default=0, ge=0)
+    limit: int = Field(default=DEFAULT_ROWS, ge=1, le=FACET_VALUES_MAX)
+    prefix: Optional[str] = None
+    # 'count' (most frequent first) or 'index' (alphabetical)
+    order: Literal["count", "index"] = "count"
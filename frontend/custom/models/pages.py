@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+from typing import ClassVar
+
+import frontend.models.base_query_params as CoreModel
+from frontend.custom.config import DEFAULT_ROWS
+from frontend.lib.translation import (
+    QueryTranslator, FACET_FIELD, cursor_mark, facet_field, field_query, keyword_query, page_start, skip,
+)
+
+# The core parameters, with 'keyword' as the main query rather than a field.
+PAGES_TRANSLATOR = QueryTranslator(
+    handlers={
+        "keyword": keyword_query,
+        "page": page_start(DEFAULT_ROWS),
+        "rows": skip,
+        "sort": skip,
+        "cursor": cursor_mark,
+    },
+    patterns=[(FACET_FIELD, facet_field)],
+    default=field_query,
+)
+
+class PagesQueryParams(CoreModel.CoreQueryParams):
+    """Website pages (CORE_MAP["page"]), searched alongside items by GET /search."""
+    translator: ClassVar[QueryTranslator] = PAGES_TRANSLATOR
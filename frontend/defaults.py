@@ -1,19 +1,153 @@
 import logging
 import os
+import tempfile
 
 import frontend.custom.implementation as implementation
+from frontend.custom.config import CORE_MAP
 
 logger = logging.getLogger("gunicorn.error")
 
+# Solr replicas for searches, e.g. "http://solr1:8983,http://solr2:8983". When set,
+# SOLR_HOST and SOLR_PORT are optional. Updates go to SOLR_WRITE_URL, which defaults
+# to SOLR_HOST:SOLR_PORT or else the first of SOLR_URLS.
+SOLR_URLS = [url.strip().rstrip("/") for url in os.getenv("SOLR_URLS", "").split(",") if url.strip()]
+
 # Get environment variables and ensure required ones are set.
 SOLR_HOST = os.getenv("SOLR_HOST")
-if not SOLR_HOST:
+if not SOLR_HOST and not SOLR_URLS:
     raise EnvironmentError("ERROR: SOLR_HOST environment variable not set")
 SOLR_PORT = os.getenv("SOLR_PORT")
-if not SOLR_PORT:
+if not SOLR_PORT and not SOLR_URLS:
     raise EnvironmentError("ERROR: SOLR_PORT environment variable not set")
 
-SOLR_URL = f"http://{SOLR_HOST}:{SOLR_PORT}"
+SOLR_WRITE_URL = os.getenv("SOLR_WRITE_URL", "").rstrip("/") or \
+    (f"http://{SOLR_HOST}:{SOLR_PORT}" if SOLR_HOST and SOLR_PORT else SOLR_URLS[0])
+SOLR_READ_URLS = SOLR_URLS or [SOLR_WRITE_URL]
+# The write node. utils functions route requests by path instead (see frontend/lib/routing.py).
+SOLR_URL = SOLR_WRITE_URL
+
+# Health checks and ejection of failing Solr nodes. A node is ejected for
+# SOLR_EJECT_SECONDS after SOLR_FAILURE_THRESHOLD consecutive failures.
+SOLR_HEALTH_INTERVAL = float(os.getenv("SOLR_HEALTH_INTERVAL", 5))
+SOLR_HEALTH_PATH = os.getenv("SOLR_HEALTH_PATH", f"/solr/{next(iter(CORE_MAP.values()))}/admin/ping")
+SOLR_FAILURE_THRESHOLD = int(os.getenv("SOLR_FAILURE_THRESHOLD", 3))
+SOLR_EJECT_SECONDS = float(os.getenv("SOLR_EJECT_SECONDS", 10))
+
+# Connection pooling for the shared Solr clients (see frontend/lib/client.py).
+# Searches and updates use separate pools so that a reindex cannot take every
+# connection away from /items.
+SOLR_READ_POOL_SIZE = int(os.getenv("SOLR_READ_POOL_SIZE", 20))
+SOLR_WRITE_POOL_SIZE = int(os.getenv("SOLR_WRITE_POOL_SIZE", 5))
+SOLR_READ_TIMEOUT = float(os.getenv("SOLR_READ_TIMEOUT", 60))
+SOLR_WRITE_TIMEOUT = float(os.getenv("SOLR_WRITE_TIMEOUT", 60))
+SOLR_CONNECT_TIMEOUT = float(os.getenv("SOLR_CONNECT_TIMEOUT", 5))
+SOLR_KEEPALIVE_EXPIRY = float(os.getenv("SOLR_KEEPALIVE_EXPIRY", 30))
+SOLR_HTTP2 = os.getenv("SOLR_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Adaptive limits on concurrent Solr calls per worker, in separate lanes for searches
+# and index updates (see frontend/lib/limiter.py). Calls over the limit queue for up
+# to *_QUEUE_TIMEOUT seconds; beyond that, or with LIMIT_QUEUE_SIZE already waiting,
+# they fail fast with 503 and Retry-After.
+LIMITER = os.getenv("LIMITER", "true").lower() in ("1", "true", "yes")
+LIMIT_MIN = int(os.getenv("LIMIT_MIN", 2))
+SEARCH_LIMIT_MAX = int(os.getenv("SEARCH_LIMIT_MAX", SOLR_READ_POOL_SIZE))
+INDEX_LIMIT_MAX = int(os.getenv("INDEX_LIMIT_MAX", SOLR_WRITE_POOL_SIZE))
+LIMIT_QUEUE_SIZE = int(os.getenv("LIMIT_QUEUE_SIZE", 100))
+SEARCH_QUEUE_TIMEOUT = float(os.getenv("SEARCH_QUEUE_TIMEOUT", 2))
+INDEX_QUEUE_TIMEOUT = float(os.getenv("INDEX_QUEUE_TIMEOUT", 10))
+LIMIT_LATENCY_TOLERANCE = float(os.getenv("LIMIT_LATENCY_TOLERANCE", 2))
+
+# Deadlines: clients may send DEADLINE_HEADER with the milliseconds they will wait;
+# searches on /items default to SEARCH_DEADLINE seconds. Solr is given
+# SOLR_TIME_ALLOWED_FRACTION of the time left as timeAllowed.
+DEADLINE_HEADER = os.getenv("DEADLINE_HEADER", "X-Request-Deadline-Ms")
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", 15))
+SOLR_TIME_ALLOWED_FRACTION = float(os.getenv("SOLR_TIME_ALLOWED_FRACTION", 0.8))
+
+# Hedged searches: when a search has not answered after the HEDGE_PERCENTILE latency,
+# send a second copy. Each search earns HEDGE_BUDGET_RATIO hedges (banked up to
+# HEDGE_BUDGET_CAP), bounding the extra load to about that fraction.
+HEDGE = os.getenv("HEDGE", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.01))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", 0.05))
+HEDGE_BUDGET_CAP = float(os.getenv("HEDGE_BUDGET_CAP", 10))
+
+# In-process cache of /items results (see frontend/lib/cache.py). Set
+# RESULT_CACHE_ENTRIES to 0 to disable it.
+RESULT_CACHE_ENTRIES = int(os.getenv("RESULT_CACHE_ENTRIES", 1000))
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", 32 * 1024 * 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 300))
+
+# Short-lived cache behind GET /items/facets/{name}, and the largest page it serves.
+FACET_CACHE_ENTRIES = int(os.getenv("FACET_CACHE_ENTRIES", 500))
+FACET_CACHE_BYTES = int(os.getenv("FACET_CACHE_BYTES", 8 * 1024 * 1024))
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", 30))
+
+# ETags for /items come from each core's index version, polled from Solr's replication
+# handler every INDEX_VERSION_INTERVAL seconds (0 disables them). CACHE_MAX_AGE is the
+# max-age sent with tagged responses; with 0, caches revalidate every time.
+INDEX_VERSION_INTERVAL = float(os.getenv("INDEX_VERSION_INTERVAL", 5))
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", 0))
+
+# Serve search results as the bytes Solr returned, patching only the response header,
+# rather than parsing and re-encoding them.
+RESPONSE_PASSTHROUGH = os.getenv("RESPONSE_PASSTHROUGH", "true").lower() in ("1", "true", "yes")
+
+# Responses of at least COMPRESS_MIN_SIZE bytes are compressed with brotli (if the
+# Brotli package is installed) or gzip, as the client accepts. 0 disables compression.
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+# Cache warmer (see frontend/lib/warmer.py): the WARM_QUERIES most frequent searches
+# (0 disables it) are saved to WARM_FILE (empty to not save them), replayed at startup
+# and after index updates, and served up to WARM_STALE_SECONDS stale while refreshing.
+WARM_QUERIES = int(os.getenv("WARM_QUERIES", 50))
+WARM_FILE = os.getenv("WARM_FILE", os.path.join(tempfile.gettempdir(), "epsilon-search-warm.json"))
+WARM_STALE_SECONDS = float(os.getenv("WARM_STALE_SECONDS", 600))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", 2))
+
+# Bulk indexing (POST /item/bulk). commitWithin is in milliseconds.
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 2))
+BULK_COMMIT_WITHIN = int(os.getenv("BULK_COMMIT_WITHIN", 10000))
+
+# Write-behind mode for PUT /item and DELETE /item (see frontend/lib/write_behind.py).
+# WRITE_BEHIND_SPOOL_DIR enables a durable on-disk journal of queued operations.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 100))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", 2))
+WRITE_BEHIND_SPOOL_DIR = os.getenv("WRITE_BEHIND_SPOOL_DIR") or None
+
+# POST /items/batch: most queries per request, and how many run at once.
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 20))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+# GET /search: seconds before cores that have not answered are given up on.
+FEDERATED_DEADLINE = float(os.getenv("FEDERATED_DEADLINE", 5))
+
+# Autocomplete (GET /items/suggest/{name}): most values loaded per field (0 disables
+# it) and seconds between reloads from Solr.
+SUGGEST_MAX_TERMS = int(os.getenv("SUGGEST_MAX_TERMS", 20000))
+SUGGEST_REFRESH_INTERVAL = float(os.getenv("SUGGEST_REFRESH_INTERVAL", 3600))
+
+# Embedded browse index (see frontend/lib/browse.py): filter-only /items searches are
+# answered in-process from the metadata of every item, loaded from Solr at startup and
+# synced at each new index version. Needs INDEX_VERSION_INTERVAL > 0.
+BROWSE_INDEX = os.getenv("BROWSE_INDEX", "false").lower() in ("1", "true", "yes")
+
+# Documents fetched per Solr cursor page by GET /items/export.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+
+# Metrics for GET /metrics. Each worker writes a snapshot to METRICS_DIR every
+# METRICS_INTERVAL seconds so that any worker can report totals for all of them.
+# gunicorn.conf.py sets a directory per master; without one (plain uvicorn), metrics
+# stay in the process, as a directory named after a long-lived parent would carry
+# counters over from earlier runs.
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", 5))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
 
 INTERNAL_ERROR_STATUS_CODE = 500
 
@@ -22,3 +156,23 @@ try:
     DEFAULT_ROWS = implementation.DEFAULT_ROWS
 except ImportError:
     DEFAULT_ROWS = 20
+
+try:
+    from frontend.custom.implementation import EXPORT_FIELDS
+except ImportError:
+    EXPORT_FIELDS = ["id"]
+
+try:
+    from frontend.custom.implementation import SUGGEST_FIELDS
+except ImportError:
+    SUGGEST_FIELDS = {}
+
+try:
+    from frontend.custom.implementation import SEARCH_MODELS
+except ImportError:
+    SEARCH_MODELS = {}
+
+try:
+    from frontend.custom.implementation import BROWSE_FIELDS, BROWSE_SORT_FIELDS, BROWSE_FACETS
+except ImportError:
+    BROWSE_FIELDS, BROWSE_SORT_FIELDS, BROWSE_FACETS = [], [], []
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import asyncio
+from typing import Any, List, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from frontend.lib import utils
+from frontend.lib.responses import SolrResponse, dumps
+from frontend.lib.translation import REUSE_FACETS
+
+# Key of a batch query object asking only for the number of matches.
+COUNT_ONLY = "count"
+# A count-only search fetches no documents, facets, spellcheck or highlighting.
+COUNT_OVERRIDES = {"rows": 0, "facet": "false", "spellcheck": "false", "hl": "false"}
+
+
+class CountOnly(BaseModel):
+    # Parsed like the boolean parameters of the search models: "false" and 0 are false.
+    count: bool = False
+
+
+def count_params(solr_params: dict) -> dict:
+    params = {
+        name: value for name, value in solr_params.items()
+        if name not in ("start", "cursorMark", "sort", "facet.field", REUSE_FACETS) and not name.startswith("f.")
+    }
+    params.update(COUNT_OVERRIDES)
+    return params
+
+
+async def search_batch(resource_type: str, queries: List[Any], model: Type[BaseModel],
+                       concurrency: int) -> SolrResponse:
+    """
+    Validate and translate each query with 'model', run the searches at most
+    'concurrency' at a time and return {"results": [...]} in the order of 'queries'.
+    Each result is Solr's response, as /items would serve it, or an
+    {"status": ..., "error": ...} object, so one bad query does not fail the rest.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(query: Any) -> bytes:
+        try:
+            if not isinstance(query, dict):
+                raise HTTPException(status_code=422, detail="Each query must be a JSON object")
+            query = dict(query)
+            count_only = CountOnly.model_validate({COUNT_ONLY: query.pop(COUNT_ONLY, False)}).count
+            solr_params = model.model_validate(query).get_solr_params()
+            if count_only:
+                solr_params = count_params(solr_params)
+            async with semaphore:
+                response = await utils.get_response(resource_type, **solr_params)
+            return bytes(response.body)
+        except ValidationError as e:
+            return dumps({"status": 422, "error": e.errors(include_url=False, include_context=False)})
+        except HTTPException as e:
+            return dumps({"status": e.status_code, "error": e.detail})
+
+    bodies = await asyncio.gather(*(run(query) for query in queries))
+    # Solr's bodies are embedded as they are rather than parsed and re-encoded.
+    return SolrResponse(b'{"results":[' + b",".join(bodies) + b"]}")
@@ -0,0 +1,832 @@
+#!/usr/bin/env python3
+import asyncio
+import heapq
+import re
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import chain, compress, islice
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from frontend.defaults import *
+from frontend.lib.responses import dumps, loads
+from frontend.lib.versions import index_versions
+
+# As translation.UNIQUE_KEY (translation cannot be imported before utils).
+UNIQUE_KEY = "id"
+VERSION_FIELD = "_version_"
+
+# Searches the index answers: a match-all q, and fq clauses of the form field:"value".
+MATCH_ALL = {"", "*", "*:*", "(*)", "(*:*)"}
+FILTER = re.compile(r'^([\w.-]+):"((?:[^"\\]|\\.)*)"$')
+ESCAPED = re.compile(r"\\(.)")
+# A sort on one field with the unique key as tie-break, as translation.total_sort makes it.
+SORT = re.compile(rf"^([\w.-]+)\s+(asc|desc)\s*,\s*{UNIQUE_KEY}\s+asc$")
+FIELD_OPTION = re.compile(r"^f\.([\w.-]+)\.facet\.(limit|sort|mincount|contains)$")
+# Parameters read here, or that do not change the result. hl.* parameters are passed on
+# to Solr with the fetch of the page's documents.
+KNOWN_PARAMS = {"q", "fq", "sort", "start", "rows", "fl", "facet", "facet.field", "facet.mincount", "hl",
+                "spellcheck", "timeAllowed"}
+# Parameters of a search that shape the documents and sections Solr returns with them.
+FETCH_PARAMS = {"q", "fl", "hl", "spellcheck"}
+# The /spell handler's facet.mincount and Solr's facet.limit, unless a search sets them.
+FACET_MINCOUNT = 1
+FACET_LIMIT = 100
+
+# Values in at least this share of the documents get a bitset, rarer ones a doc list.
+DENSE_SHARE = 1 / 64
+# Up to this many matches, a page is picked from a list of them rather than by
+# walking the sort order.
+LIST_MAX = 2048
+# Delta syncs fetch documents updated since this long before the newest one seen, for
+# updates committed out of order (Solr versions are milliseconds << 20).
+VERSION_LOOKBACK = 60_000 << 20
+# Share of deleted or replaced document slots that triggers a full reload.
+MAX_DELETED = 0.25
+ID_BATCH_SIZE = 10000
+
+# Set bit offsets of each byte value.
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+NONZERO = re.compile(rb"[^\x00]+")
+ZERO_ONE = bytes.maketrans(b"01", b"\x00\x01")
+# Relative costs of faceting: checking one document of a doc list costs 1, counting
+# the values of one matching document 1 (10 for multi-valued fields), and looking at
+# a term at all TERM_COST.
+MULTI_VALUED_COST = 10
+TERM_COST = 10
+
+# Runs a search without the result cache: (resource type, params) -> Solr's body.
+Fetch = Callable[[str, dict], Awaitable[bytes]]
+
+
+def to_bits(docs: Iterable[int], size: int) -> int:
+    mask = bytearray((size + 7) >> 3)
+    for doc in docs:
+        mask[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(mask, "little")
+
+
+def set_bits(mask: bytes) -> List[int]:
+    """The positions of the bits set in 'mask' (little-endian), in ascending order."""
+    docs: List[int] = []
+    for run in NONZERO.finditer(mask):
+        position = run.start() << 3
+        for value in run.group():
+            docs.extend([position + bit for bit in BYTE_BITS[value]])
+            position += 8
+    return docs
+
+
+def _single(value):
+    if isinstance(value, list):
+        return value[0] if len(value) == 1 else None
+    return value
+
+
+def _size(value: array) -> int:
+    return value.buffer_info()[1] * value.itemsize
+
+
+class SortColumn:
+    """The values of a single-valued field: a term dictionary and each document's term id (-1 for none)."""
+
+    def __init__(self):
+        # The values' own types, so numbers sort as numbers.
+        self.terms: List = []
+        self.term_ids: Dict = {}
+        self.first = array("i")
+
+    def append(self, doc: int, values: List) -> None:
+        """Add the next document; 'doc' must be the number of documents added so far."""
+        if not values:
+            self.first.append(-1)
+            return
+        term = self.term_ids.get(values[0])
+        if term is None:
+            term = self.term_ids[values[0]] = len(self.terms)
+            self.terms.append(values[0])
+        self.first.append(term)
+
+    def value(self, doc: int):
+        term = self.first[doc]
+        return self.terms[term] if term >= 0 else None
+
+    def memory(self) -> int:
+        return sum(sys.getsizeof(term) for term in self.terms) + sys.getsizeof(self.term_ids) + _size(self.first)
+
+
+class Column(SortColumn):
+    """
+    The string values of a filter and facet field. Besides each document's first term
+    id, it keeps all of them (offsets[doc] to offsets[doc + 1] in ords) and, per term,
+    its documents: as an int bitset when the term is common, as an array when it is rare.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.offsets = array("i", [0])
+        self.ords = array("i")
+        self.postings: List[Union[int, array]] = []
+        # Live documents per term.
+        self.df = array("i")
+        self.multi_valued = False
+        # Entries in the postings that are arrays.
+        self.sparse = 0
+        self._by_term: Optional[List[int]] = None
+        self._by_df: Optional[List[int]] = None
+
+    def append(self, doc: int, values: List) -> None:
+        values = list(dict.fromkeys(values))
+        self.multi_valued = self.multi_valued or len(values) > 1
+        for value in values:
+            term = self.term_ids.get(value)
+            if term is None:
+                term = self.term_ids[value] = len(self.terms)
+                self.terms.append(value)
+                self.postings.append(array("i"))
+                self.df.append(0)
+                self._by_term = None
+            self.ords.append(term)
+            self.df[term] += 1
+            posting = self.postings[term]
+            if isinstance(posting, int):
+                self.postings[term] = posting | 1 << doc
+            else:
+                posting.append(doc)
+                self.sparse += 1
+        self.first.append(self.term_ids[values[0]] if values else -1)
+        self.offsets.append(len(self.ords))
+        self._by_df = None
+
+    def remove(self, doc: int) -> None:
+        # Postings keep the document; searches only look at live ones.
+        for term in self.ords[self.offsets[doc]:self.offsets[doc + 1]]:
+            self.df[term] -= 1
+        self._by_df = None
+
+    def densify(self, threshold: int, size: int) -> None:
+        for term, posting in enumerate(self.postings):
+            if not isinstance(posting, int) and len(posting) >= threshold:
+                self.postings[term] = to_bits(posting, size)
+                self.sparse -= len(posting)
+
+    def bits(self, term: int, size: int) -> int:
+        posting = self.postings[term]
+        return posting if isinstance(posting, int) else to_bits(posting, size)
+
+    def count(self, term: int, matches: "Matches") -> int:
+        posting = self.postings[term]
+        if isinstance(posting, int):
+            return (posting & matches.bits).bit_count()
+        return sum(map(matches.flags.__getitem__, posting))
+
+    def tally(self, docs: List[int]) -> Counter:
+        """Documents per term among 'docs'."""
+        if not self.multi_valued:
+            counts = Counter(map(self.first.__getitem__, docs))
+            counts.pop(-1, None)
+            return counts
+        starts = map(self.offsets.__getitem__, docs)
+        ends = map(self.offsets.__getitem__, map((1).__add__, docs))
+        return Counter(chain.from_iterable(map(self.ords.__getitem__, map(slice, starts, ends))))
+
+    def by_term(self) -> List[int]:
+        if self._by_term is None:
+            self._by_term = sorted(range(len(self.terms)), key=self.terms.__getitem__)
+        return self._by_term
+
+    def by_df(self) -> List[int]:
+        if self._by_df is None:
+            self._by_df = sorted(range(len(self.terms)), key=self.df.__getitem__, reverse=True)
+        return self._by_df
+
+    def memory(self) -> int:
+        postings = sum(sys.getsizeof(posting) for posting in self.postings)
+        return super().memory() + postings + _size(self.offsets) + _size(self.ords) + _size(self.df)
+
+
+class Matches:
+    """The documents a search matches: as a bitset, as a byte per document and, on demand, as a list."""
+
+    def __init__(self, bits: int, size: int):
+        self.bits = bits
+        self.size = size
+        self.count = bits.bit_count()
+        self.flags = f"{bits:0{size}b}"[::-1].encode("ascii").translate(ZERO_ONE) if size else b""
+        self._listed: Optional[List[int]] = None
+
+    def listed(self) -> List[int]:
+        if self._listed is None:
+            if self.count * 64 < self.size:
+                self._listed = set_bits(self.bits.to_bytes((self.size + 7) >> 3, "little"))
+            else:
+                self._listed = list(compress(range(self.size), self.flags))
+        return self._listed
+
+
+class FacetSpec(NamedTuple):
+    field: str
+    limit: int
+    by_count: bool
+    mincount: int
+    contains: Optional[str]
+
+
+class Browse(NamedTuple):
+    """A search the index can answer."""
+    filters: List[Tuple[str, str]]
+    sort: str
+    descending: bool
+    start: int
+    rows: int
+    # The stored fields to return, or None to fetch the page's documents from Solr
+    # with the 'fetch' parameters.
+    fields: Optional[List[str]]
+    fetch: dict
+    facets: Optional[List[FacetSpec]]
+    params: dict
+
+
+class Page(NamedTuple):
+    """The index's part of an answer: stored documents only if the search asked for no others."""
+    count: int
+    keys: List[str]
+    documents: Optional[List[bytes]]
+    facet_counts: Optional[dict]
+
+
+class MetadataIndex:
+    """
+    Filter, facet and sort columns of a core's documents, with the stored fields to
+    return for each. Documents are numbered in the order they are added; replacing or
+    deleting one only clears it from 'live', so numbers never change. Each sort field
+    keeps its documents in ascending and in descending order of value, both with ties
+    in ascending order of the unique key (as Solr orders them with the tie-break that
+    total_sort adds), followed by those without a value in the same key order.
+    """
+
+    def __init__(self, filter_fields: List[str], sort_fields: List[str], stored_fields: List[str]):
+        self.columns = {field: Column() for field in filter_fields}
+        self.sorts = {field: SortColumn() for field in sort_fields}
+        self.stored_fields = list(stored_fields)
+        self.documents: List[Optional[bytes]] = []
+        self.keys: List[str] = []
+        self.versions = array("q")
+        self.numbers: Dict[str, int] = {}
+        self.live = 0
+        self.deleted = 0
+        self.max_version = 0
+        self.orders: Dict[str, array] = {}
+        self.descending_orders: Dict[str, array] = {}
+        self.unsorted: Dict[str, array] = {}
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def add(self, document: dict) -> bool:
+        """Add or replace a document; False if it is already here at the same version."""
+        key = str(document[UNIQUE_KEY])
+        version = int(document.get(VERSION_FIELD) or 0)
+        previous = self.numbers.get(key)
+        if previous is not None:
+            if version and self.versions[previous] == version:
+                return False
+            self._delete(previous)
+        doc = len(self.documents)
+        self.documents.append(dumps({field: document[field] for field in self.stored_fields if field in document}))
+        self.keys.append(key)
+        self.versions.append(version)
+        self.numbers[key] = doc
+        self.max_version = max(self.max_version, version)
+        for field, column in self.columns.items():
+            column.append(doc, [self._term(value) for value in self._values(document.get(field))])
+        for field, column in self.sorts.items():
+            column.append(doc, self._values(document.get(field))[:1])
+        if self._built:
+            self.live |= 1 << doc
+            keys = self.keys
+            for field, column in self.sorts.items():
+                value = column.value(doc)
+                if value is None:
+                    unsorted = self.unsorted[field]
+                    unsorted.insert(self._position(unsorted, lambda other: key < keys[other]), doc)
+                    continue
+
+                def before(other: int, descending: bool) -> bool:
+                    other_value = column.value(other)
+                    if value != other_value:
+                        return value > other_value if descending else value < other_value
+                    return key < keys[other]
+
+                for order, descending in ((self.orders[field], False), (self.descending_orders[field], True)):
+                    order.insert(self._position(order, lambda other: before(other, descending)), doc)
+        return True
+
+    def remove(self, key: str) -> bool:
+        doc = self.numbers.pop(key, None)
+        if doc is None:
+            return False
+        self._delete(doc)
+        return True
+
+    def _delete(self, doc: int) -> None:
+        self.documents[doc] = None
+        self.deleted += 1
+        for column in self.columns.values():
+            column.remove(doc)
+        if self._built:
+            self.live &= ~(1 << doc)
+
+    @staticmethod
+    def _values(value) -> list:
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    @staticmethod
+    def _term(value) -> str:
+        # Solr reports facet values, and takes filter values, as strings.
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    @staticmethod
+    def _position(order: array, before: Callable[[int], bool]) -> int:
+        """Where a document goes in 'order': before the first document it sorts 'before'."""
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if before(order[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def finish(self) -> None:
+        """Build the bitsets and sort orders after a bulk load, or refresh them after adds."""
+        size = len(self.documents)
+        threshold = max(8, int(size * DENSE_SHARE))
+        for column in self.columns.values():
+            column.densify(threshold, size)
+        if not self._built:
+            self.live = to_bits((doc for doc, body in enumerate(self.documents) if body is not None), size)
+            by_key = sorted(range(size), key=self.keys.__getitem__)
+            for field, column in self.sorts.items():
+                value = column.value
+                present = [doc for doc in by_key if column.first[doc] >= 0]
+                # Stable sorts keep the key order among equal values, in both directions.
+                present.sort(key=value)
+                self.orders[field] = array("i", present)
+                present.sort(key=value, reverse=True)
+                self.descending_orders[field] = array("i", present)
+                self.unsorted[field] = array("i", (doc for doc in by_key if column.first[doc] < 0))
+            self._built = True
+
+    def plan(self, params: dict, default_facets: List[dict]) -> Optional[Browse]:
+        """The search 'params' describe, if the index can answer it; None otherwise."""
+        options: Dict[str, Dict[str, str]] = {}
+        for name, value in params.items():
+            if name in KNOWN_PARAMS or name.startswith("hl."):
+                continue
+            match = FIELD_OPTION.match(name)
+            if match is None or _single(value) is None:
+                return None
+            options.setdefault(match[1], {})[match[2]] = str(_single(value))
+        q = _single(params.get("q", ""))
+        if q is None or str(q).strip() not in MATCH_ALL:
+            return None
+        filters = []
+        for clause in MetadataIndex._values(params.get("fq")):
+            match = FILTER.match(str(clause).strip())
+            if match is None or match[1] not in self.columns:
+                return None
+            filters.append((match[1], ESCAPED.sub(r"\1", match[2])))
+        match = SORT.match(str(_single(params.get("sort")) or "").strip())
+        if match is None or match[1] not in self.sorts:
+            # Without a sort field, or the unique key to break ties, Solr orders (some)
+            # documents by its internal document ids.
+            return None
+        try:
+            start = int(_single(params.get("start", 0)))
+            rows = int(_single(params.get("rows", DEFAULT_ROWS)))
+        except (TypeError, ValueError):
+            return None
+        if start < 0 or rows < 0:
+            return None
+        # Stored fields are returned from here, when Solr would add no sections of its
+        # own. Otherwise (the handler's default fields, highlighting or spellcheck) Solr
+        # is asked for the page's documents by their keys, which must be among the
+        # fields returned.
+        fields = None
+        if params.get("fl") is not None:
+            fields = [name for value in self._values(params["fl"]) for name in re.split(r"[\s,]+", str(value)) if name]
+            if not fields:
+                return None
+            sections = any(str(_single(params.get(name, ""))).lower() != "false" for name in ("hl", "spellcheck"))
+            if sections or not set(fields) <= set(self.stored_fields):
+                if UNIQUE_KEY not in fields and "*" not in fields:
+                    return None
+                fields = None
+        facets = self._facets(params, options, default_facets)
+        if facets is False:
+            return None
+        fetch = {name: value for name, value in params.items() if name in FETCH_PARAMS or name.startswith("hl.")}
+        echo = {name: [str(v) for v in value] if isinstance(value, list) else str(value)
+                for name, value in params.items()}
+        return Browse(filters, match[1], match[2] == "desc", start, rows, fields, fetch, facets, echo)
+
+    def _facets(self, params: dict, options: Dict[str, Dict[str, str]], default_facets: List[dict]):
+        facet = str(_single(params.get("facet", "true"))).lower()
+        if facet == "false":
+            return None
+        if facet != "true":
+            return False
+        if "facet.field" in params:
+            defaults = [{"field": str(field), "limit": FACET_LIMIT, "sort": "count"}
+                        for field in self._values(params["facet.field"])]
+        else:
+            defaults = default_facets
+        specs = []
+        try:
+            mincount = int(_single(params.get("facet.mincount", FACET_MINCOUNT)))
+            for spec in defaults:
+                field = spec["field"]
+                if field not in self.columns:
+                    return False
+                option = options.get(field, {})
+                sort = option.get("sort", spec["sort"])
+                if sort not in ("count", "index", "true", "false"):
+                    return False
+                specs.append(FacetSpec(field, int(option.get("limit", spec["limit"])), sort in ("count", "true"),
+                                       int(option.get("mincount", mincount)), option.get("contains") or None))
+        except (TypeError, ValueError):
+            return False
+        return specs
+
+    def search(self, browse: Browse) -> Page:
+        """The number of matches, the keys of the page's documents and the facet counts for 'browse'."""
+        size = len(self.documents)
+        bits = self.live
+        for field, value in browse.filters:
+            column = self.columns[field]
+            term = column.term_ids.get(value)
+            bits = bits & column.bits(term, size) if term is not None else 0
+            if not bits:
+                break
+        matches = Matches(bits, size)
+        page = self._page(browse, matches)
+        documents = None
+        if browse.fields is not None:
+            documents = [self.documents[doc] for doc in page]
+            if set(browse.fields) != set(self.stored_fields):
+                documents = [dumps({name: value for name, value in loads(body).items() if name in browse.fields})
+                             for body in documents]
+        facet_counts = None
+        if browse.facets is not None:
+            fields = {spec.field: [item for pair in self._facet(spec, matches) for item in pair]
+                      for spec in browse.facets}
+            facet_counts = {"facet_queries": {}, "facet_fields": fields, "facet_ranges": {}, "facet_intervals": {},
+                            "facet_heatmaps": {}}
+        return Page(matches.count, [self.keys[doc] for doc in page], documents, facet_counts)
+
+    def _page(self, browse: Browse, matches: Matches) -> List[int]:
+        end = min(browse.start + browse.rows, matches.count)
+        if browse.start >= end:
+            return []
+        column = self.sorts[browse.sort]
+        first, key = column.first, self.keys.__getitem__
+        # Walking the sort order visits about end * size / count documents (more when the
+        # matches cluster late in the order); listing the matches and picking the page
+        # costs about count.
+        if matches.count <= LIST_MAX or matches.count * 4 <= matches.size or end * matches.size > 4 * matches.count ** 2:
+            listed = matches.listed()
+            present = [doc for doc in listed if first[doc] >= 0]
+            value = column.value
+            pick = heapq.nlargest if browse.descending else heapq.nsmallest
+            ordered = pick(end, present, key=value)
+            if ordered:
+                # The last value picked may be shared by documents left out; the page
+                # takes those with the lowest keys.
+                edge = value(ordered[-1])
+                ordered = [doc for doc in ordered if value(doc) != edge]
+                ordered.sort(key=key)
+                ordered.sort(key=value, reverse=browse.descending)
+                ordered += heapq.nsmallest(end - len(ordered), (doc for doc in present if value(doc) == edge), key=key)
+            if len(ordered) < end:
+                ordered += heapq.nsmallest(end - len(ordered), (doc for doc in listed if first[doc] < 0), key=key)
+            return ordered[browse.start:end]
+        order = self.descending_orders[browse.sort] if browse.descending else self.orders[browse.sort]
+        unsorted = self.unsorted[browse.sort]
+
+        def walk():
+            return chain(order, unsorted)
+
+        return list(islice(compress(walk(), map(matches.flags.__getitem__, walk())), browse.start, end))
+
+    def _facet(self, spec: FacetSpec, matches: Matches) -> List[tuple]:
+        column = self.columns[spec.field]
+        limit = spec.limit if spec.limit >= 0 else len(column.terms)
+        if limit == 0:
+            return []
+        # Going through the terms' postings stops early once the best terms are known.
+        # It is abandoned for counting the values of the matches one by one as soon as
+        # it has checked more rare-term documents than that would take.
+        budget = matches.count * (MULTI_VALUED_COST if column.multi_valued else 1) if spec.mincount > 0 else None
+        counts = self._facet_postings(spec, column, limit, matches, budget)
+        if counts is not None:
+            return counts
+        counts = [(column.terms[term], n) for term, n in column.tally(matches.listed()).items()
+                  if n >= spec.mincount and (not spec.contains or spec.contains in column.terms[term])]
+        return heapq.nsmallest(limit, counts, key=(lambda item: (-item[1], item[0])) if spec.by_count else None)
+
+    @staticmethod
+    def _facet_postings(spec: FacetSpec, column: Column, limit: int, matches: Matches,
+                        budget: Optional[int]) -> Optional[List[tuple]]:
+        counts = []
+        # A term's count is at most its document frequency, so by count, once that falls
+        # below the lowest of the best counts so far no later term can make the list.
+        best: List[int] = []
+        checked = 0
+        for term in column.by_df() if spec.by_count else column.by_term():
+            df = column.df[term]
+            if df < spec.mincount:
+                if spec.by_count:
+                    break
+                continue
+            if spec.by_count and len(best) == limit and df < best[0]:
+                break
+            value = column.terms[term]
+            if spec.contains and spec.contains not in value:
+                continue
+            posting = column.postings[term]
+            if budget is not None:
+                checked += TERM_COST if isinstance(posting, int) else TERM_COST + len(posting)
+                if checked > budget:
+                    return None
+            n = column.count(term, matches)
+            if n < spec.mincount:
+                continue
+            counts.append((value, n))
+            if not spec.by_count:
+                if len(counts) == limit:
+                    break
+            elif len(best) < limit:
+                heapq.heappush(best, n)
+            else:
+                heapq.heappushpop(best, n)
+        if spec.by_count:
+            counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts[:limit]
+
+    def memory(self) -> int:
+        documents = sum(sys.getsizeof(body) for body in self.documents if body is not None)
+        orders = sum(_size(order) for order in chain(self.orders.values(), self.descending_orders.values(),
+                                                     self.unsorted.values()))
+        columns = sum(column.memory() for column in chain(self.columns.values(), self.sorts.values()))
+        keys = sum(sys.getsizeof(key) for key in self.numbers)
+        return (documents + orders + columns + keys + sys.getsizeof(self.documents) + sys.getsizeof(self.keys)
+                + sys.getsizeof(self.numbers) + _size(self.versions) + sys.getsizeof(self.live))
+
+
+class BrowseIndex:
+    """
+    Answers filter-only searches of one resource (match-all q, field:"value" filters,
+    a sort on one of 'sort_fields' ended by the unique key) from a MetadataIndex, and
+    leaves everything else to Solr. The index counts the matches, picks the page and
+    counts the facets. The documents come from 'stored_fields' when the search asks
+    for no others; otherwise Solr is asked for the page's documents by their keys,
+    which also gets their highlighting. The index is loaded from Solr with a cursor
+    over every document and synced whenever the core reports a new index version:
+    documents with a newer _version_ are fetched and, if Solr then counts fewer
+    documents than the index, the ids still in Solr are listed to drop the deleted
+    ones. It only answers while it is synced with the core's current version, so after
+    an update (which makes the version unknown until Solr commits it) searches go to
+    Solr until the next sync.
+    """
+
+    def __init__(self, resource_type: str, enabled: bool, stored_fields: List[str], sort_fields: List[str],
+                 facets: List[dict], batch_size: int):
+        self.resource_type = resource_type
+        self.stored_fields = stored_fields
+        self.sort_fields = sort_fields
+        self.facets = facets
+        self.batch_size = max(1, batch_size)
+        self.enabled = enabled and bool(stored_fields) and bool(sort_fields)
+        self.index: Optional[MetadataIndex] = None
+        # The index version the index matches.
+        self._version: Optional[Tuple] = None
+        self._fetch: Optional[Fetch] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self.answered = 0
+        self.fetched = 0
+        self.passed = 0
+        self.loads = 0
+        self.syncs = 0
+        self.errors = 0
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.sync_seconds: Optional[float] = None
+
+    @property
+    def core(self) -> Optional[str]:
+        return implementation.get_core_name(self.resource_type)
+
+    def fields(self) -> List[str]:
+        fields = [UNIQUE_KEY, *self.stored_fields, *(spec["field"] for spec in self.facets), *self.sort_fields]
+        return list(dict.fromkeys(fields))
+
+    async def search(self, core: str, params: dict) -> Optional[bytes]:
+        """Solr's answer to a search, from the index; None if Solr has to be asked."""
+        if core != self.core or self.index is None:
+            return None
+        if self._version is None or index_versions.version(core) != self._version:
+            self.passed += 1
+            return None
+        browse = self.index.plan(params, self.facets)
+        if browse is None:
+            self.passed += 1
+            return None
+        return await self.answer(browse)
+
+    async def answer(self, browse: Browse) -> Optional[bytes]:
+        """The body for a search the index has planned; None if Solr has to be asked after all."""
+        started = time.perf_counter()
+        page = self.index.search(browse)
+        documents, sections = page.documents, []
+        if documents is None:
+            fetched = await self._documents(browse, page.keys)
+            if fetched is None:
+                self.passed += 1
+                return None
+            documents, sections = fetched
+            self.fetched += 1
+        self.answered += 1
+        header = {"status": 0, "QTime": int((time.perf_counter() - started) * 1000), "params": browse.params}
+        parts = [b'{"responseHeader":', dumps(header),
+                 b',"response":{"numFound":%d,"start":%d,"numFoundExact":true,"docs":[' % (page.count, browse.start),
+                 b",".join(documents), b"]}"]
+        for name, value in sections:
+            parts += [b',"', name.encode("utf-8"), b'":', dumps(value)]
+        # Last, as in Solr's responses (see responses.trailing_member).
+        if page.facet_counts is not None:
+            parts += [b',"facet_counts":', dumps(page.facet_counts)]
+        parts.append(b"}")
+        return b"".join(parts)
+
+    async def _documents(self, browse: Browse, keys: List[str]) -> Optional[Tuple[List[bytes], List[tuple]]]:
+        """
+        Fetch the page's documents, with their highlighting and Solr's other sections
+        for the same q, by their keys; None if any of them is gone.
+        """
+        fetch = browse.fetch
+        if not keys and all(str(_single(fetch.get(name, ""))).lower() == "false" for name in ("hl", "spellcheck")):
+            return [], []
+        if any("," in key for key in keys):
+            return None  # the terms parser splits on commas
+        params = {**fetch, "fq": f"{{!terms f={UNIQUE_KEY}}}{','.join(keys)}", "start": 0, "rows": len(keys),
+                  "facet": "false"}
+        result = loads(await self._fetch(self.resource_type, params))
+        docs = {str(doc.get(UNIQUE_KEY)): doc for doc in result.get("response", {}).get("docs", [])}
+        if len(docs) != len(keys) or any(key not in docs for key in keys):
+            return None
+        sections = []
+        for name, value in result.items():
+            if name in ("responseHeader", "response", "facet_counts"):
+                continue
+            if name == "highlighting" and isinstance(value, dict):
+                value = {key: value[key] for key in keys if key in value}
+            sections.append((name, value))
+        return [dumps(docs[key]) for key in keys], sections
+
+    def updated(self, core: str) -> None:
+        """Note an update of 'core' sent by this worker: stop answering until the next sync."""
+        if core == self.core and self._version is not None:
+            self._version = None
+            self._wake.set()
+
+    async def start(self, fetch: Fetch) -> None:
+        if not self.enabled:
+            return
+        if index_versions.interval <= 0:
+            logger.warning("BROWSE_INDEX needs INDEX_VERSION_INTERVAL > 0 to follow index updates; not loading it")
+            return
+        self._fetch = fetch
+        self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fetch = None
+
+    async def _export(self, params: dict, fields: List[str], rows: int):
+        params = {
+            **params,
+            "fl": ",".join(fields),
+            "rows": rows,
+            "sort": f"{UNIQUE_KEY} asc",
+            "cursorMark": "*",
+            "facet": "false",
+            "spellcheck": "false",
+            "hl": "false",
+        }
+        while True:
+            result = loads(await self._fetch(self.resource_type, params))
+            docs = result.get("response", {}).get("docs", [])
+            if docs:
+                yield docs
+            cursor = result.get("nextCursorMark")
+            if not docs or not cursor or cursor == params["cursorMark"]:
+                return
+            params["cursorMark"] = cursor
+
+    async def _count(self) -> int:
+        params = {"q": "*:*", "rows": 0, "facet": "false", "spellcheck": "false", "hl": "false"}
+        return int(loads(await self._fetch(self.resource_type, params))["response"]["numFound"])
+
+    async def load(self) -> None:
+        started = time.perf_counter()
+        index = MetadataIndex([spec["field"] for spec in self.facets], self.sort_fields, self.stored_fields)
+        async for docs in self._export({"q": "*:*"}, [*self.fields(), VERSION_FIELD], self.batch_size):
+            for document in docs:
+                index.add(document)
+        index.finish()
+        self.index = index
+        self.loads += 1
+        self.loaded_at = time.time()
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Loaded the browse index of {self.core}: {len(index)} documents, "
+                    f"{index.memory() // 1024} KiB, in {self.load_seconds}s")
+
+    async def sync(self) -> None:
+        index = self.index
+        if index is None or index.deleted > MAX_DELETED * max(1, len(index.documents)):
+            await self.load()
+            return
+        started = time.perf_counter()
+        since = max(0, index.max_version - VERSION_LOOKBACK)
+        fetch = {"q": "*:*", "fq": f"{VERSION_FIELD}:[{since} TO *]"}
+        async for docs in self._export(fetch, [*self.fields(), VERSION_FIELD], self.batch_size):
+            for document in docs:
+                index.add(document)
+        if await self._count() != len(index):
+            kept = set()
+            async for docs in self._export({"q": "*:*"}, [UNIQUE_KEY], ID_BATCH_SIZE):
+                kept.update(str(document[UNIQUE_KEY]) for document in docs)
+            for key in [key for key in index.numbers if key not in kept]:
+                index.remove(key)
+            if len(index) != len(kept):
+                # Documents older than the lookback are missing; start over.
+                await self.load()
+                return
+        index.finish()
+        self.syncs += 1
+        self.sync_seconds = round(time.perf_counter() - started, 3)
+
+    async def _sync_forever(self) -> None:
+        while True:
+            try:
+                version = index_versions.version(self.core)
+                if version is not None and version != self._version:
+                    await self.sync()
+                    # Only current if nothing was committed while syncing.
+                    if index_versions.version(self.core) == version:
+                        self._version = version
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Syncing the browse index of {self.core} failed: {getattr(e, 'detail', e)}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), index_versions.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "enabled": self.enabled,
+            "core": self.core,
+            "current": self._version is not None and index_versions.version(self.core) == self._version,
+            "documents": len(index) if index is not None else 0,
+            "deleted_slots": index.deleted if index is not None else 0,
+            "bytes": index.memory() if index is not None else 0,
+            "answered": self.answered,
+            "fetched_documents": self.fetched,
+            "passed_to_solr": self.passed,
+            "loads": self.loads,
+            "syncs": self.syncs,
+            "errors": self.errors,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "sync_seconds": self.sync_seconds,
+        }
+
+
+browse_index = BrowseIndex("items", BROWSE_INDEX, BROWSE_FIELDS, BROWSE_SORT_FIELDS, BROWSE_FACETS, EXPORT_BATCH_SIZE)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+import asyncio
+import codecs
+import json
+import time
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from frontend.lib import utils
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+# Longest token a chunk boundary can cut short without the parser reaching its end.
+_TRUNCATED_TAIL = 16
+
+
+class BulkParseError(ValueError):
+    pass
+
+
+async def iter_documents(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    Incrementally parse a request body holding either a JSON array of documents or
+    NDJSON (one document per line). Yields (raw_json, document, error) per document so
+    the raw text can be forwarded to Solr without re-serialising it. Only the documents
+    in the current chunk are held in memory. A malformed array raises BulkParseError as
+    soon as the bad token is read, with its character offset in the body.
+    """
+    stream = chunks.__aiter__()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    base = 0  # characters of the body dropped from the front of buf
+    eof = False
+
+    async def read_more() -> bool:
+        nonlocal buf, pos, base, eof
+        if eof:
+            return False
+        try:
+            text = text_decoder.decode(await stream.__anext__())
+        except StopAsyncIteration:
+            text = text_decoder.decode(b"", final=True)
+            eof = True
+        base += pos
+        buf = buf[pos:] + text
+        pos = 0
+        return True
+
+    def skip_whitespace() -> None:
+        nonlocal pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+
+    skip_whitespace()
+    while pos >= len(buf):
+        if not await read_more():
+            return
+        skip_whitespace()
+
+    if buf[pos] != "[":
+        search_from = pos
+        while True:
+            end = buf.find("\n", search_from)
+            if end == -1:
+                search_from = len(buf) - pos
+                if await read_more():
+                    continue
+                end = len(buf)
+            line = buf[pos:end].strip()
+            pos = search_from = end + 1
+            if line:
+                yield _parse(line)
+            if eof and pos >= len(buf):
+                return
+
+    pos += 1
+    # Elements must be separated by exactly one comma: after '[' a document or ']' may
+    # follow, after a document ',' or ']', and after ',' only a document.
+    expect_document, allow_end = True, True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            if not await read_more():
+                raise BulkParseError(f"Unterminated JSON array at offset {base + pos}")
+            continue
+        char = buf[pos]
+        if char == "]" and allow_end:
+            return
+        if not expect_document:
+            if char != ",":
+                raise BulkParseError(f"Invalid JSON at offset {base + pos}: Expecting ',' or ']'")
+            pos += 1
+            expect_document, allow_end = True, False
+            continue
+        if char in ",]":
+            raise BulkParseError(f"Invalid JSON at offset {base + pos}: Expecting value")
+        try:
+            document, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof or not _truncated(buf, e):
+                raise BulkParseError(f"Invalid JSON at offset {base + e.pos}: {e.msg}")
+            # Incomplete document: wait for the buffer to double before re-parsing so
+            # that large documents split over many chunks stay linear to parse.
+            needed = max(2 * (len(buf) - pos), 1)
+            while len(buf) - pos < needed and await read_more():
+                pass
+            continue
+        raw = buf[pos:end]
+        pos = end
+        expect_document, allow_end = False, True
+        if isinstance(document, dict):
+            yield raw, document, None
+        else:
+            yield raw, None, "Document is not a JSON object"
+
+
+def _truncated(buf: str, error: json.JSONDecodeError) -> bool:
+    # Whether the error may come from the end of the buffer cutting a document short:
+    # an open string, or a literal, number or escape in the last few characters.
+    return error.msg.startswith("Unterminated string") or len(buf) - error.pos <= _TRUNCATED_TAIL
+
+
+def _parse(raw: str) -> Tuple[str, Optional[dict], Optional[str]]:
+    try:
+        document = json.loads(raw)
+    except ValueError as e:
+        return raw, None, f"Invalid JSON: {e}"
+    if not isinstance(document, dict):
+        return raw, None, "Document is not a JSON object"
+    return raw, document, None
+
+
+class BulkIndexer:
+    """
+    Forward documents to Solr in batches of 'batch_size', with at most 'concurrency'
+    batches in flight. Adding a document blocks while the limit is reached, which
+    applies back-pressure to the request stream. If Solr rejects a batch, its documents
+    are retried one at a time so that a single bad document does not fail the rest.
+    """
+
+    def __init__(self, resource_type: str, params: dict, batch_size: int, concurrency: int,
+                 commit_within: Optional[int] = None):
+        self.resource_type = resource_type
+        self.params = {**params, **({"commitWithin": commit_within} if commit_within else {})}
+        self.batch_size = max(1, batch_size)
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.results: List[dict] = []
+        self.batches = 0
+        self.started = time.monotonic()
+        self._pending: List[Tuple[dict, str]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def record(self, result: dict) -> None:
+        self.results.append(result)
+
+    async def add(self, result: dict, raw: str) -> None:
+        self._pending.append((result, raw))
+        if len(self._pending) >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await self.semaphore.acquire()
+        self._tasks.append(asyncio.create_task(self._send(batch)))
+
+    async def _send(self, batch: List[Tuple[dict, str]]) -> None:
+        try:
+            self.batches += 1
+            error = await self._post([raw for _, raw in batch])
+            if error and len(batch) > 1:
+                for result, raw in batch:
+                    self._finish(result, await self._post([raw]))
+            else:
+                for result, _ in batch:
+                    self._finish(result, error)
+        finally:
+            self.semaphore.release()
+
+    async def _post(self, raws: List[str]) -> Optional[str]:
+        body = ("[" + ",".join(raws) + "]").encode("utf-8")
+        try:
+            await utils.put_item(self.resource_type, body, self.params)
+        except httpx.HTTPStatusError as e:
+            return e.response.text.strip()[-500:] or str(e)
+        except (httpx.HTTPError, HTTPException) as e:
+            return str(e) or e.__class__.__name__
+        return None
+
+    @staticmethod
+    def _finish(result: dict, error: Optional[str]) -> None:
+        if error:
+            result["status"] = "error"
+            result["error"] = error
+        else:
+            result["status"] = "ok"
+
+    async def close(self) -> dict:
+        await self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        return self.summary()
+
+    def summary(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        succeeded = sum(1 for r in self.results if r.get("status") == "ok")
+        return {
+            "documents": len(self.results),
+            "succeeded": succeeded,
+            "failed": len(self.results) - succeeded,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(len(self.results) / elapsed, 1) if elapsed > 0 else None,
+            "results": self.results,
+        }
+
+
+async def bulk_index(resource_type: str, chunks: AsyncIterator[bytes], params: dict,
+                     validate: Callable[[dict], Optional[str]], batch_size: int,
+                     concurrency: int, commit_within: Optional[int] = None) -> dict:
+    indexer = BulkIndexer(resource_type, params, batch_size, concurrency, commit_within)
+    index = 0
+    try:
+        async for raw, document, error in iter_documents(chunks):
+            result = {"index": index, "fileID": document.get("fileID") if document else None}
+            index += 1
+            indexer.record(result)
+            error = error or validate(document)
+            if error:
+                result.update(status="error", error=error)
+            else:
+                await indexer.add(result, raw)
+    except BulkParseError as e:
+        indexer.record({"index": index, "fileID": None, "status": "error", "error": str(e)})
+    return await indexer.close()
+
+
+async def bulk_delete(resource_type: str, ids: Iterable[str], batch_size: int,
+                      commit_within: Optional[int] = None) -> dict:
+    started = time.monotonic()
+    ids = [str(i) for i in ids]
+    results = []
+    for offset in range(0, len(ids), max(1, batch_size)):
+        batch = ids[offset:offset + batch_size]
+        try:
+            status_code = await utils.delete_ids(resource_type, batch, commit_within)
+            error = None if status_code < 300 else f"Solr returned {status_code}"
+        except (httpx.HTTPError, HTTPException) as e:
+            error = str(e) or e.__class__.__name__
+        for i in batch:
+            results.append({"id": i, "status": "error", "error": error} if error else {"id": i, "status": "ok"})
+    elapsed = time.monotonic() - started
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "documents": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else None,
+        "results": results,
+    }
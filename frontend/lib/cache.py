@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+def canonical_key(core: str, handler: str, params: dict) -> Tuple:
+    """
+    Build a hashable key for a Solr request. Filter queries are order-independent in
+    Solr, so 'fq' is sorted; every other list keeps its order.
+    """
+    items = []
+    for name in sorted(params):
+        value = params[name]
+        if isinstance(value, (list, tuple)):
+            value = tuple(sorted(map(str, value))) if name == "fq" else tuple(map(str, value))
+        else:
+            value = str(value)
+        items.append((name, value))
+    return core, handler, tuple(items)
+
+
+class ResultCache:
+    """
+    LRU cache of raw Solr response bodies bounded by entry count, total bytes and a
+    TTL. Entries are tagged with their core so an index update only drops the results
+    for the core it modified.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = max_entries > 0 and max_bytes > 0 and ttl > 0
+        self._entries: "OrderedDict[Hashable, Tuple[str, float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[1] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: Hashable, core: str, value: bytes) -> None:
+        size = len(value)
+        if not self.enabled or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (core, time.monotonic() + self.ttl, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, core: Optional[str] = None) -> int:
+        keys = [k for k, entry in self._entries.items() if core is None or entry[0] == core]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
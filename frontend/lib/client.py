@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import asyncio
+import ssl
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from frontend.defaults import *
+from frontend.lib import deadline
+from frontend.lib.limiter import limiters
+from frontend.lib.routing import Node, hedger, router
+from frontend.lib.versions import index_versions
+
+# Failures after which a read is retried on another replica. Timeouts waiting for a
+# response are not retried, so that a slow query is not run on every replica in turn.
+FAILOVER_STATUSES = (502, 503, 504)
+FAILOVER_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+# One pooled client per kind ("read" for searches, "write" for updates) and
+# per worker. They are opened in the FastAPI lifespan and reused by every
+# request, so connections to Solr are kept alive between calls.
+_clients: Dict[str, httpx.AsyncClient] = {}
+_counters: Dict[str, Dict[str, int]] = {}
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _http2_enabled() -> bool:
+    if not SOLR_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("SOLR_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def ssl_context() -> ssl.SSLContext:
+    """
+    TLS settings shared by both clients. Loading the CA bundle is a good part of a
+    worker's startup, so it is done once per process, or in the gunicorn master when
+    preloading.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def _build_client(kind: str) -> httpx.AsyncClient:
+    if kind == "write":
+        pool_size, timeout = SOLR_WRITE_POOL_SIZE, SOLR_WRITE_TIMEOUT
+    else:
+        pool_size, timeout = SOLR_READ_POOL_SIZE, SOLR_READ_TIMEOUT
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=SOLR_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=SOLR_CONNECT_TIMEOUT),
+        limits=limits,
+        verify=ssl_context(),
+        http2=_http2_enabled(),
+    )
+
+
+async def start_clients() -> None:
+    for kind in ("read", "write"):
+        get_client(kind)
+    await router.start(get_client("read"))
+    await index_versions.start(get_client("read"))
+
+
+async def close_clients() -> None:
+    await index_versions.stop()
+    await router.stop()
+    for kind in list(_clients):
+        await _clients.pop(kind).aclose()
+
+
+def get_client(kind: str = "read") -> httpx.AsyncClient:
+    """
+    Return the shared client for 'read' or 'write' traffic. Custom routers should use
+    this rather than opening their own httpx.AsyncClient. The client is created on
+    first use if the app lifespan has not started it (e.g. in scripts).
+    """
+    client = _clients.get(kind)
+    if client is None or client.is_closed:
+        client = _clients[kind] = _build_client(kind)
+        _counters[kind] = {"requests": 0, "errors": 0, "in_flight": 0}
+    return client
+
+
+async def send(kind: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request with the shared client for 'kind'. A 'url' that is a path (e.g.
+    "/solr/epsilon/spell") is sent to a Solr node chosen by the router: a read replica
+    for "read", the write node for "write". GET requests that fail to connect or get
+    a 502/503/504 are retried on the other replicas. Calls wait for a slot in the
+    lane's concurrency limit first (see frontend/lib/limiter.py).
+    """
+    client = get_client(kind)
+    deadline.check()
+    limiter = limiters[kind] if LIMITER else None
+    if limiter:
+        await limiter.acquire()
+    counters = _counters[kind]
+    counters["requests"] += 1
+    counters["in_flight"] += 1
+    started = time.monotonic()
+    outcome = "ok"
+    try:
+        left = deadline.check()
+        if left is not None and "timeout" not in kwargs:
+            kwargs["timeout"] = httpx.Timeout(left, connect=min(SOLR_CONNECT_TIMEOUT, left))
+        if not url.startswith("/"):
+            response = await client.request(method, url, **kwargs)
+        elif kind == "read" and method == "GET" and hedger.delay() is not None:
+            response = await _send_hedged(client, url, **kwargs)
+        else:
+            response = await _send_routed(client, kind, method, url, **kwargs)
+        if response.status_code >= 500:
+            outcome = "failed"
+        elif kind == "read":
+            hedger.record(time.monotonic() - started)
+        return response
+    except httpx.HTTPError:
+        counters["errors"] += 1
+        outcome = "failed"
+        raise
+    except BaseException:
+        # Cancelled, or the deadline passed while queued: no latency sample.
+        outcome = "cancelled"
+        raise
+    finally:
+        counters["in_flight"] -= 1
+        if limiter:
+            limiter.release(time.monotonic() - started, outcome)
+
+
+async def _send_hedged(client: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+    """
+    Send a search and, if it has not answered after the hedger's delay and the hedge
+    budget allows, a second copy (usually to another replica, as the first one is busy
+    with the original). The first good response wins and the other copy is cancelled.
+    """
+    primary = asyncio.ensure_future(_send_routed(client, "read", "GET", path, **kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=hedger.delay())
+    if done or not hedger.spend():
+        return await primary
+    hedge = asyncio.ensure_future(_send_routed(client, "read", "GET", path, **kwargs))
+    pending = {primary, hedge}
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    if task is hedge:
+                        hedger.hedge_wins += 1
+                    return task.result()
+            if not pending:
+                # Both copies failed; report the original's outcome.
+                return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _send_routed(client: httpx.AsyncClient, kind: str, method: str, path: str, **kwargs) -> httpx.Response:
+    tried: List[Node] = []
+    while True:
+        node = router.pick(kind, exclude=tried)
+        tried.append(node)
+        can_retry = method == "GET" and router.pick(kind, exclude=tried) is not None
+        node.outstanding += 1
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, f"{node.url}{path}", **kwargs)
+        except httpx.TransportError as e:
+            router.record(node, time.perf_counter() - started, ok=False)
+            if can_retry and isinstance(e, FAILOVER_ERRORS):
+                logger.warning(f"Retrying {path} on another Solr node after {type(e).__name__} from {node.url}")
+                continue
+            raise
+        finally:
+            node.outstanding -= 1
+        failed = response.status_code >= 500
+        router.record(node, time.perf_counter() - started, ok=not failed)
+        if failed and can_retry and response.status_code in FAILOVER_STATUSES:
+            await response.aclose()
+            continue
+        return response
+
+
+def _connection_stats(client: httpx.AsyncClient) -> Optional[dict]:
+    # httpcore does not expose a public stats API, so inspect the pool defensively.
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return None
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "queued": len(getattr(pool, "_requests", [])),
+    }
+
+
+def pool_stats() -> dict:
+    stats = {}
+    for kind, client in _clients.items():
+        stats[kind] = {
+            **_counters.get(kind, {}),
+            "closed": client.is_closed,
+            "pool": _connection_stats(client),
+        }
+    return stats
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+from typing import Set
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        return data if more_body else data + self.compressor.finish()
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """Content codings an Accept-Encoding header allows (those without q=0)."""
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Compress responses of at least 'minimum_size' bytes with brotli, when it is
+    installed and the client accepts it, or else gzip. Streaming responses are
+    compressed as they go. A strong ETag on a compressed response is made weak, since
+    the compressed bytes differ from the identity representation it was computed for.
+    So is the ETag of a 304 to a client that accepts compression, to match the
+    compressed response it revalidates.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, gzip_level: int, brotli_quality: int) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif "gzip" in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            # Still adds Vary: Accept-Encoding, so shared caches keep the encodings apart.
+            responder = IdentityResponder(self.app, self.minimum_size)
+        compressing = type(responder) is not IdentityResponder
+        await responder(scope, receive, _weak_etag_when_encoded(send, compressing))
+
+
+def _weak_etag_when_encoded(send: Send, compressing: bool) -> Send:
+    async def wrapped(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            etag = headers.get("etag")
+            # A 304 has no body to encode; weaken it as the 200 it stands for would be.
+            encoded = "content-encoding" in headers or (compressing and message["status"] == 304)
+            if etag and not etag.startswith("W/") and encoded:
+                headers["ETag"] = f"W/{etag}"
+        await send(message)
+    return wrapped
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import contextvars
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from frontend.defaults import *
+
+# Per-request time budgets. A client can send DEADLINE_HEADER (milliseconds it is
+# prepared to wait) and a route can set a default with
+#     @router.get("/path", dependencies=[Depends(route_deadline(10))])
+# The tighter of the two applies from the moment the request arrived. Calls to Solr
+# use what is left as their httpx timeout and searches pass it on as timeAllowed.
+
+
+class Deadline:
+    __slots__ = ("start", "requested", "default")
+
+    def __init__(self, requested: Optional[float]):
+        self.start = time.monotonic()
+        self.requested = requested
+        self.default: Optional[float] = None
+
+    def remaining(self) -> Optional[float]:
+        budgets = [b for b in (self.requested, self.default) if b is not None]
+        if not budgets:
+            return None
+        return self.start + min(budgets) - time.monotonic()
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None if it has no deadline."""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def check() -> Optional[float]:
+    """remaining(), raising 504 if the deadline has already passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+    return left
+
+
+def route_deadline(seconds: float) -> Callable[[], Awaitable[None]]:
+    """FastAPI dependency giving a route a default deadline of 'seconds'."""
+    async def set_default() -> None:
+        deadline = _current.get()
+        if deadline is not None:
+            deadline.default = seconds
+    return set_default
+
+
+def _parse(value: bytes) -> Optional[float]:
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        return None
+    return milliseconds / 1000 if milliseconds > 0 else None
+
+
+class DeadlineMiddleware:
+    """ASGI middleware starting the deadline clock for each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.header = DEADLINE_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requested = next((_parse(value) for name, value in scope["headers"] if name == self.header), None)
+        token = _current.set(Deadline(requested))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+from typing import AsyncIterator, List
+
+from fastapi import HTTPException
+
+from frontend.lib import utils
+from frontend.lib.responses import dumps, loads
+from frontend.lib.translation import FIRST_CURSOR, REUSE_FACETS, total_sort
+from frontend.defaults import *
+
+# Parameters that only matter for an interactive result page.
+EXPORT_OVERRIDES = {"facet": "false", "spellcheck": "false", "hl": "false"}
+
+
+def export_params(solr_params: dict, fields: List[str], batch_size: int) -> dict:
+    params = {
+        name: value for name, value in solr_params.items()
+        if name not in ("start", "rows", "cursorMark", "fl", REUSE_FACETS) and not name.startswith("f.")
+    }
+    params.update(EXPORT_OVERRIDES)
+    params["fl"] = ",".join(fields)
+    params["rows"] = batch_size
+    params["sort"] = total_sort(params.get("sort"))
+    params["cursorMark"] = FIRST_CURSOR
+    return params
+
+
+async def export_documents(resource_type: str, solr_params: dict, fields: List[str],
+                           batch_size: int) -> AsyncIterator[bytes]:
+    """
+    Walk a result set with Solr cursors and yield each document as a line of NDJSON.
+    Only one page of 'batch_size' documents is held at a time. Errors after the
+    response has started are reported as a final {"error": ...} line.
+    """
+    params = export_params(solr_params, fields, batch_size)
+    exported = 0
+    while True:
+        try:
+            body = await utils.fetch_search(resource_type, params)
+        except HTTPException as e:
+            logger.error(f"Export of {resource_type} stopped after {exported} documents: {e.detail}")
+            yield dumps({"error": e.detail, "exported": exported}) + b"\n"
+            return
+        result = loads(body)
+        docs = result.get("response", {}).get("docs", [])
+        if docs:
+            yield b"".join(dumps(doc) + b"\n" for doc in docs)
+            exported += len(docs)
+        next_cursor = result.get("nextCursorMark")
+        if not docs or not next_cursor or next_cursor == params["cursorMark"]:
+            return
+        params["cursorMark"] = next_cursor
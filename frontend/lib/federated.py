@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import asyncio
+from typing import Any, Dict, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from frontend.lib import utils
+from frontend.lib.responses import SolrResponse, dumps, num_found
+
+
+async def search_resources(models: Dict[str, Type[BaseModel]], query: Dict[str, Any]) -> SolrResponse:
+    """
+    Translate 'query' with the model of each resource in 'models' and search all of
+    their cores at once. Returns {"numFound": {resource: n}, "results": {resource: ...}}
+    where each result is Solr's response, as that resource's own search would serve
+    it, or an {"status": ..., "error": ...} object. The searches share the request's
+    deadline, so a core that has not answered by then fails with 504 on its own while
+    the others are returned.
+    """
+
+    async def run(resource: str, model: Type[BaseModel]) -> bytes:
+        try:
+            solr_params = model.model_validate(query).get_solr_params()
+            response = await utils.get_response(resource, **solr_params)
+            return bytes(response.body)
+        except ValidationError as e:
+            return dumps({"status": 422, "error": e.errors(include_url=False, include_context=False)})
+        except HTTPException as e:
+            return dumps({"status": e.status_code, "error": e.detail})
+
+    bodies = await asyncio.gather(*(run(resource, model) for resource, model in models.items()))
+    counts = {resource: num_found(body) for resource, body in zip(models, bodies)}
+    results = b",".join(dumps(resource) + b":" + body for resource, body in zip(models, bodies))
+    # Solr's bodies are embedded as they are rather than parsed and re-encoded.
+    return SolrResponse(b'{"numFound":' + dumps(counts) + b',"results":{' + results + b"}}")
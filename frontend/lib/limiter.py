@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from fastapi import HTTPException
+
+from frontend.defaults import *
+from frontend.lib import deadline, metrics
+
+# Multiplier applied to the limit when Solr is slow or failing.
+BACKOFF = 0.9
+# Weights of the newest sample in the short- and long-term latency averages. The
+# long-term average stands for Solr's normal latency for the current query mix.
+SHORT_ALPHA = 0.2
+LONG_ALPHA = 0.01
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one lane of Solr traffic. While the short-term latency
+    average stays within 'tolerance' x the long-term one, each call that completes
+    while at least half the limit is in use raises the limit by 1/limit (about one per
+    round trip), so a limit that traffic does not reach stops growing. When Solr slows
+    down past that, or a call times out or gets a 5xx, the limit drops by 10%, at most
+    once per round trip. Comparing averages, rather than single calls, keeps the
+    naturally wide spread of Solr query times from looking like overload. Calls over
+    the limit wait in a FIFO queue of at most 'queue_size'. Callers that find the
+    queue full, or that wait longer than 'queue_timeout', get a 503 with Retry-After.
+    """
+
+    def __init__(self, lane: str, min_limit: int, max_limit: int, queue_size: int, queue_timeout: float,
+                 tolerance: float):
+        self.lane = lane
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(self.max_limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.baseline = None
+        self.latency = None
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.decreases = 0
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            metrics.registry.inc("epsilon_limiter_shed_total", (("lane", self.lane), ("reason", "queue_full")))
+            raise self._shed("queue full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        timeout = self.queue_timeout
+        left = deadline.remaining()
+        if left is not None:
+            timeout = max(0.0, min(timeout, left))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on.
+                self.in_flight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                metrics.registry.inc("epsilon_limiter_shed_total", (("lane", self.lane), ("reason", "queue_timeout")))
+                raise self._shed("queue timeout")
+            raise
+        self.admitted += 1
+
+    def release(self, seconds: float, outcome: str) -> None:
+        """
+        Give back a slot after a call that took 'seconds'. 'outcome' is "ok", "failed"
+        (Solr timed out or answered 5xx) or "cancelled" (the caller went away).
+        """
+        self.in_flight -= 1
+        if outcome == "cancelled":
+            self._wake()
+            return
+        now = time.monotonic()
+        if outcome == "ok":
+            self.latency = seconds if self.latency is None else SHORT_ALPHA * seconds + (1 - SHORT_ALPHA) * self.latency
+            self.baseline = seconds if self.baseline is None else LONG_ALPHA * seconds + (1 - LONG_ALPHA) * self.baseline
+        if outcome != "ok" or self.latency > self.tolerance * self.baseline:
+            self._decrease(now)
+        elif self.in_flight + 1 >= int(self.limit) / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _decrease(self, now: float) -> None:
+        # One decrease per round trip, so a burst of slow calls counts once.
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * BACKOFF)
+        self.decreases += 1
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _remove(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _shed(self, reason: str) -> HTTPException:
+        # Time for the queue ahead to drain at the current rate.
+        per_call = self.latency or 1.0
+        retry_after = max(1, math.ceil(len(self._waiters) * per_call / max(1, int(self.limit))))
+        logger.warning(f"Shedding {self.lane} request to Solr ({reason}, limit {int(self.limit)}, "
+                       f"{len(self._waiters)} queued)")
+        return HTTPException(status_code=503, detail=f"Solr {self.lane} capacity exceeded ({reason})",
+                             headers={"Retry-After": str(retry_after)})
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "baseline_ms": round(self.baseline * 1000, 2) if self.baseline is not None else None,
+            "admitted": self.admitted,
+            "waited": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "decreases": self.decreases,
+        }
+
+
+# Searches and index updates get separate lanes, so neither can starve the other.
+limiters: Dict[str, AdaptiveLimiter] = {
+    "read": AdaptiveLimiter("search", LIMIT_MIN, SEARCH_LIMIT_MAX, LIMIT_QUEUE_SIZE, SEARCH_QUEUE_TIMEOUT,
+                            LIMIT_LATENCY_TOLERANCE),
+    "write": AdaptiveLimiter("index", LIMIT_MIN, INDEX_LIMIT_MAX, LIMIT_QUEUE_SIZE, INDEX_QUEUE_TIMEOUT,
+                             LIMIT_LATENCY_TOLERANCE),
+}
+
+
+def limiter_stats() -> dict:
+    return {limiter.lane: limiter.stats() for limiter in limiters.values()}
+
+
+def _collect(registry: metrics.Registry) -> None:
+    for limiter in limiters.values():
+        labels = (("lane", limiter.lane),)
+        registry.set("epsilon_limiter_limit", labels, int(limiter.limit))
+        registry.set("epsilon_limiter_in_flight", labels, limiter.in_flight)
+        registry.set("epsilon_limiter_queued", labels, len(limiter._waiters))
+
+
+metrics.registry.collectors.append(_collect)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+import asyncio
+import contextvars
+import fcntl
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from frontend.defaults import *
+
+# Request and Solr timings, kept per worker and exported in the Prometheus text format
+# at /metrics. Each worker writes a snapshot of its metrics to METRICS_DIR every
+# METRICS_INTERVAL seconds; /metrics sums its own live metrics with the other
+# workers' snapshots. A worker holds a lock on its own snapshot while it runs, and a
+# new worker folds the snapshots of exited workers into its own, so totals survive
+# worker restarts.
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+HELP = {
+    "epsilon_request_duration_seconds": ("histogram", "Time from receiving a request to sending the last of the response."),
+    "epsilon_stage_duration_seconds": ("histogram", "Time spent in each stage of handling a request."),
+    "epsilon_solr_duration_seconds": ("histogram", "Duration of calls to Solr."),
+    "epsilon_solr_requests_total": ("counter", "Calls to Solr by operation, core and HTTP status ('error' if no response)."),
+    "epsilon_limiter_limit": ("gauge", "Current concurrency limit on Solr calls, summed over workers."),
+    "epsilon_limiter_in_flight": ("gauge", "Solr calls in progress."),
+    "epsilon_limiter_queued": ("gauge", "Solr calls waiting for a slot."),
+    "epsilon_limiter_shed_total": ("counter", "Calls refused with 503 because the queue was full or the wait too long."),
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        # Called before each snapshot, to set gauges from state kept elsewhere.
+        self.collectors: List[Callable[["Registry"], None]] = []
+
+    def inc(self, name: str, labels: Labels, amount: float = 1) -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, labels: Labels, value: float) -> None:
+        self.gauges[(name, labels)] = value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        for collector in self.collectors:
+            collector(self)
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+            "gauges": [[name, labels, value] for (name, labels), value in self.gauges.items()],
+            "histograms": [[name, labels, h.counts, h.sum, h.count] for (name, labels), h in self.histograms.items()],
+        }
+
+    def merge(self, snapshot: dict) -> None:
+        for name, labels, value in snapshot.get("counters", []):
+            self.inc(name, tuple(map(tuple, labels)), value)
+        for name, labels, value in snapshot.get("gauges", []):
+            # Gauges are summed too: the total limit or queue over all workers.
+            key = (name, tuple(map(tuple, labels)))
+            self.gauges[key] = self.gauges.get(key, 0) + value
+        for name, labels, counts, total, count in snapshot.get("histograms", []):
+            key = (name, tuple(map(tuple, labels)))
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            if len(counts) != len(histogram.counts):
+                continue  # written with different buckets
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.sum += total
+            histogram.count += count
+
+    def render(self) -> str:
+        series: Dict[str, List[str]] = {}
+        for (name, labels), value in sorted([*self.counters.items(), *self.gauges.items()]):
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        out = []
+        for name, lines in series.items():
+            kind, text = HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """
+    Stage timings for the request being handled. 'mark(stage)' attributes the time
+    since the previous mark (or the start of the request) to 'stage'; the stage()
+    context manager times a block and moves the mark to its end.
+    """
+    __slots__ = ("start", "last", "stages", "core")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.core = ""
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def server_timing(self) -> bytes:
+        parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(parts).encode("latin-1")
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def mark(stage: str) -> None:
+    """Attribute the time since the last mark to 'stage' (no-op outside a request)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.mark(stage)
+
+
+@contextmanager
+def stage(name: str, core: Optional[str] = None) -> Iterator[None]:
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    if core:
+        timings.core = core
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.last = time.perf_counter()
+        timings.add(name, timings.last - started)
+
+
+def solr_stage(seconds: float, qtime: Optional[float]) -> None:
+    """
+    Record a wait for a Solr search, split into the QTime Solr reports and the rest
+    ('transfer': network, queueing and Solr's work outside the query itself).
+    """
+    timings = _current.get()
+    if timings is None:
+        return
+    if qtime is None or qtime > seconds:
+        timings.add("solr", seconds)
+    else:
+        timings.add("qtime", qtime)
+        timings.add("transfer", seconds - qtime)
+    timings.last = time.perf_counter()
+
+
+def solr_call(operation: str, core: str, status: str, seconds: float) -> None:
+    registry.inc("epsilon_solr_requests_total", (("operation", operation), ("core", core), ("status", status)))
+    registry.observe("epsilon_solr_duration_seconds", (("operation", operation), ("core", core)), seconds)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request. It adds a Server-Timing header with the
+    stages recorded while handling the request; the time from the last stage to the
+    start of the response is reported as 'encode' (or 'handler' if no stage was
+    recorded).
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = "500"
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                timings.mark("encode" if timings.stages else "handler")
+                if self.server_timing:
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", timings.server_timing())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            elapsed = time.perf_counter() - timings.start
+            registry.observe("epsilon_request_duration_seconds",
+                             (("route", route), ("method", scope["method"]), ("status", status)), elapsed)
+            for name, seconds in timings.stages:
+                registry.observe("epsilon_stage_duration_seconds",
+                                 (("route", route), ("stage", name), ("core", timings.core)), seconds)
+
+
+class SnapshotStore:
+    """Per-worker snapshot files, locked by their owner, following write_behind.Spool."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        self._lock = open(os.path.join(directory, f"metrics-{os.getpid()}.lock"), "w")
+        fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def claim_orphans(self) -> List[dict]:
+        snapshots = []
+        for lock_path in glob.glob(os.path.join(self.directory, "metrics-*.lock")):
+            if lock_path == self._lock.name:
+                continue
+            try:
+                with open(lock_path, "w") as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # still owned by a live worker
+                    path = lock_path[:-len(".lock")] + ".json"
+                    if os.path.exists(path):
+                        with open(path, encoding="utf-8") as f:
+                            snapshots.append(json.load(f))
+                        os.unlink(path)
+                    os.unlink(lock_path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not claim metrics snapshot {lock_path}: {e}")
+        return snapshots
+
+    def write(self, snapshot: dict) -> None:
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(temp, self.path)
+
+    def others(self) -> List[dict]:
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            if path == self.path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass  # removed or replaced while listing
+        return snapshots
+
+    def close(self) -> None:
+        self._lock.close()
+
+
+_store: Optional[SnapshotStore] = None
+_task: Optional[asyncio.Task] = None
+
+
+async def start() -> None:
+    global _store, _task
+    if not METRICS_DIR:
+        return
+    try:
+        _store = SnapshotStore(METRICS_DIR)
+    except OSError as e:
+        logger.warning(f"Metrics from other workers are unavailable ({METRICS_DIR}: {e})")
+        return
+    for snapshot in _store.claim_orphans():
+        registry.merge(snapshot)
+    _store.write(registry.snapshot())
+    _task = asyncio.create_task(_run())
+
+
+async def stop() -> None:
+    global _store, _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _store is not None:
+        _store.write(registry.snapshot())
+        _store.close()
+        _store = None
+
+
+async def _run() -> None:
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        try:
+            _store.write(registry.snapshot())
+        except OSError as e:
+            logger.error(f"Could not write metrics snapshot: {e}")
+
+
+def render() -> str:
+    """Metrics for every worker in the Prometheus text format."""
+    combined = Registry()
+    combined.merge(registry.snapshot())
+    if _store is not None:
+        for snapshot in _store.others():
+            combined.merge(snapshot)
+    return combined.render()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import json
+import re
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Search responses are served as the bytes Solr sent wherever possible. When a
+# response has to change, only the responseHeader object (and the end of the body,
+# for additions) is decoded and rewritten; the documents and facet trees are copied
+# through untouched. Anything that cannot be patched that way is parsed and
+# re-encoded with orjson when it is installed.
+
+RESPONSE_HEADER = b'"responseHeader"'
+NEXT_CURSOR_MARK = b'"nextCursorMark"'
+FACET_COUNTS = b'"facet_counts"'
+QTIME = re.compile(rb'"QTime"\s*:\s*(\d+)')
+NUM_FOUND = re.compile(rb'"numFound"\s*:\s*(\d+)')
+PARTIAL_RESULTS = re.compile(rb'"partialResults"\s*:\s*true')
+# Solr writes responseHeader first, so it is only searched for near the start.
+HEADER_SCAN_BYTES = 256
+# Bytes decoded at a time while looking for the end of a JSON value.
+DECODE_WINDOW = 2048
+
+_decoder = json.JSONDecoder()
+
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class SolrResponse(Response):
+    """A JSON response whose body is already-encoded bytes (usually straight from Solr)."""
+    media_type = "application/json"
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _value_at(body: bytes, start: int) -> Optional[Tuple[Any, int]]:
+    """Decode the JSON value starting at body[start:], returning it and its end offset."""
+    window = DECODE_WINDOW
+    while True:
+        chunk = body[start:start + window]
+        text = chunk.decode("utf-8", errors="ignore")
+        stripped = len(text) - len(text.lstrip())
+        try:
+            value, end = _decoder.raw_decode(text, stripped)
+        except ValueError:
+            if start + window >= len(body):
+                return None
+            window *= 4
+            continue
+        return value, start + len(text[:end].encode("utf-8"))
+
+
+def _member_value(body: bytes, key: bytes, position: int) -> Optional[Tuple[Any, int, int]]:
+    """For '"key": value' at 'position', return the value and its byte span."""
+    colon = body.find(b":", position + len(key))
+    if colon < 0:
+        return None
+    value_start = colon + 1
+    while body[value_start:value_start + 1] in (b" ", b"\n", b"\r", b"\t"):
+        value_start += 1
+    found = _value_at(body, value_start)
+    if found is None:
+        return None
+    value, value_end = found
+    return value, value_start, value_end
+
+
+def _splice(body: bytes, start: int, end: int, replacement: bytes) -> bytes:
+    # memoryview slices avoid copying the body more than once.
+    view = memoryview(body)
+    return b"".join((view[:start], replacement, view[end:]))
+
+
+def patch_header(body: bytes, update: Callable[[dict], None]) -> Optional[bytes]:
+    """Apply 'update' to the responseHeader object in place, or return None if it cannot be found."""
+    position = body.find(RESPONSE_HEADER, 0, HEADER_SCAN_BYTES)
+    if position < 0:
+        return None
+    found = _member_value(body, RESPONSE_HEADER, position)
+    if found is None or not isinstance(found[0], dict):
+        return None
+    header, start, end = found
+    update(header)
+    return _splice(body, start, end, dumps(header))
+
+
+def append_member(body: bytes, name: str, value: Any) -> Optional[bytes]:
+    """Add a top-level member just before the closing brace of the response object."""
+    end = len(body.rstrip())
+    if end == 0 or body[end - 1:end] != b"}":
+        return None
+    return _splice(body, end - 1, end - 1, b"," + dumps(name) + b":" + dumps(value))
+
+
+def solr_qtime(body: bytes) -> Optional[float]:
+    """The QTime in a Solr response header, in seconds."""
+    match = QTIME.search(body, 0, HEADER_SCAN_BYTES)
+    return int(match.group(1)) / 1000 if match else None
+
+
+def num_found(body: bytes) -> Optional[int]:
+    """response.numFound, the first numFound in a Solr body (keys inside strings are escaped)."""
+    match = NUM_FOUND.search(body)
+    return int(match.group(1)) if match else None
+
+
+def partial_results(body: bytes) -> bool:
+    """Whether Solr flagged the response as partial (it hit timeAllowed)."""
+    return PARTIAL_RESULTS.search(body, 0, HEADER_SCAN_BYTES) is not None
+
+
+def trailing_member(body: bytes, key: bytes) -> Any:
+    """
+    The value of a member Solr writes after the documents (nextCursorMark,
+    facet_counts), found by searching from the end. None if it is absent.
+    """
+    position = body.rfind(key)
+    # Skip matches inside document strings, where the quotes are escaped.
+    while position > 0 and body[position - 1:position] == b"\\":
+        position = body.rfind(key, 0, position)
+    if position < 0:
+        return None
+    found = _member_value(body, key, position)
+    return found[0] if found else None
+
+
+def next_cursor_mark(body: bytes) -> Optional[str]:
+    cursor_mark = trailing_member(body, NEXT_CURSOR_MARK)
+    return cursor_mark if isinstance(cursor_mark, str) else None
+
+
+def passthrough_response(body: bytes, original_sort: Optional[str] = None,
+                         next_cursor: Optional[Callable[[str], str]] = None) -> Optional[Response]:
+    """
+    Serve a Solr search body with the same changes utils.update_solr_response makes,
+    without decoding the documents. Returns None when the body is not laid out as
+    expected, in which case the caller parses it instead.
+    """
+    if original_sort is not None:
+        def set_sort(header: dict) -> None:
+            params = header.get("params")
+            if isinstance(params, dict) and "sort" in params:
+                params["sort"] = original_sort
+        body = patch_header(body, set_sort)
+        if body is None:
+            return None
+    if next_cursor is not None:
+        cursor_mark = next_cursor_mark(body)
+        if cursor_mark is not None:
+            body = append_member(body, "nextCursor", next_cursor(cursor_mark))
+            if body is None:
+                return None
+    return SolrResponse(body)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+import asyncio
+import random
+import time
+from typing import Collection, Dict, List, Optional
+
+import httpx
+
+from frontend.defaults import *
+
+# Weight of the newest sample in a node's latency average.
+EWMA_ALPHA = 0.3
+# Added to every latency average so that nodes without samples still compare by load.
+LATENCY_FLOOR = 0.001
+
+UP, EJECTED, HALF_OPEN = "up", "ejected", "half-open"
+
+
+class Node:
+    """One Solr endpoint, with its load, latency and circuit-breaker state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.state = UP
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        if self.state == EJECTED and now >= self.ejected_until:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # One trial request at a time until the node proves itself again.
+            return self.outstanding == 0
+        return self.state == UP
+
+    def score(self) -> float:
+        return (self.outstanding + 1) * ((self.ewma or 0.0) + LATENCY_FLOOR)
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.ewma * 1000, 2) if self.ewma is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "ejections": self.ejections,
+        }
+
+
+class SolrRouter:
+    """
+    Chooses the Solr node for each request. Reads go to the available replica with the
+    lowest (outstanding requests + 1) x latency average; writes go to the write node.
+    After 'failure_threshold' consecutive failures (connection errors or 5xx) a node is
+    ejected for 'eject_seconds'. It is then half-open: a successful health probe or
+    trial request re-admits it, a failure ejects it again. If every replica is ejected,
+    the one due back soonest is used anyway, so a single-node setup behaves as before.
+    """
+
+    def __init__(self, read_urls: List[str], write_url: str, failure_threshold: int, eject_seconds: float,
+                 health_interval: float, health_path: str):
+        self.read_nodes = [Node(url) for url in read_urls]
+        existing = {node.url: node for node in self.read_nodes}
+        self.write_node = existing.get(write_url) or Node(write_url)
+        self.failure_threshold = max(1, failure_threshold)
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.health_path = health_path
+        self._task: Optional[asyncio.Task] = None
+
+    def nodes(self) -> List[Node]:
+        if self.write_node in self.read_nodes:
+            return list(self.read_nodes)
+        return [*self.read_nodes, self.write_node]
+
+    def pick(self, kind: str, exclude: Collection[Node] = ()) -> Optional[Node]:
+        if kind == "write":
+            return self.write_node if self.write_node not in exclude else None
+        candidates = [node for node in self.read_nodes if node not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        available = [node for node in candidates if node.available(now)]
+        if not available:
+            return min(candidates, key=lambda node: node.ejected_until)
+        best = min(node.score() for node in available)
+        return random.choice([node for node in available if node.score() == best])
+
+    def record(self, node: Node, seconds: float, ok: bool) -> None:
+        node.requests += 1
+        if ok:
+            node.ewma = seconds if node.ewma is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * node.ewma
+            self._succeeded(node)
+        else:
+            node.errors += 1
+            self._failed(node)
+
+    def _succeeded(self, node: Node) -> None:
+        if node.state != UP:
+            logger.info(f"Solr node {node.url} re-admitted")
+        node.state = UP
+        node.failures = 0
+
+    def _failed(self, node: Node) -> None:
+        node.failures += 1
+        if node.state == HALF_OPEN or (node.state == UP and node.failures >= self.failure_threshold):
+            node.state = EJECTED
+            node.ejected_until = time.monotonic() + self.eject_seconds
+            node.ejections += 1
+            logger.warning(f"Solr node {node.url} ejected after {node.failures} consecutive failures")
+
+    async def start(self, client: httpx.AsyncClient) -> None:
+        if self.health_interval > 0 and len(self.nodes()) > 1:
+            self._task = asyncio.create_task(self._probe_forever(client))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def probe(self, client: httpx.AsyncClient) -> None:
+        await asyncio.gather(*(self._probe(client, node) for node in self.nodes()))
+
+    async def _probe(self, client: httpx.AsyncClient, node: Node) -> None:
+        try:
+            response = await client.get(f"{node.url}{self.health_path}", timeout=SOLR_CONNECT_TIMEOUT)
+            ok = response.is_success
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            if node.state != UP or node.failures:
+                self._succeeded(node)
+        elif node.state != EJECTED:
+            self._failed(node)
+
+    async def _probe_forever(self, client: httpx.AsyncClient) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.probe(client)
+            except Exception as e:
+                logger.error(f"Solr health probe failed: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "read": [node.stats() for node in self.read_nodes],
+            "write": self.write_node.stats(),
+        }
+
+
+class Hedger:
+    """
+    Decides when a slow search is worth a second copy. The delay is the 'percentile'
+    of recent search latencies (recomputed every RECOMPUTE_EVERY samples). Hedges are
+    paid for from a budget that earns 'budget_ratio' tokens per search, up to
+    'budget_cap', so hedging adds at most that fraction of extra load.
+    """
+    SAMPLES = 1000
+    RECOMPUTE_EVERY = 50
+    MIN_SAMPLES = 100
+
+    def __init__(self, enabled: bool, percentile: float, min_delay: float, budget_ratio: float, budget_cap: float):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.budget_cap = budget_cap
+        self.tokens = budget_cap
+        self._samples: List[float] = []
+        self._next = 0
+        self._recorded = 0
+        self._delay: Optional[float] = None
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    def record(self, seconds: float) -> None:
+        if len(self._samples) < self.SAMPLES:
+            self._samples.append(seconds)
+        else:
+            self._samples[self._next] = seconds
+            self._next = (self._next + 1) % self.SAMPLES
+        self._recorded += 1
+        self.tokens = min(self.budget_cap, self.tokens + self.budget_ratio)
+        if len(self._samples) >= self.MIN_SAMPLES and self._recorded % self.RECOMPUTE_EVERY == 0:
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            self._delay = max(self.min_delay, ordered[index])
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge at all."""
+        return self._delay if self.enabled else None
+
+    def spend(self) -> bool:
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.hedged += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "delay_ms": round(self._delay * 1000, 2) if self._delay is not None else None,
+            "budget": round(self.tokens, 2),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "denied": self.denied,
+        }
+
+
+router = SolrRouter(SOLR_READ_URLS, SOLR_WRITE_URL, SOLR_FAILURE_THRESHOLD, SOLR_EJECT_SECONDS,
+                    SOLR_HEALTH_INTERVAL, SOLR_HEALTH_PATH)
+hedger = Hedger(HEDGE, HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_BUDGET_RATIO, HEDGE_BUDGET_CAP)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into one in-flight call. The first
+    caller starts the call in its own task and every caller, including the first,
+    awaits that task, so the result or exception is delivered to all of them. A caller
+    that is cancelled (e.g. its client disconnected) does not cancel the call for the
+    others; the call is only cancelled once no caller is left waiting for it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+        self.errors = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            self.calls += 1
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Nobody is waiting any more; stop the call and let the next caller start afresh.
+                self._forget(key, call)
+                call.task.cancel()
+                self.abandoned += 1
+
+    def forget(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Make later callers start a new call instead of joining matching in-flight ones."""
+        for key in [k for k in self._calls if predicate(k)]:
+            del self._calls[key]
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _finished(self, key: Hashable, call: _Call) -> None:
+        self._forget(key, call)
+        if not call.task.cancelled() and call.task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.calls,
+            "upstream_calls_saved": self.shared,
+            "errors": self.errors,
+            "abandoned": self.abandoned,
+        }
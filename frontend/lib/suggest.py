@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+import asyncio
+import bisect
+import heapq
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from frontend.defaults import *
+from frontend.lib import utils
+from frontend.lib.responses import loads
+
+# Sorts after every character, to find the end of a prefix range.
+PREFIX_END = "\U0010ffff"
+# Word starts indexed per term, so "hooker" and "joseph" both find "Hooker, Joseph Dalton".
+MAX_KEYS_PER_TERM = 4
+# The best terms for each prefix looked up are kept until a term under it changes, for
+# at most CACHE_ENTRIES prefixes.
+CACHE_ENTRIES = 5000
+MAX_LIMIT = 50
+# Documents whose values are remembered until the next load, so that indexing or
+# deleting them again adjusts the counts; the least recently indexed are forgotten.
+MAX_TRACKED_DOCUMENTS = 10000
+
+
+def fold(text: str) -> str:
+    """Lower-case 'text' and strip its accents, so 'muller' finds 'Müller'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def word_starts(folded: str) -> List[str]:
+    keys = [folded]
+    for i in range(1, len(folded)):
+        if len(keys) >= MAX_KEYS_PER_TERM:
+            break
+        if folded[i].isalnum() and not folded[i - 1].isalnum():
+            keys.append(folded[i:])
+    return keys
+
+
+class PrefixIndex:
+    """
+    Terms with counts, searchable by the prefix of any of their first few words. The
+    folded keys are one sorted list with a parallel list of term ids, so a lookup is
+    two binary searches plus a pick of the most frequent terms in the range.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._key_terms: List[int] = []
+        self._terms: List[Optional[str]] = []
+        self._counts: List[int] = []
+        self._ids: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._cache: Dict[str, List[int]] = {}
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self, pairs: Iterable[Tuple[str, int]]) -> None:
+        """Replace the contents with (term, count) pairs."""
+        self._terms, self._counts, self._ids, self._free = [], [], {}, []
+        entries = []
+        for term, count in pairs:
+            if count <= 0 or term in self._ids:
+                continue
+            term_id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+            self._counts.append(count)
+            entries.extend((key, term_id) for key in word_starts(fold(term)))
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._key_terms = [term_id for _, term_id in entries]
+        self._cache.clear()
+
+    def add(self, term: str, delta: int) -> None:
+        """Change the count of 'term' by 'delta', adding or removing the term as needed."""
+        term_id = self._ids.get(term)
+        if term_id is None:
+            if delta <= 0:
+                return
+            term_id = self._free.pop() if self._free else len(self._terms)
+            if term_id == len(self._terms):
+                self._terms.append(term)
+                self._counts.append(delta)
+            else:
+                self._terms[term_id] = term
+                self._counts[term_id] = delta
+            self._ids[term] = term_id
+            for key in word_starts(fold(term)):
+                position = bisect.bisect_left(self._keys, key)
+                self._keys.insert(position, key)
+                self._key_terms.insert(position, term_id)
+        else:
+            self._counts[term_id] += delta
+            if self._counts[term_id] <= 0:
+                self._remove(term, term_id)
+        if self._cache:
+            for key in word_starts(fold(term)):
+                for length in range(1, len(key) + 1):
+                    self._cache.pop(key[:length], None)
+
+    def _remove(self, term: str, term_id: int) -> None:
+        for key in word_starts(fold(term)):
+            position = bisect.bisect_left(self._keys, key)
+            while position < len(self._keys) and self._keys[position] == key:
+                if self._key_terms[position] == term_id:
+                    del self._keys[position]
+                    del self._key_terms[position]
+                    break
+                position += 1
+        del self._ids[term]
+        self._terms[term_id] = None
+        self._counts[term_id] = 0
+        self._free.append(term_id)
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """The 'limit' (at most MAX_LIMIT) most frequent terms with a word starting with 'prefix'."""
+        key = fold(prefix.strip())
+        if not key:
+            return []
+        best = self._cache.get(key)
+        if best is None:
+            best = self._best(key)
+            if len(self._cache) >= CACHE_ENTRIES:
+                self._cache.clear()
+            self._cache[key] = best
+        return [(self._terms[term_id], self._counts[term_id]) for term_id in best[:limit]]
+
+    def _best(self, key: str) -> List[int]:
+        low = bisect.bisect_left(self._keys, key)
+        high = bisect.bisect_left(self._keys, key + PREFIX_END, low)
+        counts, terms = self._counts, self._terms
+        best = heapq.nlargest(MAX_LIMIT, set(self._key_terms[low:high]), key=counts.__getitem__)
+        return sorted(best, key=lambda term_id: (-counts[term_id], terms[term_id]))
+
+    def memory(self) -> int:
+        """Approximate bytes held, counting the strings and the lists that refer to them."""
+        strings = sum(sys.getsizeof(key) for key in self._keys)
+        strings += sum(sys.getsizeof(term) for term in self._ids)
+        lists = 8 * (len(self._keys) + len(self._key_terms) + len(self._terms) + len(self._counts))
+        cache = sum(sys.getsizeof(best) for best in self._cache.values())
+        return strings + lists + cache + sys.getsizeof(self._ids)
+
+
+class Suggester:
+    """
+    Autocomplete over the values of some facet fields. Each index is loaded from
+    Solr's facet counts at startup and every 'refresh_interval' seconds after that. In
+    between, documents indexed or deleted through this worker adjust the counts.
+    The loaded counts may already include a document, so the first time one is
+    indexed only values missing from the index are added; after that its values are
+    tracked, and indexing or deleting it again changes the counts by the difference.
+    The next refresh picks up the rest.
+    """
+
+    def __init__(self, resource_type: str, fields: Dict[str, str], max_terms: int, refresh_interval: float):
+        self.resource_type = resource_type
+        self.fields = fields
+        self.max_terms = max_terms
+        self.refresh_interval = refresh_interval
+        self.indexes = {name: PrefixIndex() for name in fields}
+        # fileID -> {name: values} for documents indexed since the last load
+        self._documents: "OrderedDict[str, Dict[str, frozenset]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fields) and self.max_terms > 0
+
+    async def start(self) -> None:
+        if self.enabled:
+            self._task = asyncio.create_task(self._refresh_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self) -> None:
+        started = time.perf_counter()
+        params = {
+            "q": "*:*",
+            "rows": 0,
+            "facet": "true",
+            "facet.field": list(self.fields.values()),
+            "facet.limit": self.max_terms,
+            "facet.mincount": 1,
+            "facet.sort": "count",
+            "spellcheck": "false",
+            "hl": "false",
+        }
+        result = loads(await utils.fetch_search(self.resource_type, params))
+        for name, field in self.fields.items():
+            self.indexes[name].load((value["value"], value["count"]) for value in utils.facet_counts(result, field))
+        self._documents.clear()
+        self.loaded_at = time.time()
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Loaded suggestions for {', '.join(self.fields)} in {self.load_seconds}s")
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Loading suggestions failed: {getattr(e, 'detail', e)}")
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    def suggest(self, name: str, prefix: str, limit: int) -> List[dict]:
+        return [{"value": term, "count": count} for term, count in self.indexes[name].search(prefix, limit)]
+
+    def document_indexed(self, document: dict) -> None:
+        """Count the suggested fields of a document sent to Solr, replacing its earlier values."""
+        if not self.enabled:
+            return
+        file_id = document.get("fileID")
+        values = {name: self._terms(document.get(field)) for name, field in self.fields.items()}
+        previous = self._documents.pop(file_id, None) if file_id else None
+        for name, index in self.indexes.items():
+            new = values[name]
+            if previous is None:
+                for term in new:
+                    if term not in index:
+                        index.add(term, 1)
+                continue
+            old = previous[name]
+            for term in new - old:
+                index.add(term, 1)
+            for term in old - new:
+                index.add(term, -1)
+        if file_id:
+            self._documents[file_id] = values
+            if len(self._documents) > MAX_TRACKED_DOCUMENTS:
+                self._documents.popitem(last=False)
+
+    @staticmethod
+    def _terms(value) -> frozenset:
+        # Facet values are strings and numbers; anything else cannot be suggested.
+        return frozenset(str(term) for term in utils.listify(value if value is not None else [])
+                         if isinstance(term, (str, int, float)) and not isinstance(term, bool))
+
+    def document_deleted(self, file_id: str) -> None:
+        if not self.enabled:
+            return
+        previous = self._documents.pop(file_id, None)
+        for name, terms in (previous or {}).items():
+            for term in terms:
+                self.indexes[name].add(term, -1)
+
+    def stats(self) -> dict:
+        return {
+            "fields": {name: {"terms": len(index), "bytes": index.memory()} for name, index in self.indexes.items()},
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "tracked_documents": len(self._documents),
+        }
+
+
+suggester = Suggester("items", SUGGEST_FIELDS, SUGGEST_MAX_TERMS, SUGGEST_REFRESH_INTERVAL)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+import base64
+import binascii
+import re
+from typing import Any, Callable, Dict, Iterable, List, Match, Optional, Sequence, Tuple
+
+from frontend.lib import utils
+
+# Table-driven translation of API parameters into Solr parameters, shared by
+# CoreQueryParams and the custom models. Everything here is compiled once at
+# import; per request, each parameter name is resolved to a handler with a dict
+# lookup and the handler appends to the query being built.
+
+QUOTED_VALUE = re.compile(r'^"(.+?)"$')
+FACET_ALIAS = re.compile(r"^f[0-9]+-(.+?)$")
+DATE_FACET_ALIAS = re.compile(r"^f[0-9]+-date$")
+FACET_FIELD = re.compile(r"^facet-.+?$")
+
+DATE_FACET_FIELDS = ("facet-decade", "facet-decade-year", "facet-decade-year-month", "facet-decade-year-month-day")
+DATE_FACET_CONTAINS = tuple(f"f.{field}.facet.contains" for field in DATE_FACET_FIELDS)
+DATE_SEPARATOR = "::"
+
+# Values of the 'facets' parameter other than a list of facet names.
+ALL_FACETS = "all"
+NO_FACETS = "none"
+SAME_FACETS = "same"
+# Name under which the top of the date hierarchy can be selected.
+DATE_FACET = "date"
+# Control parameter, never sent to Solr: reuse the facets of the search's first page.
+REUSE_FACETS = "reuse_facets"
+
+# Solr's uniqueKey, which ends every sort so that equal sort values have a fixed order.
+UNIQUE_KEY = "id"
+FIRST_CURSOR = "*"
+
+EARLIEST_DATE = "1609-02-12"
+LATEST_DATE = "2009-02-12"
+
+# Bound on the number of distinct dynamic parameter names (e.g. f7-volume) remembered.
+MAX_RESOLVED_NAMES = 1024
+
+
+class Translation:
+    """Accumulates the parts of a Solr query while parameters are translated."""
+    __slots__ = ("q", "fq", "solr_params", "filters", "extra", "cursor")
+
+    def __init__(self, fq: Optional[List[str]] = None):
+        self.q: List[str] = []
+        self.fq: List[str] = fq if fq is not None else []
+        self.solr_params: Dict[str, Any] = {}
+        self.filters: Dict[str, str] = {}
+        self.extra: Dict[str, str] = {}
+        self.cursor: Optional[str] = None
+
+    def result(self) -> dict:
+        final_q = " ".join(self.q)
+        solr_params = self.solr_params
+        solr_params["q"] = "*" if final_q in ("['*']", "['']") else final_q
+        solr_params["fq"] = self.fq
+        if self.filters:
+            solr_params.update(self.filters)
+        if self.extra:
+            solr_params.update(self.extra)
+        if self.cursor is not None:
+            # Cursors replace offsets and need a sort that ends on the unique key.
+            solr_params.pop("start", None)
+            solr_params["sort"] = total_sort(solr_params.get("sort"))
+            solr_params["cursorMark"] = self.cursor
+        elif solr_params.get("sort"):
+            # Otherwise Solr orders ties by internal document ids, which differ between
+            # replicas and change as segments merge, so pages could repeat or skip them.
+            solr_params["sort"] = total_sort(solr_params["sort"])
+        return solr_params
+
+
+Handler = Callable[[Translation, str, Any], None]
+HandlerFactory = Callable[[Match], Handler]
+
+
+class QueryTranslator:
+    """
+    Resolves parameter names to handlers: first by exact name, then by the first
+    matching pattern, otherwise 'default'. Pattern entries are factories that build a
+    handler specialised for the matched name; the result is remembered so each
+    dynamic name is matched against the patterns only once.
+    """
+
+    def __init__(self, handlers: Dict[str, Handler], patterns: Sequence[Tuple[re.Pattern, HandlerFactory]],
+                 default: Handler):
+        self.handlers = dict(handlers)
+        self.patterns = tuple(patterns)
+        self.default = default
+        self._resolved: Dict[str, Handler] = {}
+
+    def resolve(self, name: str) -> Handler:
+        handler = self.handlers.get(name) or self._resolved.get(name)
+        if handler is None:
+            handler = self.default
+            for pattern, factory in self.patterns:
+                match = pattern.match(name)
+                if match:
+                    handler = factory(match)
+                    break
+            if len(self._resolved) < MAX_RESOLVED_NAMES:
+                self._resolved[name] = handler
+        return handler
+
+    def translate(self, params: Dict[str, Any], translation: Optional[Translation] = None) -> dict:
+        translation = translation if translation is not None else Translation()
+        resolve = self.resolve
+        for name, value in params.items():
+            if value:
+                resolve(name)(translation, name, value)
+        return translation.result()
+
+
+def encode_cursor(cursor_mark: str) -> str:
+    """Wrap a Solr cursorMark in the opaque token handed to clients."""
+    return base64.urlsafe_b64encode(cursor_mark.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> str:
+    if token == FIRST_CURSOR:
+        return FIRST_CURSOR
+    try:
+        cursor_mark = base64.b64decode(token + "=" * (-len(token) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        cursor_mark = None
+    if not cursor_mark:
+        raise ValueError("Invalid cursor")
+    return cursor_mark
+
+
+def total_sort(sort: Optional[str]) -> str:
+    sort = sort or "score desc"
+    if any(clause.split()[0] == UNIQUE_KEY for clause in sort.split(",") if clause.strip()):
+        return sort
+    return f"{sort}, {UNIQUE_KEY} asc"
+
+
+def unquote(value: str) -> str:
+    return QUOTED_VALUE.sub(r"\1", value) if value[:1] == '"' else value
+
+
+# Handlers
+
+def skip(translation: Translation, name: str, value: Any) -> None:
+    pass
+
+
+def field_query(translation: Translation, name: str, value: Any) -> None:
+    translation.q.append(f"{name}:({utils.stringify(value)})")
+
+
+def keyword_query(translation: Translation, name: str, value: Any) -> None:
+    translation.q.append(f"({utils.stringify(value)})")
+
+
+def cursor_mark(translation: Translation, name: str, value: Any) -> None:
+    translation.cursor = value
+
+
+def page_start(default_rows: int) -> Handler:
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        translation.solr_params["start"] = (int(value) - 1) * default_rows
+    return handler
+
+
+def lookup(key: str, table: Dict[str, Any], fallback: Any = None) -> Handler:
+    """Set solr_params[key] from a prebuilt table of accepted values."""
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        translation.solr_params[key] = table.get(value, fallback)
+    return handler
+
+
+def extra_params(table: Dict[str, Dict[str, str]]) -> Handler:
+    """Add a prebuilt group of Solr parameters for each accepted value."""
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        params = table.get(value)
+        if params:
+            translation.extra.update(params)
+    return handler
+
+
+# Handler factories for patterns
+
+def facet_field(match: Match) -> Handler:
+    """facet-<name>=value(s): one filter query per value on the same field."""
+    solr_name = match.string
+
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        for x in utils.listify(value):
+            translation.fq.append(f'{solr_name}:"{unquote(x)}"')
+    return handler
+
+
+def facet_value(match: Match) -> Handler:
+    """facet-<name>=value: a filter query on a single value."""
+    solr_name = match.string
+
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        translation.fq.append(f'{solr_name}:"{unquote(value)}"')
+    return handler
+
+
+def facet_alias(match: Match) -> Handler:
+    """f<n>-<name>=value(s): filter queries on the facet-<name> field."""
+    solr_name = f"facet-{match.group(1)}"
+
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        for x in utils.listify(value):
+            translation.fq.append(f'{solr_name}:"{unquote(x)}"')
+    return handler
+
+
+def date_facet(match: Match) -> Handler:
+    """
+    f<n>-date=decade[::year[::month[::day]]]: filter on the matching level of the date
+    facet hierarchy and restrict each level's facet values to the selected path.
+    """
+    def handler(translation: Translation, name: str, value: Any) -> None:
+        for date in sorted(utils.listify(value)):
+            date_clean = unquote(date)
+            date_parts = date_clean.split("::")
+            num_parts = len(date_parts)
+            for index, key in enumerate(DATE_FACET_CONTAINS):
+                if index >= num_parts - 1:
+                    translation.filters[key] = date_clean
+                else:
+                    translation.filters[key] = "::".join(date_parts[: index + 1])
+            solr_name = DATE_FACET_FIELDS[min(num_parts - 1, len(DATE_FACET_FIELDS) - 1)]
+            translation.fq.append(f'{solr_name}:"{date_clean}"')
+    return handler
+
+
+# Builders
+
+def date_range_filter(date_min: Optional[str], date_max: Optional[str], search_date_type: Optional[str]) -> Optional[str]:
+    """
+    Build the dateRange filter query for a date search. 'date_min' and 'date_max' are
+    partial ISO dates (e.g. '1868' or '1868-03'); open ends of a range default to the
+    earliest and latest dates in the corpus.
+    """
+    predicate_type = "Within"
+    if date_max or search_date_type == "between":
+        predicate_type = "Intersects"
+        date_range = f"[{date_min or EARLIEST_DATE} TO {date_max or LATEST_DATE}]"
+    elif search_date_type == "after":
+        predicate_type = "Intersects"
+        date_range = f"[{date_min} TO {LATEST_DATE}]"
+    elif search_date_type == "before":
+        predicate_type = "Intersects"
+        date_range = f"[{EARLIEST_DATE} TO {date_min}]"
+    else:
+        date_range = date_min
+    if date_range:
+        return f"{{!field f=dateRange op={predicate_type}}}{date_range}"
+    return None
+
+
+def facet_catalog(facet_query: dict) -> Dict[str, dict]:
+    """
+    Index the top-level facets of a JSON facet definition (such as config.facet_query)
+    by name: the field without its 'facet-' prefix. 'date' is the top of the date
+    hierarchy; the levels below it are served by date_histogram_params.
+    """
+    catalog = {}
+    for spec in facet_query.get("facet", {}).values():
+        field = spec.get("field")
+        if field:
+            catalog[field[len("facet-"):] if field.startswith("facet-") else field] = spec
+            if field == DATE_FACET_FIELDS[0]:
+                catalog[DATE_FACET] = spec
+    return catalog
+
+
+def facet_specs(facet_query: dict) -> List[dict]:
+    """
+    Every terms facet of a JSON facet definition, nested ones included, as
+    {"field", "limit", "sort"} with "sort" either "index" or "count".
+    """
+    specs = []
+    for spec in facet_query.get("facet", {}).values():
+        if spec.get("field"):
+            specs.append({
+                "field": spec["field"],
+                "limit": int(spec.get("limit", 100)),
+                "sort": "index" if "index" in spec.get("sort", {}) else "count",
+            })
+        specs.extend(facet_specs(spec))
+    return specs
+
+
+def select_facets(solr_params: dict, selection: Any, catalog: Dict[str, dict]) -> dict:
+    """
+    Limit the facets Solr computes for a search. 'selection' is 'all' (the request
+    handler's defaults), 'none', 'same' (the facets of the first page of the same
+    search, see utils) or a list of names from 'catalog'. Named facets are requested
+    one level deep, with the limit and sort of their definition.
+    """
+    if not selection or selection == ALL_FACETS:
+        return solr_params
+    if selection == SAME_FACETS:
+        solr_params[REUSE_FACETS] = True
+        return solr_params
+    fields = [] if selection == NO_FACETS else list(dict.fromkeys(catalog[name]["field"] for name in selection))
+    for field, key in zip(DATE_FACET_FIELDS, DATE_FACET_CONTAINS):
+        if field not in fields:
+            solr_params.pop(key, None)
+    if not fields:
+        solr_params["facet"] = "false"
+        return solr_params
+    solr_params["facet"] = "true"
+    solr_params["facet.field"] = fields
+    for name in selection:
+        spec = catalog[name]
+        field = spec["field"]
+        if "limit" in spec:
+            solr_params.setdefault(f"f.{field}.facet.limit", str(spec["limit"]))
+        if "sort" in spec:
+            solr_params.setdefault(f"f.{field}.facet.sort", "index" if "index" in spec["sort"] else "count")
+    return solr_params
+
+
+def date_histogram_params(solr_params: dict, path: Optional[str]) -> Tuple[dict, str]:
+    """
+    Solr parameters for one level of the date facet hierarchy: the children of 'path'
+    (decade[::year[::month]]) among the documents matching 'solr_params', or the
+    decades when 'path' is empty. Returns the parameters and the field to read.
+    """
+    parts = path.split(DATE_SEPARATOR) if path else []
+    if len(parts) >= len(DATE_FACET_FIELDS) or not all(parts):
+        raise ValueError(f"Invalid date path: {path}")
+    field = DATE_FACET_FIELDS[len(parts)]
+    params = facet_only_params(solr_params, field, "index")
+    params[f"f.{field}.facet.limit"] = "-1"
+    if parts:
+        params["fq"] = [*params.get("fq", []), f'{DATE_FACET_FIELDS[len(parts) - 1]}:"{path}"']
+        params[f"f.{field}.facet.prefix"] = f"{path}{DATE_SEPARATOR}"
+    return params, field
+
+
+def facet_values_params(solr_params: dict, field: str, offset: int, limit: int, prefix: Optional[str],
+                        sort: str) -> dict:
+    """
+    Solr parameters for one page of the values of 'field' among the documents matching
+    'solr_params'. One value more than 'limit' is asked for, to tell whether there are more.
+    """
+    params = facet_only_params(solr_params, field, sort)
+    params[f"f.{field}.facet.offset"] = str(offset)
+    params[f"f.{field}.facet.limit"] = str(limit + 1)
+    if prefix:
+        params[f"f.{field}.facet.prefix"] = prefix
+    return params
+
+
+def facet_only_params(solr_params: dict, field: str, sort: str) -> dict:
+    """The filters of a search, asking Solr for the facet values of 'field' and no documents."""
+    params = {
+        name: value for name, value in solr_params.items()
+        if name not in ("start", "cursorMark", "sort", "facet.field", REUSE_FACETS) and not name.startswith("f.")
+    }
+    params.update({
+        "rows": 0,
+        "facet": "true",
+        "facet.field": field,
+        f"f.{field}.facet.sort": sort,
+        f"f.{field}.facet.mincount": "1",
+        "spellcheck": "false",
+        "hl": "false",
+    })
+    return params
+
+
+def field_preset_params(presets: Dict[str, dict], snippet_size: int) -> Dict[str, Dict[str, str]]:
+    """
+    Solr parameters for each named field preset (see config.FIELD_PRESETS): its field
+    list, and highlighting of its snippet fields with one fragment of 'snippet_size'
+    characters each. Used as an extra_params table.
+    """
+    table = {}
+    for name, preset in presets.items():
+        params = {"fl": ",".join(preset["fl"])}
+        snippets = preset.get("snippets")
+        if snippets:
+            params.update({
+                "hl": "true",
+                "hl.method": "unified",
+                "hl.fl": ",".join(snippets),
+                "hl.snippets": "1",
+                "hl.fragsize": str(snippet_size),
+                "hl.defaultSummary": "true",
+            })
+        else:
+            params["hl"] = "false"
+        table[name] = params
+    return table
+
+
+def skip_all(names: Iterable[str]) -> Dict[str, Handler]:
+    return {name: skip for name in names}
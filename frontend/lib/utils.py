@@ -1,10 +1,40 @@
 #!/usr/bin/env python3
-from typing import Union, List
+import asyncio
+import hashlib
+import time
+from typing import Union, List, Optional, Dict
 
 import httpx
 from fastapi import HTTPException
+from fastapi.responses import Response
 
 from frontend.defaults import *
+from frontend.lib import deadline, metrics
+from frontend.lib.cache import ResultCache, canonical_key
+from frontend.lib.client import get_client, start_clients, close_clients, pool_stats, send
+from frontend.lib.limiter import limiter_stats
+from frontend.lib.routing import hedger, router as solr_router
+from frontend.lib.responses import (
+    FACET_COUNTS, FastJSONResponse, append_member, passthrough_response, loads, partial_results, solr_qtime,
+    trailing_member,
+)
+from frontend.lib.singleflight import SingleFlight
+from frontend.lib.versions import index_versions
+from frontend.lib.warmer import stale_age, warmer
+from frontend.lib.browse import browse_index
+from frontend.lib.translation import (
+    FIRST_CURSOR, REUSE_FACETS, date_histogram_params, encode_cursor, facet_values_params,
+)
+
+# Per-worker cache of raw /spell responses, invalidated per core on index updates.
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_BYTES, RESULT_CACHE_TTL)
+# Pages of facet values (GET /items/facets/{name}), kept only briefly.
+facet_cache = ResultCache(FACET_CACHE_ENTRIES, FACET_CACHE_BYTES, FACET_CACHE_TTL)
+# Identical concurrent searches share one upstream call.
+search_flights = SingleFlight()
+# Bumped on every index update of a core, so that searches started before an update
+# are neither joined by later callers nor cached.
+_core_generation: Dict[str, int] = {}
 
 
 def stringify(p: Union[List, any]) -> str:
@@ -29,11 +59,24 @@ def update_solr_response(result: dict, kwargs: dict) -> dict:
     """
     If the keyword 'original_sort' is present in kwargs and the response contains a sort
     parameter in its responseHeader, update that sort value with kwargs["original_sort"].
+    For cursor requests, add the opaque token for the next page as 'nextCursor'.
     """
     if "original_sort" in kwargs and "sort" in result.get("responseHeader", {}).get("params", {}):
         result["responseHeader"]["params"]["sort"] = kwargs["original_sort"]
+    if "cursorMark" in kwargs and "nextCursorMark" in result:
+        result["nextCursor"] = encode_cursor(result["nextCursorMark"])
     return result
 
+def invalidate_core(core: str) -> None:
+    _core_generation[core] = _core_generation.get(core, 0) + 1
+    index_versions.updated(core)
+    warmer.updated(core)
+    browse_index.updated(core)
+    search_flights.forget(lambda key: key[0][0] == core)
+    dropped = result_cache.invalidate(core) + facet_cache.invalidate(core)
+    if dropped:
+        logger.debug(f"Dropped {dropped} cached results for core {core}")
+
 
 async def delete_resource(resource_type: str, file_id: str) -> int:
     core = implementation.get_core_name(resource_type)
@@ -41,51 +84,272 @@ async def delete_resource(resource_type: str, file_id: str) -> int:
         return INTERNAL_ERROR_STATUS_CODE
     delete_query = f"fileID:{file_id}"
     delete_cmd = {"delete": {"query": delete_query}}
-    async with httpx.AsyncClient(timeout=60) as client:
-        response = await client.post(
-            f"{SOLR_URL}/solr/{core}/update",
-            headers={"Content-Type": "application/json; charset=UTF-8"},
-            json=delete_cmd,
-        )
+    response = await _send(
+        "delete", core, "write", "POST",
+        f"/solr/{core}/update",
+        headers={"Content-Type": "application/json; charset=UTF-8"},
+        json=delete_cmd,
+    )
+    if response.is_success:
+        invalidate_core(core)
     return response.status_code
 
-async def get_request(resource_type: str, **kwargs):
+def quote_term(value: str) -> str:
+    """Quote a value for the standard query parser so that it matches literally."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+async def delete_file_ids(resource_type: str, file_ids: List[str]) -> int:
+    """
+    Delete several items with a single delete-by-query, so Solr reopens its searcher
+    once for the whole batch rather than once per fileID.
+    """
+    core = implementation.get_core_name(resource_type)
+    if not core:
+        return INTERNAL_ERROR_STATUS_CODE
+    delete_query = f"fileID:({' OR '.join(map(quote_term, file_ids))})"
+    response = await _send(
+        "delete", core, "write", "POST",
+        f"/solr/{core}/update",
+        headers={"Content-Type": "application/json; charset=UTF-8"},
+        json={"delete": {"query": delete_query}},
+    )
+    if response.is_success:
+        invalidate_core(core)
+    return response.status_code
+
+async def delete_ids(resource_type: str, ids: List[str], commit_within: Optional[int] = None) -> int:
+    core = implementation.get_core_name(resource_type)
+    if not core:
+        return INTERNAL_ERROR_STATUS_CODE
+    response = await _send(
+        "delete", core, "write", "POST",
+        f"/solr/{core}/update",
+        params={"commitWithin": commit_within} if commit_within else None,
+        headers={"Content-Type": "application/json; charset=UTF-8"},
+        json={"delete": list(ids)},
+    )
+    if response.is_success:
+        invalidate_core(core)
+    return response.status_code
+
+async def get_request(resource_type: str, **kwargs) -> dict:
+    body = await _search(resource_type, kwargs)
+    return update_solr_response(loads(body), kwargs)
+
+def response_etag(resource_type: str, kwargs: dict) -> Optional[str]:
+    """
+    Strong ETag for a search: its canonical parameters plus the index version of every
+    replica of the core. None while the index version is unknown.
+    """
+    core = implementation.get_core_name(resource_type)
+    version = index_versions.version(core) if core else None
+    if version is None:
+        return None
+    digest = hashlib.blake2b(repr((canonical_key(core, "spell", kwargs), version)).encode("utf-8"), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" matches "x".
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+async def get_response(resource_type: str, if_none_match: Optional[str] = None, **kwargs) -> Response:
+    """
+    Like get_request, but return the search as a ready-made response. Solr's bytes are
+    passed through, with only the response header patched where needed, instead of
+    being parsed and re-encoded. Pass the request's If-None-Match header to answer 304
+    without asking Solr when the client already has the current result.
+    """
+    etag = response_etag(resource_type, kwargs)
+    cache_headers = {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"} if etag else {}
+    if etag and if_none_match and etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=cache_headers)
+    body = await _search(resource_type, kwargs)
+    age = stale_age()
+    response = None
+    if RESPONSE_PASSTHROUGH:
+        response = passthrough_response(
+            body,
+            original_sort=kwargs.get("original_sort"),
+            next_cursor=encode_cursor if "cursorMark" in kwargs else None,
+        )
+    if response is None:
+        response = FastJSONResponse(update_solr_response(loads(body), kwargs))
+    if partial_results(body):
+        # Solr stopped at timeAllowed; responseHeader.partialResults says the same.
+        response.headers["X-Partial-Results"] = "true"
+        response.headers["Cache-Control"] = "no-store"
+    elif age is not None:
+        # A popular result served while it is refreshed; it may predate the current version.
+        response.headers["Age"] = str(int(age))
+        response.headers["Cache-Control"] = "no-cache"
+    else:
+        response.headers.update(cache_headers)
+    return response
+
+async def get_date_histogram(resource_type: str, solr_params: dict, path: Optional[str]) -> dict:
+    """
+    Counts for one level of the date facet hierarchy below 'path' (decade[::year[::month]]),
+    for the documents matching 'solr_params'.
+    """
+    try:
+        params, field = date_histogram_params(solr_params, path)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    result = await get_request(resource_type, **params)
+    return {
+        "path": path or "",
+        "field": field,
+        "numFound": result.get("response", {}).get("numFound", 0),
+        "buckets": facet_counts(result, field),
+    }
+
+async def get_facet_values(resource_type: str, solr_params: dict, field: str, offset: int, limit: int,
+                           prefix: Optional[str], sort: str) -> dict:
+    """One page of the values of a facet field for the documents matching 'solr_params'."""
+    core = implementation.get_core_name(resource_type)
+    if not core:
+        raise HTTPException(status_code=INTERNAL_ERROR_STATUS_CODE, detail="Invalid resource type")
+    params = facet_values_params(solr_params, field, offset, limit, prefix, sort)
+    values = facet_counts(loads(await _cached_search(core, params, facet_cache)), field)
+    return {
+        "field": field,
+        "offset": offset,
+        "limit": limit,
+        "prefix": prefix or "",
+        "order": sort,
+        "values": values[:limit],
+        "more": len(values) > limit,
+    }
+
+def facet_counts(result: dict, field: str) -> List[dict]:
+    """The value/count pairs Solr returned for a facet field, whichever json.nl style it used."""
+    counts = result.get("facet_counts", {}).get("facet_fields", {}).get(field, [])
+    pairs = counts.items() if isinstance(counts, dict) else zip(counts[::2], counts[1::2])
+    return [{"value": value, "count": count} for value, count in pairs]
+
+async def _search(resource_type: str, kwargs: dict) -> bytes:
     core = implementation.get_core_name(resource_type)
     if not core:
         raise HTTPException(status_code=INTERNAL_ERROR_STATUS_CODE, detail="Invalid resource type")
     params = kwargs.copy()
     params.pop("original_sort", None)
+    reuse_facets = params.pop(REUSE_FACETS, False)
+    body = await browse_index.search(core, params)
+    if body is not None:
+        return body
+    if reuse_facets:
+        # facets=same: when the first page of this search is cached, take its facet
+        # counts and let Solr skip faceting for this page.
+        facets = _first_page_facets(core, params)
+        if facets is not None:
+            body = await _cached_search(core, {**params, "facet": "false"}, popular=True)
+            body = append_member(body, "facet_counts", facets)
+            if body is not None:
+                return body
+    return await _cached_search(core, params, popular=True)
+
+def _cache_key(core: str, params: dict) -> tuple:
+    # With the index version in the key, results from before a commit are not served after it.
+    return canonical_key(core, "spell", params), index_versions.version(core)
+
+def _first_page_facets(core: str, params: dict) -> Optional[dict]:
+    first_page = {**params, "cursorMark": FIRST_CURSOR} if "cursorMark" in params else {**params, "start": 0}
+    body = result_cache.get(_cache_key(core, first_page))
+    if body is None:
+        return None
+    facets = trailing_member(body, FACET_COUNTS)
+    return facets if isinstance(facets, dict) else None
+
+async def _cached_search(core: str, params: dict, cache: ResultCache = result_cache, popular: bool = False) -> bytes:
+    """
+    Search through 'cache'. With 'popular', the search counts towards the warmer's
+    popular searches, and those are served stale rather than waited for.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Searching core=%s params=%s", core, params)
+
+    url = f"/solr/{core}/spell"
+    key = _cache_key(core, params)
+    if popular:
+        warmer.record(key[0], core, params)
+    with metrics.stage("cache", core):
+        body = cache.get(key)
+        if body is None and popular and cache.enabled:
+            body = warmer.stale(key[0])
+    if body is None:
+        started = time.perf_counter()
+        body = await search_flights.do(key, lambda: _fetch_and_cache(url, params, core, key, cache))
+        metrics.solr_stage(time.perf_counter() - started, solr_qtime(body))
+    return body
+
+async def warm_search(core: str, params: dict) -> bytes:
+    """Search 'core' through the result cache, for the warmer."""
+    return await _cached_search(core, params)
+
+async def fetch_search(resource_type: str, params: dict) -> bytes:
+    """Run a search without the result cache, returning Solr's raw response body."""
+    core = implementation.get_core_name(resource_type)
+    if not core:
+        raise HTTPException(status_code=INTERNAL_ERROR_STATUS_CODE, detail="Invalid resource type")
+    return await _fetch(f"/solr/{core}/spell", params, core)
+
+async def _fetch_and_cache(url: str, params: dict, core: str, key, cache: ResultCache) -> bytes:
+    generation = _core_generation.get(core, 0)
+    body = await _fetch(url, params, core)
+    if _core_generation.get(core, 0) == generation and not partial_results(body):
+        cache.put(key, core, body)
+        warmer.fetched(key[0], body)
+    return body
+
+async def _fetch(url: str, params: dict, core: str) -> bytes:
+    left = deadline.check()
+    if left is not None:
+        # Leave Solr time to send what it found before our own timeout fires.
+        params = {**params, "timeAllowed": max(1, int(left * 1000 * SOLR_TIME_ALLOWED_FRACTION))}
+    try:
+        response = await _send(
+            "search", core, "read", "GET",
+            url,
+            params=params,
+            headers={"Content-Type": "application/json; charset=UTF-8"},
+        )
+        response.raise_for_status()
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Solr did not answer in time")
+    except httpx.HTTPError as e:
+        response = getattr(e, "response", None)
+        detail = response.text if response is not None else str(e)
+        raise HTTPException(status_code=502, detail=detail.split(":")[-1])
+    return response.content
 
-    url = f"{SOLR_URL}/solr/{core}/spell"
-    async with httpx.AsyncClient(timeout=60) as client:
-        try:
-            response = await client.get(
-                url,
-                params=params,
-                headers={"Content-Type": "application/json; charset=UTF-8"},
-            )
-            response.raise_for_status()
-        except httpx.HTTPError as e:
-            detail = e.response.text if e.response is not None else str(e)
-            raise HTTPException(status_code=502, detail=detail.split(":")[-1])
-    result = response.json()
-    return update_solr_response(result, kwargs)
+async def _send(operation: str, core: str, kind: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """client.send, counting the call by operation, core and status for /metrics."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = await send(kind, method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        metrics.solr_call(operation, core, status, time.perf_counter() - started)
 
 async def put_item(resource_type: str, data, params):
     core = implementation.get_core_name(resource_type)
     if not core:
         raise HTTPException(status_code=INTERNAL_ERROR_STATUS_CODE, detail="Invalid resource type")
     path = "update/json/docs"
-    url = f"{SOLR_URL}/solr/{core}/{path}"
-    async with httpx.AsyncClient(timeout=60) as client:
-        try:
-            response = await client.post(
-                url,
-                params=params,
-                headers={"Content-Type": "application/json; charset=UTF-8"},
-                data=data,
-            )
-            response.raise_for_status()
-        except httpx.HTTPError as e:
-            raise e
+    url = f"/solr/{core}/{path}"
+    response = await _send(
+        "update", core, "write", "POST",
+        url,
+        params=params,
+        headers={"Content-Type": "application/json; charset=UTF-8"},
+        content=data,
+    )
+    response.raise_for_status()
+    invalidate_core(core)
     return response.status_code
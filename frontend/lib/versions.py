@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from frontend.defaults import *
+from frontend.lib.routing import router
+
+INDEX_VERSION_PATH = "/solr/{core}/replication"
+# Seconds after one of our own updates during which a core's version is treated as
+# unknown unless Solr reports a new one (the update should be committed by then).
+SETTLE_SECONDS = 60
+
+
+class IndexVersions:
+    """
+    Tracks the index version of each core on every read replica, by polling Solr's
+    replication handler every 'interval' seconds. A core's version is only known once
+    every replica has answered; until then it is None and responses for that core are
+    not given ETags. Replicas that stop answering keep their last known version. After
+    an update through this worker the version is also None until Solr reports a
+    change, so results from before the commit are not tagged as current.
+    """
+
+    def __init__(self, cores: List[str], interval: float):
+        self.cores = cores
+        self.interval = interval
+        self._versions: Dict[str, Dict[str, Tuple[int, int]]] = {core: {} for core in cores}
+        # core -> (version when it was updated, time after which that no longer matters)
+        self._updated: Dict[str, Tuple[Optional[Tuple], float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.polls = 0
+        self.errors = 0
+
+    def _current(self, core: str) -> Optional[Tuple]:
+        known = self._versions.get(core)
+        if not known or any(node.url not in known for node in router.read_nodes):
+            return None
+        return tuple(known[node.url] for node in router.read_nodes)
+
+    def version(self, core: str) -> Optional[Tuple]:
+        version = self._current(core)
+        if version is None:
+            return None
+        updated = self._updated.get(core)
+        if updated is not None:
+            if version == updated[0] and time.monotonic() < updated[1]:
+                return None
+            del self._updated[core]
+        return version
+
+    def updated(self, core: str) -> None:
+        """Note an update of 'core' sent by this worker."""
+        if core in self._versions:
+            # Several updates before a commit all wait for the version they started from.
+            previous = self._updated.get(core)
+            before = previous[0] if previous is not None else self._current(core)
+            self._updated[core] = (before, time.monotonic() + SETTLE_SECONDS)
+
+    async def start(self, client: httpx.AsyncClient) -> None:
+        if self.interval > 0 and self.cores:
+            await self.refresh(client)
+            self._task = asyncio.create_task(self._poll_forever(client))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self, client: httpx.AsyncClient) -> None:
+        await asyncio.gather(*(self._poll(client, node.url, core) for node in router.read_nodes for core in self.cores))
+
+    async def _poll(self, client: httpx.AsyncClient, url: str, core: str) -> None:
+        self.polls += 1
+        try:
+            response = await client.get(
+                f"{url}{INDEX_VERSION_PATH.format(core=core)}",
+                params={"command": "indexversion", "wt": "json"},
+                timeout=SOLR_CONNECT_TIMEOUT,
+            )
+            response.raise_for_status()
+            result = response.json()
+            self._versions[core][url] = (int(result["indexversion"]), int(result["generation"]))
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            logger.debug(f"Index version of {core} on {url} unavailable: {e}")
+
+    async def _poll_forever(self, client: httpx.AsyncClient) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh(client)
+            except Exception as e:
+                logger.error(f"Index version poll failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "cores": {core: self.version(core) for core in self.cores},
+            "polls": self.polls,
+            "errors": self.errors,
+        }
+
+
+index_versions = IndexVersions(list(CORE_MAP.values()), INDEX_VERSION_INTERVAL)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+import asyncio
+import contextvars
+import heapq
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from frontend.defaults import *
+from frontend.lib.cache import canonical_key
+from frontend.lib.versions import index_versions
+
+# Seconds between checks for updated cores, and between saves of the popular queries.
+TICK_SECONDS = 5
+SAVE_SECONDS = 60
+# Counts are halved at every save, so popularity follows recent traffic.
+DECAY = 0.5
+# Searches seen fewer times than this are never popular, however quiet the worker.
+MIN_COUNT = 2
+# Searches tracked per popular slot; the least counted half is dropped beyond that.
+TRACKED_PER_QUERY = 20
+# Least time between two replays of a core, so a bulk load does not replay every tick.
+REPLAY_GAP_SECONDS = 30
+# Without index version polling, a core is replayed this long after its last update.
+UPDATE_SETTLE_SECONDS = 15
+# Larger results are not kept for stale serving.
+MAX_BODY_BYTES = 512 * 1024
+
+# Runs a search for (core, params) through the result cache.
+Search = Callable[[str, dict], Awaitable[bytes]]
+
+# Age in seconds of the stale result served to the current request, if any.
+_served_stale: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("served_stale", default=None)
+
+
+def stale_age() -> Optional[float]:
+    """Seconds since the result served to this request was fetched, if it was served stale."""
+    return _served_stale.get()
+
+
+class Warmer:
+    """
+    Learns the 'top_n' most frequent searches of this worker, saves them to 'path' and
+    replays them through the result cache: at startup, and once an index update has
+    settled (the core reports a new index version). The last result of each popular
+    search is kept apart from the result cache, and when the cached copy has expired
+    or been invalidated it is served for up to 'stale_seconds' while a background
+    search refreshes it.
+    """
+
+    def __init__(self, top_n: int, path: Optional[str], stale_seconds: float, concurrency: int):
+        self.top_n = top_n
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self.concurrency = max(1, concurrency)
+        self.enabled = top_n > 0
+        self._counts: Dict[Hashable, float] = {}
+        self._queries: Dict[Hashable, Tuple[str, dict]] = {}
+        self._popular: Set[Hashable] = set()
+        # popular search -> (last result, time.monotonic() when it was fetched)
+        self._bodies: Dict[Hashable, Tuple[bytes, float]] = {}
+        self._replayed: Dict[str, Optional[Tuple]] = {}
+        self._replayed_at: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._search: Optional[Search] = None
+        self.replays = 0
+        self.replayed = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def record(self, key: Hashable, core: str, params: dict) -> None:
+        """Count a search; 'key' is its canonical_key."""
+        if not self.enabled:
+            return
+        count = self._counts.get(key)
+        if count is None:
+            if len(self._counts) >= self.top_n * TRACKED_PER_QUERY:
+                self._prune()
+            self._queries[key] = (core, params)
+            count = 0.0
+        self._counts[key] = count + 1
+
+    def fetched(self, key: Hashable, body: bytes) -> None:
+        """Keep a freshly fetched result if its search is popular."""
+        if key in self._popular and len(body) <= MAX_BODY_BYTES:
+            self._bodies[key] = (body, time.monotonic())
+
+    def stale(self, key: Hashable) -> Optional[bytes]:
+        """
+        The last result of a popular search, if it is recent enough, refreshing it in the
+        background. None if the caller has to search.
+        """
+        entry = self._bodies.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[1]
+        if age > self.stale_seconds:
+            return None
+        self.stale_served += 1
+        _served_stale.set(age)
+        self._revalidate(key)
+        return entry[0]
+
+    def updated(self, core: str) -> None:
+        """Note an update of 'core' sent by this worker."""
+        if self.enabled:
+            self._updated[core] = time.monotonic()
+
+    def _revalidate(self, key: Hashable) -> None:
+        if key in self._refreshing or self._search is None:
+            return
+        self._refreshing.add(key)
+        # A fresh context, so the refresh is not bound by the triggering request's deadline.
+        task = asyncio.create_task(self._refresh(key), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable) -> None:
+        try:
+            await self._search(*self._queries[key])
+            self.refreshes += 1
+        except Exception as e:
+            self.errors += 1
+            logger.debug(f"Refreshing a popular search failed: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def _prune(self) -> None:
+        keep = set(heapq.nlargest(len(self._counts) // 2, self._counts, key=self._counts.get)) | self._popular
+        self._counts = {key: count for key, count in self._counts.items() if key in keep}
+        self._queries = {key: query for key, query in self._queries.items() if key in keep}
+
+    def _rank(self) -> None:
+        ranked = heapq.nlargest(self.top_n, self._counts, key=self._counts.get)
+        self._popular = {key for key in ranked if self._counts[key] >= MIN_COUNT}
+        for key in [key for key in self._bodies if key not in self._popular]:
+            del self._bodies[key]
+
+    def _top(self) -> List[Hashable]:
+        return sorted(self._popular, key=self._counts.get, reverse=True)
+
+    async def replay(self, core: Optional[str] = None) -> None:
+        """Run the popular searches (of 'core', or of every core) through the result cache."""
+        cores = [core] if core is not None else list(CORE_MAP.values())
+        for name in cores:
+            self._replayed[name] = index_versions.version(name)
+            self._replayed_at[name] = time.monotonic()
+            self._updated.pop(name, None)
+        queries = [self._queries[key] for key in self._top() if self._queries[key][0] in cores]
+        if not queries or self._search is None:
+            return
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(query: Tuple[str, dict]) -> None:
+            async with semaphore:
+                try:
+                    await self._search(*query)
+                    self.replayed += 1
+                except Exception as e:
+                    self.errors += 1
+                    logger.debug(f"Replaying a popular search on {query[0]} failed: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(query) for query in queries))
+        self.replays += 1
+        logger.info(f"Replayed {len(queries)} popular searches for {', '.join(cores)} "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    def _due(self) -> Iterator[str]:
+        now = time.monotonic()
+        for core in {self._queries[key][0] for key in self._popular}:
+            if now - self._replayed_at.get(core, 0.0) < REPLAY_GAP_SECONDS:
+                continue
+            if index_versions.interval > 0:
+                version = index_versions.version(core)
+                if version is not None and version != self._replayed.get(core):
+                    yield core
+            elif core in self._updated and now - self._updated[core] >= UPDATE_SETTLE_SECONDS:
+                yield core
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries:
+                core, params, count = entry["core"], entry["params"], float(entry["count"])
+                if core in CORE_MAP.values() and isinstance(params, dict):
+                    # The key utils._cache_key uses, less the index version.
+                    key = canonical_key(core, "spell", params)
+                    self._queries[key] = (core, params)
+                    self._counts[key] = max(count, MIN_COUNT)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring popular searches in {self.path}: {e}")
+        self._rank()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        entries = [{"core": self._queries[key][0], "params": self._queries[key][1], "count": round(self._counts[key], 2)}
+                   for key in self._top()]
+        temporary = f"{self.path}.{os.getpid()}"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            # Workers share the file; the last one to save wins.
+            os.replace(temporary, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save popular searches to {self.path}: {e}")
+
+    async def start(self, search: Search) -> None:
+        if self.enabled:
+            self._search = search
+            self.load()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.save()
+        for task in list(self._tasks):
+            task.cancel()
+        self._search = None
+
+    async def _run(self) -> None:
+        await self.replay()
+        saved = time.monotonic()
+        while True:
+            await asyncio.sleep(TICK_SECONDS)
+            try:
+                self._rank()
+                for core in list(self._due()):
+                    await self.replay(core)
+                if time.monotonic() - saved >= SAVE_SECONDS:
+                    self.save()
+                    self._counts = {key: count * DECAY for key, count in self._counts.items()}
+                    saved = time.monotonic()
+            except Exception as e:
+                logger.error(f"Cache warmer failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tracked": len(self._counts),
+            "popular": len(self._popular),
+            "stale_results": len(self._bodies),
+            "stale_bytes": sum(len(body) for body, _ in self._bodies.values()),
+            "replays": self.replays,
+            "replayed": self.replayed,
+            "stale_served": self.stale_served,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "file": self.path,
+        }
+
+
+warmer = Warmer(WARM_QUERIES, WARM_FILE, WARM_STALE_SECONDS, WARM_CONCURRENCY)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from frontend.lib import utils
+from frontend.defaults import *
+
+# Queued operation: ("put", document_json, params) or ("delete", None, None)
+Operation = Tuple[str, Optional[str], Optional[dict]]
+
+# Outcomes of sending operations to Solr.
+SENT, RETRY, REJECTED = "sent", "retry", "rejected"
+MAX_RETRY_DELAY = 300.0
+
+
+class Spool:
+    """
+    Append-only journal of queued operations, one JSON object per line. Each worker
+    holds an exclusive lock on its own file; at startup, files whose lock is free
+    belong to workers that have exited and are replayed by the new worker.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"spool-{os.getpid()}.jsonl")
+        self._file = open(self.path, "a+", encoding="utf-8")
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def claim_orphans(self) -> List[dict]:
+        entries = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "spool-*.jsonl"))):
+            if path == self.path:
+                continue
+            try:
+                with open(path, "r+", encoding="utf-8") as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # still owned by a live worker
+                    entries.extend(json.loads(line) for line in f if line.strip())
+                    os.unlink(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not replay write-behind spool {path}: {e}")
+        return entries
+
+    def append(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def rewrite(self, entries: List[dict]) -> None:
+        self._file.seek(0)
+        self._file.truncate()
+        for entry in entries:
+            self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def reject(self, entries: List[dict]) -> None:
+        # Operations Solr refused are kept next to the spool for inspection, not replayed.
+        with open(os.path.join(self.directory, "rejected.jsonl"), "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def close(self, remove: bool = False) -> None:
+        if remove:
+            os.unlink(self.path)
+        self._file.close()
+
+
+class WriteBehind:
+    """
+    Optional write-behind mode for PUT /item and DELETE /item/{file_id}. Operations are
+    acknowledged immediately and queued per resource type. Repeated operations on the
+    same fileID replace each other (last writer wins), and a background task flushes
+    the queues in batches once 'batch_size' operations are waiting or 'interval'
+    seconds have passed. A batch Solr rejects with a 4xx is resent one operation at a
+    time and the operations it still rejects are dropped; after a 5xx or a transport
+    error the batch is requeued and retried with exponential backoff. Queues are per
+    worker, so operations on the same fileID are only ordered within one worker.
+    """
+
+    def __init__(self, enabled: bool, batch_size: int, interval: float, spool_dir: Optional[str]):
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.spool_dir = spool_dir
+        self._queues: Dict[str, "OrderedDict[str, Operation]"] = {}
+        self._spool: Optional[Spool] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._oldest: Optional[float] = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.rejected = 0
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        if self.spool_dir:
+            self._spool = Spool(self.spool_dir)
+            orphans = self._spool.claim_orphans()
+            for entry in orphans:
+                self._enqueue(entry["resource"], entry["fileID"], (entry["op"], entry.get("data"), entry.get("params")))
+            if orphans:
+                logger.info(f"Replayed {len(orphans)} write-behind operations from {self.spool_dir}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        if self._spool:
+            self._spool.close(remove=not self.depth())
+            self._spool = None
+
+    def put(self, resource_type: str, file_id: Optional[str], data: bytes, params: dict) -> None:
+        self._enqueue(resource_type, file_id, ("put", data.decode("utf-8"), params))
+
+    def delete(self, resource_type: str, file_id: str) -> None:
+        self._enqueue(resource_type, file_id, ("delete", None, None))
+
+    def _enqueue(self, resource_type: str, file_id: Optional[str], op: Operation) -> None:
+        queue = self._queues.setdefault(resource_type, OrderedDict())
+        key = file_id if file_id is not None else f"\0{self.enqueued}"
+        if key in queue:
+            self.coalesced += 1
+            del queue[key]
+        queue[key] = op
+        self.enqueued += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._spool:
+            self._spool.append({"resource": resource_type, "fileID": file_id, "op": op[0], "data": op[1], "params": op[2]})
+        if self._wakeup and self.depth() >= self.batch_size:
+            self._wakeup.set()
+
+    def depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def flush(self) -> None:
+        if not self.depth():
+            return
+        async with self._lock:
+            started = time.monotonic()
+            retry = False
+            for resource_type, queue in list(self._queues.items()):
+                while queue:
+                    batch = [queue.popitem(last=False) for _ in range(min(self.batch_size, len(queue)))]
+                    failed = await self._flush_batch(resource_type, batch)
+                    if failed:
+                        self.failures += 1
+                        retry = True
+                        # Requeue unless a newer operation for the same fileID has arrived.
+                        for key, op in reversed(failed):
+                            if key not in queue:
+                                queue[key] = op
+                                queue.move_to_end(key, last=False)
+                        break
+            # Back off while Solr is failing; the next successful flush resets the delay.
+            self._retry_delay = min(max(self._retry_delay * 2, self.interval, 1.0), MAX_RETRY_DELAY) if retry else 0.0
+            self._retry_at = time.monotonic() + self._retry_delay if retry else 0.0
+            elapsed = time.monotonic() - started
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            self._oldest = time.monotonic() if self.depth() else None
+            if self._spool:
+                self._spool.rewrite([
+                    self._entry(resource_type, key, op)
+                    for resource_type, queue in self._queues.items() for key, op in queue.items()
+                ])
+
+    async def _flush_batch(self, resource_type: str, batch: List[Tuple[str, Operation]]) -> List[Tuple[str, Operation]]:
+        """Send a batch and return the operations to retry later."""
+        deletes = [(key, op) for key, op in batch if op[0] == "delete"]
+        puts: Dict[str, List[Tuple[str, Operation]]] = {}
+        for key, op in batch:
+            if op[0] == "put":
+                puts.setdefault(json.dumps(op[2], sort_keys=True), []).append((key, op))
+
+        failed, rejected = [], []
+        for ops, send in [(deletes, self._delete)] + [(ops, self._put) for ops in puts.values()]:
+            if not ops:
+                continue
+            status = await send(resource_type, ops)
+            if status == RETRY:
+                failed.extend(ops)
+            elif status == REJECTED and len(ops) > 1:
+                # Find the operations Solr refuses, so they do not hold up the others.
+                for key, op in ops:
+                    status = await send(resource_type, [(key, op)])
+                    if status == RETRY:
+                        failed.append((key, op))
+                    elif status == REJECTED:
+                        rejected.append((key, op))
+            elif status == REJECTED:
+                rejected.extend(ops)
+        if rejected:
+            self.rejected += len(rejected)
+            logger.error(f"Write-behind dropped {len(rejected)} {resource_type} operation(s) rejected by Solr: "
+                         f"{', '.join(key for key, _ in rejected[:10] if not key.startswith(chr(0)))}")
+            if self._spool:
+                self._spool.reject([self._entry(resource_type, key, op) for key, op in rejected])
+        return failed
+
+    async def _delete(self, resource_type: str, ops: List[Tuple[str, Operation]]) -> str:
+        try:
+            status_code = await utils.delete_file_ids(resource_type, [key for key, _ in ops])
+        except (httpx.HTTPError, HTTPException) as e:
+            logger.error(f"Write-behind delete of {len(ops)} {resource_type}(s) failed: {e}")
+            return RETRY
+        if status_code < 300:
+            self.flushed += len(ops)
+            return SENT
+        logger.error(f"Write-behind delete of {len(ops)} {resource_type}(s) failed with status {status_code}")
+        return REJECTED if status_code < 500 else RETRY
+
+    async def _put(self, resource_type: str, ops: List[Tuple[str, Operation]]) -> str:
+        body = ("[" + ",".join(op[1] for _, op in ops) + "]").encode("utf-8")
+        try:
+            await utils.put_item(resource_type, body, ops[0][1][2])
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Write-behind update of {len(ops)} {resource_type}(s) failed: {e}")
+            return REJECTED if e.response.status_code < 500 else RETRY
+        except (httpx.HTTPError, HTTPException) as e:
+            # Transport errors, load shedding (503) and deadlines (504): try again later.
+            logger.error(f"Write-behind update of {len(ops)} {resource_type}(s) failed: {e}")
+            return RETRY
+        self.flushed += len(ops)
+        return SENT
+
+    @staticmethod
+    def _entry(resource_type: str, key: str, op: Operation) -> dict:
+        return {"resource": resource_type, "fileID": None if key.startswith("\0") else key,
+                "op": op[0], "data": op[1], "params": op[2]}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "depth": {resource_type: len(q) for resource_type, q in self._queues.items()},
+            "oldest_seconds": round(time.monotonic() - self._oldest, 3) if self._oldest else 0.0,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "retry_in_seconds": round(max(0.0, self._retry_at - time.monotonic()), 3),
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "avg_flush_seconds": round(self.total_flush_seconds / self.flushes, 4) if self.flushes else 0.0,
+            "spool": self._spool.path if self._spool else None,
+        }
+
+
+write_behind = WriteBehind(WRITE_BEHIND, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_SPOOL_DIR)
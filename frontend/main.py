@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 import json
-from typing import Optional, Annotated
+from contextlib import asynccontextmanager
+from typing import Any, Optional, Annotated, List
 
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, Query, Request, Body, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from frontend.lib.utils import *
+from frontend.lib import metrics
+from frontend.lib.deadline import DeadlineMiddleware, route_deadline
+from frontend.lib.batch import search_batch
+from frontend.lib.browse import browse_index
+from frontend.lib.client import ssl_context
+from frontend.lib.compression import CompressionMiddleware
+from frontend.lib.federated import search_resources
+from frontend.lib.suggest import suggester
+from frontend.lib.warmer import warmer
+from frontend.lib.write_behind import write_behind
 
 origins = [
     "http://localhost:5173",
@@ -13,36 +25,239 @@ origins = [
     "https://editorial.epsilon.ac.uk"
 ]
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Solr client per worker, shared by all routers (utils.get_client).
+    await start_clients()
+    await metrics.start()
+    await write_behind.start()
+    await suggester.start()
+    await warmer.start(warm_search)
+    await browse_index.start(fetch_search)
+    yield
+    await browse_index.stop()
+    await warmer.stop()
+    await suggester.stop()
+    await write_behind.stop()
+    await metrics.stop()
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Partial-Results", "ETag", "Age"],
 )
+app.add_middleware(DeadlineMiddleware)
+if COMPRESS_MIN_SIZE > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_SIZE, gzip_level=GZIP_LEVEL,
+                       brotli_quality=BROTLI_QUALITY)
+app.add_middleware(metrics.MetricsMiddleware, server_timing=SERVER_TIMING)
 
 app.include_router(implementation.router)
 
-@app.get("/items")
+def prepare() -> None:
+    """
+    Build what would otherwise be built on first use, or in every worker: the
+    middleware stack, the OpenAPI schema with the JSON schemas of the query models, and
+    the TLS context of the Solr clients. gunicorn.conf.py calls this in the master when
+    preloading, so every worker inherits the result.
+    """
+    ssl_context()
+    app.openapi()
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+
+ITEM_DOCUMENT_TYPES = ["letter", "bibliography", "people", "repository", "documentation", "site"]
+ITEM_UPDATE_PARAMS = {"f": ["$FQN:/**", "/*"]}
+
+def validate_item_document(json_dict: dict) -> Optional[str]:
+    if json_dict.get("facet-document-type") not in ITEM_DOCUMENT_TYPES:
+        return f"Invalid item JSON for fileID: {json_dict.get('fileID')}"
+    return None
+
+@app.get("/items", dependencies=[Depends(route_deadline(SEARCH_DEADLINE))])
 async def get_items(
+        request: Request,
         params: Annotated[implementation.ItemsQueryParams, Query()]
 ):
+    metrics.mark("validate")
+    solr_params = params.get_solr_params()
+    metrics.mark("translate")
+    return await get_response("items", request.headers.get("if-none-match"), **solr_params)
+
+@app.get("/items/dates", dependencies=[Depends(route_deadline(SEARCH_DEADLINE))])
+async def get_item_decades(
+        params: Annotated[implementation.ItemsQueryParams, Query()]
+):
+    return await get_item_dates(params, None)
+
+@app.get("/items/dates/{path}", dependencies=[Depends(route_deadline(SEARCH_DEADLINE))])
+async def get_item_dates(
+        params: Annotated[implementation.ItemsQueryParams, Query()],
+        path: Optional[str],
+):
+    # One level of the date facet hierarchy, e.g. /items/dates/1860s::1868 for its months.
+    metrics.mark("validate")
+    solr_params = params.get_solr_params()
+    metrics.mark("translate")
+    return await get_date_histogram("items", solr_params, path)
+
+@app.post("/items/batch", dependencies=[Depends(route_deadline(SEARCH_DEADLINE))])
+async def get_items_batch(queries: Annotated[List[Any], Body()]):
+    # Body is a JSON array of /items parameter objects; {"count": true} asks for numFound only.
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=422, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    metrics.mark("validate")
+    return await search_batch("items", queries, implementation.ItemsQueryParams, BATCH_CONCURRENCY)
+
+@app.get("/items/facets/{name}", dependencies=[Depends(route_deadline(SEARCH_DEADLINE))])
+async def get_item_facet_values(
+        name: str,
+        params: Annotated[implementation.FacetValuesParams, Query()],
+):
+    # Pages through the values of one facet, e.g. /items/facets/correspondent?prefix=H&offset=20
+    spec = implementation.ITEMS_FACETS.get(name)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown facet: {name}")
+    metrics.mark("validate")
     solr_params = params.get_solr_params()
-    return await get_request("items", **solr_params)
+    metrics.mark("translate")
+    return await get_facet_values("items", solr_params, spec["field"], params.offset, params.limit,
+                                  params.prefix, params.order)
+
+@app.get("/items/suggest/{name}")
+async def get_item_suggestions(
+        name: str,
+        q: Annotated[str, Query(max_length=100)] = "",
+        limit: Annotated[int, Query(ge=1, le=50)] = 10,
+):
+    # Served from the in-memory index; Solr is not queried.
+    if name not in suggester.indexes:
+        raise HTTPException(status_code=404, detail=f"No suggestions for {name}")
+    return {"name": name, "q": q, "suggestions": suggester.suggest(name, q, limit)}
+
+@app.get("/search", dependencies=[Depends(route_deadline(FEDERATED_DEADLINE))])
+async def search_all(request: Request):
+    # One query for several resources at once, e.g. /search?keyword=orchids&resources=items,pages
+    values = {}
+    for name, value in request.query_params.multi_items():
+        values.setdefault(name, []).append(value)
+    names = [name.strip() for value in values.pop("resources", []) for name in value.split(",") if name.strip()]
+    names = names or list(SEARCH_MODELS)
+    query = {name: value[0] if len(value) == 1 else value for name, value in values.items()}
+    unknown = [name for name in names if name not in SEARCH_MODELS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown resources: {', '.join(unknown)}")
+    metrics.mark("validate")
+    return await search_resources({name: SEARCH_MODELS[name] for name in names}, query)
+
+@app.get("/items/export")
+async def export_items(
+        params: Annotated[implementation.ItemsQueryParams, Query()]
+):
+    # Streams every matching item as NDJSON, walking Solr cursors page by page.
+    from frontend.lib.export import export_documents  # rarely used, so not imported at startup
+    metrics.mark("validate")
+    solr_params = params.get_solr_params()
+    metrics.mark("translate")
+    return StreamingResponse(
+        export_documents("items", solr_params, EXPORT_FIELDS, EXPORT_BATCH_SIZE),
+        media_type="application/x-ndjson",
+    )
 
 @app.put("/item")
 async def update_item(request: Request):
     data = await request.body()
     json_dict = json.loads(data)
-    if json_dict.get("facet-document-type") in ["letter", "bibliography", "people", "repository", "documentation", "site"]:
+    error = validate_item_document(json_dict)
+    if not error and write_behind.enabled:
+        logger.info(f"Queueing {json_dict.get('fileID')}")
+        write_behind.put("item", json_dict.get("fileID"), data, ITEM_UPDATE_PARAMS)
+        suggester.document_indexed(json_dict)
+        status_code = 202
+    elif not error:
         logger.info(f"Indexing {json_dict.get('fileID')}")
-        status_code = await put_item("item", data, {"f": ["$FQN:/**", "/*"]})
+        status_code = await put_item("item", data, ITEM_UPDATE_PARAMS)
+        suggester.document_indexed(json_dict)
     else:
-        logger.error(f"Invalid item JSON for fileID: {json_dict.get('fileID')}")
+        logger.error(error)
         status_code = INTERNAL_ERROR_STATUS_CODE
     return status_code
 
+@app.post("/item/bulk")
+async def bulk_update_items(
+        request: Request,
+        batch_size: Annotated[int, Query(alias="batchSize", ge=1, le=10000)] = BULK_BATCH_SIZE,
+        concurrency: Annotated[int, Query(ge=1, le=16)] = BULK_CONCURRENCY,
+        commit_within: Annotated[int, Query(alias="commitWithin", ge=0)] = BULK_COMMIT_WITHIN,
+):
+    # Body is a JSON array or NDJSON stream of item documents.
+    from frontend.lib.bulk import bulk_index  # rarely used, so not imported at startup
+    summary = await bulk_index("item", request.stream(), ITEM_UPDATE_PARAMS, validate_item_document,
+                               batch_size, concurrency, commit_within or None)
+    logger.info(f"Bulk indexed {summary['succeeded']}/{summary['documents']} items in {summary['seconds']}s")
+    return summary
+
 @app.delete("/item/{file_id}")
 async def delete_item(file_id: str):
-    return await delete_resource("item", file_id)
+    if write_behind.enabled:
+        write_behind.delete("item", file_id)
+        suggester.document_deleted(file_id)
+        return 202
+    status_code = await delete_resource("item", file_id)
+    if 200 <= status_code < 300:
+        suggester.document_deleted(file_id)
+    return status_code
+
+@app.post("/item/bulk-delete")
+async def bulk_delete_items(
+        ids: Annotated[List[str], Body()],
+        batch_size: Annotated[int, Query(alias="batchSize", ge=1, le=10000)] = BULK_BATCH_SIZE,
+        commit_within: Annotated[int, Query(alias="commitWithin", ge=0)] = BULK_COMMIT_WITHIN,
+):
+    # Body is a JSON array of Solr document ids.
+    from frontend.lib.bulk import bulk_delete
+    summary = await bulk_delete("item", ids, batch_size, commit_within or None)
+    logger.info(f"Bulk deleted {summary['succeeded']}/{summary['documents']} items in {summary['seconds']}s")
+    return summary
+
+@app.get("/stats/pool")
+async def get_pool_stats():
+    return pool_stats()
+
+@app.get("/stats/solr")
+async def get_solr_stats():
+    return {**solr_router.stats(), "hedging": hedger.stats(), "index_versions": index_versions.stats()}
+
+@app.get("/stats/limits")
+async def get_limit_stats():
+    return limiter_stats()
+
+@app.get("/stats/cache")
+async def get_cache_stats():
+    return {**result_cache.stats(), "facets": facet_cache.stats(), "single_flight": search_flights.stats()}
+
+@app.get("/stats/suggest")
+async def get_suggest_stats():
+    return suggester.stats()
+
+@app.get("/stats/warmer")
+async def get_warmer_stats():
+    return warmer.stats()
+
+@app.get("/stats/browse")
+async def get_browse_stats():
+    return browse_index.stats()
+
+@app.get("/stats/queue")
+async def get_queue_stats():
+    return write_behind.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format, summed over all workers.
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
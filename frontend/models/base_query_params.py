@@ -1,22 +1,43 @@
 #!/usr/bin/env python3
-import re
-from typing import List, Optional, Union, Dict, Any, Tuple
+from typing import List, Optional, Union, Dict, Any, Tuple, ClassVar
 
 from pydantic import BaseModel, Field, ConfigDict, field_validator
 
-from frontend.lib import utils
+from frontend.lib.translation import (
+    QueryTranslator, FACET_FIELD, cursor_mark, decode_cursor, facet_field, field_query, page_start, skip,
+)
 
 #try:
 #    from frontend.custom.implementation import DEFAULT_ROWS
 #except ImportError:
 DEFAULT_ROWS = 20
 
+TRANSLATOR = QueryTranslator(
+    handlers={"page": page_start(DEFAULT_ROWS), "rows": skip, "sort": skip, "cursor": cursor_mark},
+    patterns=[(FACET_FIELD, facet_field)],
+    default=field_query,
+)
+
+def is_empty(val: Any) -> bool:
+    if isinstance(val, str):
+        return val.strip() == ""
+    if isinstance(val, list):
+        if not val:
+            return True
+        return all(isinstance(item, str) and item.strip() == "" for item in val)
+    return False
+
 class CoreQueryParams(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
+    # Models with their own parameter mappings provide their own translator.
+    translator: ClassVar[QueryTranslator] = TRANSLATOR
+
     keyword: Optional[Union[str, List[str]]] = Field(default=None)
     sort: Optional[Union[str, List[str]]] = None
     rows: Optional[Union[int, List[int]]] = Field(default=DEFAULT_ROWS)
     page: Optional[Union[int, List[int]]] = 1
+    # Opaque paging token: '*' for the first page, then the previous response's nextCursor.
+    cursor: Optional[str] = None
 
     @field_validator("keyword", mode="before")
     def join_keywords(cls, value):
@@ -38,6 +59,11 @@ class CoreQueryParams(BaseModel):
     def take_first_page(cls, value):
         return value[0] if isinstance(value, list) and value else value
 
+    @field_validator("cursor", mode="before")
+    def decode_cursor_token(cls, value):
+        value = value[-1] if isinstance(value, list) and value else value
+        return decode_cursor(value) if value else None
+
     def is_facet(self, key: str, value: Any) -> bool:
         return key.startswith("facet-")
 
@@ -48,15 +74,6 @@ class CoreQueryParams(BaseModel):
         params: Dict[str, Any] = {}
         facets: Dict[str, Any] = {}
 
-        def is_empty(val: Any) -> bool:
-            if isinstance(val, str):
-                return val.strip() == ""
-            if isinstance(val, list):
-                if not val:
-                    return True
-                return all(isinstance(item, str) and item.strip() == "" for item in val)
-            return False
-
         for key, value in data.items():
             if is_empty(value):
                 continue
@@ -70,29 +87,4 @@ class CoreQueryParams(BaseModel):
     def get_solr_params(self) -> dict:
         query_params2, facet_params2 = self.separate_parameters()
         url_params = {**query_params2, **facet_params2}
-
-        solr_params = {}
-
-        q = []
-        fq = []
-
-        for name, value in url_params.items():
-            if value:
-                if re.match(r"^facet-.+?$", name):
-                    solr_name = re.sub(r"^f[0-9]+-(.+?)$", r"facet-\1", name)
-                    for x in utils.listify(value):
-                        x_clean = re.sub(r'^"(.+?)"$', r'\1', x)
-                        fq.append(f'{solr_name}:"{x_clean}"')
-                elif name == "page":
-                    page_val = int(value)
-                    solr_params["start"] = (page_val - 1) * DEFAULT_ROWS
-                elif name != "rows" and name != "sort":
-                    q.append(f'{name}:({utils.stringify(value)})')
-
-        final_q = " ".join(q)
-        if final_q in ["['*']", "['']"]:
-            final_q = "*"
-        solr_params["q"] = final_q if final_q not in ["['*']", "['']"] else "*"
-        solr_params["fq"] = fq
-
-        return solr_params
+        return self.translator.translate(url_params)
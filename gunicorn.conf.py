@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Gunicorn settings. gunicorn reads ./gunicorn.conf.py from its working directory, so
+this applies to the Dockerfile's command; flags on the command line still win.
+
+With PRELOAD (the default), the master imports the app once and the workers fork
+from it. They share the memory of the imported modules instead of each importing
+FastAPI, pydantic and the routers, and start without paying for the imports. Code
+changes then need a restart of the master; a HUP only replaces the workers.
+"""
+import gc
+import os
+import tempfile
+
+preload_app = os.getenv("PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Workers share their metrics through METRICS_DIR, and frontend.defaults leaves it
+# unset. Choose a directory per master here, so that every worker of this master
+# reports the same totals and a restart does not pick up the last run's counters.
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"epsilon-search-metrics-{os.getpid()}"))
+
+
+def when_ready(server):
+    # Called in the master before the first workers are forked.
+    if not server.cfg.preload_app:
+        return
+    from frontend.main import prepare
+    prepare()
+    # Keep the garbage collector away from everything built so far. Otherwise its
+    # bookkeeping writes to those objects would copy the shared pages into every worker.
+    gc.collect()
+    gc.freeze()